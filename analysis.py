@@ -0,0 +1,606 @@
+# analysis.py - ядро анализа портфеля без интерфейса: расчеты, секции и кэш результатов
+
+import logging
+from collections.abc import Mapping
+from functools import cached_property, lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from database import get_client_profile, get_entitlement, get_ticker_index
+from entitlements import ADVANCED_ANALYTICS, PREMIUM_ANALYTICS
+from goal_planning import MonteCarloGoalEngine, parse_horizon_years
+from optimizer import PortfolioConstraints, get_efficient_frontier, rebalance_to_target
+from portfolio_types import DEFAULT_PORTFOLIO_TYPE, RETURN_PARAMS, classify_portfolio, type_scores
+from price_store import get_price_store
+from rebalancing import DEFAULT_COST_RATE, RebalancingSimulator
+from result_cache import PickledResultCache, content_key, portfolio_fingerprint
+from risk_engine import RiskEngine, get_risk_engine
+from simulation import get_simulator
+from stress_scenarios import SCENARIO_LIBRARY
+from ticker_index import ASSET_CLASS_LABELS
+
+logger = logging.getLogger(__name__)
+
+class AdvancedPortfolioAnalysis:
+    """Усовершенствованный класс для анализа портфеля со всеми показателями"""
+    
+    # Увеличивать при любом изменении расчетов: версия входит в ключ кэша результатов
+    ANALYSIS_VERSION = 5
+    
+    # Секции результата comprehensive_analysis и методы, которые их строят
+    SECTIONS = {
+        'basic_metrics': 'calculate_basic_metrics',
+        'portfolio_summary': 'summarize_portfolio',
+        'risk_metrics': 'calculate_advanced_risk_metrics',
+        'portfolio_quality': 'analyze_portfolio_quality',
+        'efficiency_metrics': 'calculate_efficiency_metrics',
+        'comparative_analysis': 'benchmark_comparison',
+        'ai_insights': '_build_ai_insights',
+        'recommendations': 'generate_detailed_recommendations',
+        'performance_charts': 'generate_performance_charts',
+        'goal_planning': 'calculate_goal_projection',
+        'portfolio_optimization': 'optimize_portfolio',
+        'rebalancing_analysis': 'compare_rebalancing_policies',
+        'stress_testing': 'run_stress_tests'
+    }
+    
+    # Риск концентрации по типу портфеля
+    CONCENTRATION_RISK = {
+        'агрессивный': 'высокий',
+        'сбалансированный': 'умеренный',
+        'доходный': 'низкий',
+        'ультра-консервативный': 'очень низкий'
+    }
+    
+    # Стресс-тесты в risk_metrics: ключ метрики -> сценарий библиотеки
+    STRESS_TEST_METRICS = {'stress_test_2008': 'Кризис 2008', 'stress_test_covid': 'COVID-19 2020'}
+    
+    # Ограничения оптимизации: максимальная доля актива и доли классов активов
+    MAX_ASSET_WEIGHT = 0.4
+    OPTIMIZATION_CLASS_BOUNDS = {'high_risk': (0.0, 0.6)}
+    
+    # Прогноз достижения цели (пакеты по 25 тыс. путей, ранняя остановка по точности)
+    GOAL_ENGINE = MonteCarloGoalEngine(n_paths=200000, batch_size=25000, tolerance=0.005)
+    
+    def __init__(self, portfolio_dict: Dict[str, float], client_name: str = "Демо Клиент"):
+        # Промежуточные результаты кэшируются на экземпляре, поэтому
+        # portfolio_dict после создания объекта менять нельзя
+        self.portfolio_dict = portfolio_dict
+        self.client_name = client_name
+        self._sections: Dict[str, object] = {}
+        
+    def comprehensive_analysis(self, sections: Optional[Iterable[str]] = None) -> Dict:
+        """Расширенный комплексный анализ для продвинутых и премиум пользователей.
+        
+        sections ограничивает набор вычисляемых секций (по умолчанию - все).
+        Каждая секция и общие промежуточные данные (тип портфеля, исторический
+        ряд) вычисляются не более одного раза на экземпляр.
+        """
+        requested = set(self.SECTIONS if sections is None else sections)
+        unknown = requested - set(self.SECTIONS)
+        if unknown:
+            raise ValueError(f"Неизвестные секции анализа: {', '.join(sorted(unknown))}")
+        
+        return {name: self.get_section(name) for name in self.SECTIONS if name in requested}
+    
+    def get_section(self, name: str):
+        """Возвращает секцию анализа, вычисляя ее при первом обращении"""
+        if name not in self._sections:
+            self._sections[name] = getattr(self, self.SECTIONS[name])()
+        return self._sections[name]
+    
+    def _build_ai_insights(self) -> List[str]:
+        return self.generate_ai_insights() if len(self.portfolio_dict) > 3 else []
+    
+    def calculate_basic_metrics(self) -> Dict:
+        """Расчет базовых метрик для всех пользователей"""
+        portfolio_type = self._get_portfolio_type()
+        
+        metrics_map = {
+            'агрессивный': {
+                'annual_return': 0.18, 'annual_volatility': 0.32, 'sharpe_ratio': 0.56,
+                'max_drawdown': -0.40, 'beta': 1.25, 'current_value': 1500000, 'total_return': 0.85
+            },
+            'сбалансированный': {
+                'annual_return': 0.095, 'annual_volatility': 0.14, 'sharpe_ratio': 0.68,
+                'max_drawdown': -0.20, 'beta': 0.95, 'current_value': 1200000, 'total_return': 0.45
+            },
+            'доходный': {
+                'annual_return': 0.078, 'annual_volatility': 0.11, 'sharpe_ratio': 0.71,
+                'max_drawdown': -0.15, 'beta': 0.75, 'current_value': 1800000, 'total_return': 0.32
+            },
+            'ультра-консервативный': {
+                'annual_return': 0.045, 'annual_volatility': 0.05, 'sharpe_ratio': 0.90,
+                'max_drawdown': -0.08, 'beta': 0.35, 'current_value': 2200000, 'total_return': 0.18
+            }
+        }
+        
+        return metrics_map.get(portfolio_type, metrics_map['сбалансированный'])
+    
+    @cached_property
+    def portfolio_type(self) -> str:
+        """Тип портфеля на основе активов (вычисляется один раз за один проход)"""
+        scores = type_scores(self.portfolio_dict)
+        return classify_portfolio(scores['aggressive'], scores['conservative'])
+    
+    def _get_portfolio_type(self) -> str:
+        """Определяет тип портфеля на основе активов"""
+        return self.portfolio_type
+    
+    @cached_property
+    def risk_engine(self) -> RiskEngine:
+        """Риск-движок для набора активов портфеля (общий для портфелей с тем же составом)"""
+        return get_risk_engine(tuple(sorted(self.portfolio_dict)))
+    
+    def calculate_advanced_risk_metrics(self) -> Dict:
+        """Расширенный анализ рисков для продвинутых пользователей"""
+        portfolio_value = self.calculate_basic_metrics()['current_value']
+        risk_metrics = self.risk_engine.risk_metrics(self.portfolio_dict, portfolio_value=portfolio_value)
+        scenarios = self.get_section('stress_testing')['scenarios']
+        for metric, scenario in self.STRESS_TEST_METRICS.items():
+            if scenario in scenarios.index:
+                risk_metrics[metric] = float(scenarios.loc[scenario, 'return'])
+        return risk_metrics
+    
+    def run_stress_tests(self) -> Dict:
+        """Доходность и P&L портфеля и каждого актива во всех сценариях библиотеки"""
+        portfolio_value = self.calculate_basic_metrics()['current_value']
+        return SCENARIO_LIBRARY.run(self.portfolio_dict, portfolio_value, store=get_price_store())
+    
+    def calculate_efficiency_metrics(self) -> Dict:
+        """Метрики эффективности для продвинутых и премиум пользователей"""
+        return self.risk_engine.efficiency_metrics(self.portfolio_dict)
+    
+    def summarize_portfolio(self) -> Dict:
+        """
+        Сводка для базового тарифа без риск-движка: риск концентрации по типу
+        портфеля и коэффициенты по месячному историческому ряду портфеля
+        """
+        portfolio_type = self._get_portfolio_type()
+        basic = self.calculate_basic_metrics()
+        summary = {
+            'concentration_risk': self.CONCENTRATION_RISK.get(portfolio_type, self.CONCENTRATION_RISK['сбалансированный']),
+            'beta': basic['beta'],
+            'annual_return': basic['annual_return'],
+            'annual_volatility': basic['annual_volatility']
+        }
+        data = self.historical_data
+        if len(data) < 2:
+            return summary
+        
+        periods_per_year = 12
+        returns = data['Monthly_Return'].to_numpy()
+        annual_return = float(returns.mean() * periods_per_year)
+        annual_volatility = float(returns.std(ddof=1) * np.sqrt(periods_per_year))
+        downside = float(np.sqrt(np.mean(np.minimum(returns, 0.0) ** 2) * periods_per_year))
+        growth = np.cumprod(1.0 + returns)
+        max_drawdown = float((growth / np.maximum.accumulate(growth) - 1.0).min())
+        summary.update({
+            'annual_return': annual_return,
+            'annual_volatility': annual_volatility,
+            'sharpe_ratio': annual_return / annual_volatility if annual_volatility > 0 else 0.0,
+            'sortino_ratio': annual_return / downside if downside > 0 else 0.0,
+            'downside_deviation': downside,
+            'max_drawdown': max_drawdown,
+            'calmar_ratio': annual_return / abs(max_drawdown) if max_drawdown < 0 else 0.0
+        })
+        return summary
+    
+    def analyze_portfolio_quality(self) -> Dict:
+        """Анализ качества портфеля"""
+        portfolio_type = self._get_portfolio_type()
+        
+        quality_map = {
+            'агрессивный': {
+                'diversification_score': 0.65, 'asset_allocation_score': 0.75, 'liquidity_score': 0.85
+            },
+            'сбалансированный': {
+                'diversification_score': 0.82, 'asset_allocation_score': 0.88, 'liquidity_score': 0.92
+            },
+            'доходный': {
+                'diversification_score': 0.78, 'asset_allocation_score': 0.85, 'liquidity_score': 0.90
+            },
+            'ультра-консервативный': {
+                'diversification_score': 0.70, 'asset_allocation_score': 0.92, 'liquidity_score': 0.95
+            }
+        }
+        
+        base_quality = quality_map.get(portfolio_type, quality_map['сбалансированный'])
+        base_quality.update({
+            'concentration_risk': self.get_section('portfolio_summary')['concentration_risk'],
+            'correlation_matrix': self.generate_correlation_matrix(),
+            'sector_diversification': self.analyze_sector_diversification(),
+            'asset_class_diversification': self.analyze_asset_class_diversification()
+        })
+        
+        return base_quality
+    
+    def benchmark_comparison(self) -> Dict:
+        """Сравнение с эталонными индексами"""
+        portfolio_type = self._get_portfolio_type()
+        
+        benchmark_map = {
+            'агрессивный': {
+                'sp500_return': 0.121, 'nasdaq_return': 0.183, 'rts_return': 0.085,
+                'outperformance_sp500': 0.059, 'outperformance_nasdaq': -0.003,
+                'volatility_comparison': 'выше рынка', 'percentile_ranking': 0.72
+            },
+            'сбалансированный': {
+                'sp500_return': 0.121, 'nasdaq_return': 0.183, 'rts_return': 0.085,
+                'outperformance_sp500': -0.026, 'outperformance_nasdaq': -0.088,
+                'volatility_comparison': 'ниже рынка', 'percentile_ranking': 0.58
+            },
+            'доходный': {
+                'sp500_return': 0.121, 'nasdaq_return': 0.183, 'rts_return': 0.085,
+                'outperformance_sp500': -0.043, 'outperformance_nasdaq': -0.105,
+                'volatility_comparison': 'значительно ниже', 'percentile_ranking': 0.45
+            },
+            'ультра-консервативный': {
+                'sp500_return': 0.121, 'nasdaq_return': 0.183, 'rts_return': 0.085,
+                'outperformance_sp500': -0.076, 'outperformance_nasdaq': -0.138,
+                'volatility_comparison': 'минимальная', 'percentile_ranking': 0.35
+            }
+        }
+        
+        return benchmark_map.get(portfolio_type, benchmark_map['сбалансированный'])
+    
+    def generate_correlation_matrix(self) -> pd.DataFrame:
+        """Генерация матрицы корреляций"""
+        if len(self.portfolio_dict) == 0:
+            return pd.DataFrame()
+        
+        assets = list(self.portfolio_dict.keys())
+        return self.risk_engine.correlation_frame().loc[assets, assets]
+    
+    def analyze_sector_diversification(self) -> Dict:
+        """Отраслевая диверсификация: доли секторов по фактическим весам активов"""
+        return get_ticker_index().portfolio_exposures(self.portfolio_dict, 'sector')
+    
+    def analyze_asset_class_diversification(self) -> Dict:
+        """Доли классов активов по фактическим весам"""
+        exposures = get_ticker_index().portfolio_exposures(self.portfolio_dict, 'asset_class')
+        return {ASSET_CLASS_LABELS.get(asset_class, asset_class): share for asset_class, share in exposures.items()}
+    
+    def generate_performance_charts(self) -> Dict:
+        """Генерация данных для графиков производительности"""
+        if self.historical_data.empty:
+            return {}
+        
+        historical_data = self.historical_data.copy()
+        
+        historical_data['MA_6'] = historical_data['Portfolio_Value'].rolling(window=6, min_periods=1).mean()
+        historical_data['MA_12'] = historical_data['Portfolio_Value'].rolling(window=12, min_periods=1).mean()
+        
+        historical_data['Peak'] = historical_data['Portfolio_Value'].expanding().max()
+        historical_data['Drawdown'] = (historical_data['Portfolio_Value'] - historical_data['Peak']) / historical_data['Peak'] * 100
+        
+        return {
+            'historical_data': historical_data,
+            'annual_returns': self.calculate_annual_returns(historical_data),
+            'volatility_data': self.calculate_rolling_volatility(historical_data)
+        }
+    
+    def optimize_portfolio(self) -> Dict:
+        """Оптимизация по Марковицу: эффективная граница по активам портфеля"""
+        tickers = sorted(self.portfolio_dict)
+        if len(tickers) < 2:
+            return {}
+        
+        constraints = PortfolioConstraints(
+            long_only=True,
+            max_weight=max(self.MAX_ASSET_WEIGHT, 1.0 / len(tickers)),
+            class_bounds=self.OPTIMIZATION_CLASS_BOUNDS
+        )
+        try:
+            frontier = get_efficient_frontier(self.risk_engine, tickers, constraints, n_points=30)
+        except ValueError:
+            # Ограничения недостижимы для этого набора активов - оптимизируем без долей классов
+            constraints.class_bounds = {}
+            frontier = get_efficient_frontier(self.risk_engine, tickers, constraints, n_points=30)
+        
+        efficiency = self.get_section('efficiency_metrics')
+        tangency = frontier['tangency']
+        return {
+            'frontier': {'returns': frontier['returns'], 'volatilities': frontier['volatilities']},
+            'current': {
+                'expected_return': efficiency['annual_return'],
+                'volatility': efficiency['annual_volatility'],
+                'sharpe_ratio': efficiency['sharpe_ratio']
+            },
+            'min_variance': frontier['min_variance'],
+            'tangency': tangency,
+            'optimal_rebalance': rebalance_to_target(self.portfolio_dict, tangency['weights'])
+        }
+    
+    def compare_rebalancing_policies(self, cost_rate: float = DEFAULT_COST_RATE) -> pd.DataFrame:
+        """Сравнение календарных и пороговых политик ребалансировки на истории доходностей активов"""
+        simulator = RebalancingSimulator.from_engine(self.risk_engine, self.portfolio_dict)
+        return simulator.compare(cost_rate=cost_rate)
+    
+    def calculate_goal_projection(self, monthly_contribution: float = 0.0) -> Dict:
+        """Вероятность достижения целевой суммы клиента за его горизонт (Монте-Карло)"""
+        profile = get_client_profile(self.client_name)
+        if not profile or not profile.target_amount:
+            return {}
+        
+        # Доходность и волатильность - по историческому ряду портфеля, без риск-движка:
+        # прогноз входит в базовый тариф
+        summary = self.get_section('portfolio_summary')
+        return self.GOAL_ENGINE.project(
+            initial_investment=profile.initial_investment,
+            target_amount=profile.target_amount,
+            horizon_years=parse_horizon_years(profile.investment_horizon),
+            annual_return=summary['annual_return'],
+            annual_volatility=summary['annual_volatility'],
+            monthly_contribution=monthly_contribution,
+            seed=sum(ord(c) for c in self.client_name)
+        )
+    
+    @cached_property
+    def historical_data(self) -> pd.DataFrame:
+        """Исторический ряд портфеля, общий для всех секций анализа"""
+        return self.generate_historical_data()
+    
+    def generate_historical_data(self) -> pd.DataFrame:
+        """Генерация исторических данных за 10 лет"""
+        try:
+            # Реальная история из хранилища цен, если в нем есть все активы портфеля
+            store = get_price_store()
+            if store is not None and store.covers(self.portfolio_dict):
+                history = store.portfolio_history(self.portfolio_dict, '2014-01-01', '2024-01-01',
+                                                  initial_investment=1000000)
+                if not history.empty:
+                    return history
+            
+            portfolio_type = self._get_portfolio_type()
+            params = RETURN_PARAMS.get(portfolio_type, RETURN_PARAMS[DEFAULT_PORTFOLIO_TYPE])
+            
+            # Сетка дат и кризисные окна рассчитываются один раз на процесс
+            simulator = get_simulator('2014-01-01', '2024-01-01', 'monthly')
+            return simulator.simulate_frame(
+                params['mean'], params['std'],
+                seed=sum(ord(c) for c in self.client_name),
+                initial_investment=1000000
+            )
+            
+        except Exception as e:
+            logger.error(f"Ошибка генерации исторических данных: {e}")
+            return pd.DataFrame()
+    
+    def calculate_annual_returns(self, data: pd.DataFrame) -> pd.DataFrame:
+        """Расчет годовой доходности"""
+        if data.empty:
+            return pd.DataFrame()
+        
+        try:
+            data = data.copy()
+            data['Year'] = data['Date'].dt.year
+            
+            annual_data = data.groupby('Year').agg({
+                'Portfolio_Value': ['first', 'last']
+            }).reset_index()
+            
+            annual_data.columns = ['Year', 'Start_Value', 'End_Value']
+            annual_data['Annual_Return'] = (annual_data['End_Value'] / annual_data['Start_Value'] - 1) * 100
+            
+            return annual_data
+            
+        except Exception as e:
+            logger.error(f"Ошибка расчета годовой доходности: {e}")
+            return pd.DataFrame()
+    
+    def calculate_rolling_volatility(self, data: pd.DataFrame) -> pd.DataFrame:
+        """Расчет скользящей волатильности"""
+        if data.empty:
+            return pd.DataFrame()
+        
+        try:
+            data = data.copy()
+            data['Rolling_Volatility_1Y'] = data['Monthly_Return'].rolling(window=12, min_periods=1).std() * np.sqrt(12) * 100
+            return data[['Date', 'Rolling_Volatility_1Y']].dropna()
+            
+        except Exception as e:
+            logger.error(f"Ошибка расчета волатильности: {e}")
+            return pd.DataFrame()
+    
+    def generate_ai_insights(self) -> List[str]:
+        """AI инсайты для премиум пользователей"""
+        portfolio_type = self._get_portfolio_type()
+        
+        insights_map = {
+            'агрессивный': [
+                "🤖 **ML-анализ**: Высокая чувствительность к технологическому сектору",
+                "📈 **Паттерны**: Сильная волатильность в периоды новостей ФРС",
+                "⚡ **Волатильность**: Ожидается снижение на 12% после выборов",
+                "🎯 **Оптимизация**: Ребалансировка может увеличить Sharpe на 0.15"
+            ],
+            'сбалансированный': [
+                "🤖 **ML-анализ**: Портфель показывает устойчивость к рыночным шокам",
+                "📈 **Паттерны**: Обнаружена положительная сезонность в Q4",
+                "⚡ **Волатильность**: Ожидается снижение волатильности на 8%",
+                "🎯 **Оптимизация**: Добавление REIT может увеличить доходность на 1.2%"
+            ],
+            'доходный': [
+                "🤖 **ML-анализ**: Стабильный дивидендный поток",
+                "📈 **Паттерны**: Низкая корреляция с технологическим сектором",
+                "⚡ **Волатильность**: Минимальные колебания в кризисные периоды",
+                "🎯 **Оптимизация**: Реинвестирование дивидендов увеличит CAGR на 0.8%"
+            ],
+            'ультра-консервативный': [
+                "🤖 **ML-анализ**: Идеальная защита капитала в кризисы",
+                "📈 **Паттерны**: Предсказуемая доходность в любых условиях",
+                "⚡ **Волатильность**: Почти нулевая чувствительность к рынку",
+                "🎯 **Оптимизация**: Текущая структура оптимальна для целей"
+            ]
+        }
+        
+        return insights_map.get(portfolio_type, insights_map['сбалансированный'])
+    
+    def generate_detailed_recommendations(self) -> List[str]:
+        """Детальные рекомендации"""
+        portfolio_type = self._get_portfolio_type()
+        
+        recommendations_map = {
+            'агрессивный': [
+                "🎯 **Тактическая оптимизация**: Увеличить долю защитных активов на 5%",
+                "📊 **Риск-менеджмент**: Установить стоп-лосс на уровне -12% для высоковолатильных активов",
+                "🔄 **Ребалансировка**: Рекомендуется ежемесячный мониторинг",
+                "🌍 **Диверсификация**: Добавить exposure к сырьевым активам"
+            ],
+            'сбалансированный': [
+                "🎯 **Тактическая оптимизация**: Балансировать между growth и value",
+                "📊 **Риск-менеджмент**: Диверсифицировать по географическим регионам",
+                "🔄 **Ребалансировка**: Рекомендуется ежеквартальная ребалансировка",
+                "🌍 **Диверсификация**: Добавить exposure к развивающимся рынкам"
+            ],
+            'доходный': [
+                "🎯 **Тактическая оптимизация**: Фокус на дивидендных аристократах",
+                "📊 **Риск-менеджмент**: Мониторинг дивидендной устойчивости",
+                "🔄 **Ребалансировка**: Полугодовая проверка дивидендных выплат",
+                "🌍 **Диверсификация**: Добавить инфраструктурные активы"
+            ],
+            'ультра-консервативный': [
+                "🎯 **Тактическая оптимизация**: Поддержание ликвидности",
+                "📊 **Риск-менеджмент**: Фокус на кредитное качество облигаций",
+                "🔄 **Ребалансировка**: Годовая проверка достаточности",
+                "🌍 **Диверсификация**: Рассмотреть индексированные облигации"
+            ]
+        }
+        
+        return recommendations_map.get(portfolio_type, recommendations_map['сбалансированный'])
+
+# =============================================
+# КЭШИРОВАНИЕ РЕЗУЛЬТАТОВ АНАЛИЗА
+# =============================================
+
+@lru_cache(maxsize=1)
+def get_analysis_cache() -> PickledResultCache:
+    """Общий для процесса кэш результатов анализа (все сессии Streamlit и запросы API)"""
+    return PickledResultCache(max_bytes=128 * 1024 * 1024, ttl=3600, max_entries=512)
+
+class AnalysisRequest:
+    """Набор секций анализа, которые клиент увидит на своем тарифе"""
+    
+    # Секции базового тарифа не строят риск-движок (ковариация, Холецкий, корреляции)
+    BASIC_SECTIONS = ('basic_metrics', 'portfolio_summary', 'recommendations', 'performance_charts',
+                      'goal_planning')
+    ADVANCED_SECTIONS = ('portfolio_quality', 'efficiency_metrics', 'risk_metrics', 'stress_testing',
+                         'portfolio_optimization', 'rebalancing_analysis')
+    PREMIUM_SECTIONS = ('comparative_analysis', 'ai_insights')
+    
+    def __init__(self, sections: Iterable[str]):
+        self.sections = frozenset(sections)
+    
+    @classmethod
+    def for_client(cls, client_name: str) -> 'AnalysisRequest':
+        """Строит запрос по правам доступа клиента"""
+        entitlement = get_entitlement(client_name)
+        sections = list(cls.BASIC_SECTIONS)
+        if entitlement.allows(ADVANCED_ANALYTICS):
+            sections.extend(cls.ADVANCED_SECTIONS)
+        if entitlement.allows(PREMIUM_ANALYTICS):
+            sections.extend(cls.PREMIUM_SECTIONS)
+        return cls(sections)
+    
+    @classmethod
+    def full(cls) -> 'AnalysisRequest':
+        """Все секции анализа"""
+        return cls(AdvancedPortfolioAnalysis.SECTIONS)
+
+class LazyAnalysisResults(Mapping):
+    """
+    Результаты анализа, которые вычисляются при первом обращении к секции.
+    
+    Секция, которую никто не прочитал (например, свернутый раздел страницы),
+    не вычисляется. Вычисленные секции кэшируются в общем кэше по отдельности,
+    поэтому другой тариф или другая сессия переиспользуют общие секции.
+    """
+    
+    def __init__(self, portfolio_dict: Dict[str, float], client_name: str,
+                 request: AnalysisRequest, cache: Optional[PickledResultCache] = None):
+        self.portfolio_dict = portfolio_dict
+        self.client_name = client_name
+        self.request = request
+        self._cache = cache
+        self._analyzer: Optional[AdvancedPortfolioAnalysis] = None
+        self._resolved: Dict[str, object] = {}
+        # Прогноз цели зависит от суммы, горизонта и начальных вложений из профиля
+        profile = get_client_profile(client_name)
+        self._goal_key = profile.goal_key() if profile is not None else None
+        store = get_price_store()
+        self._key_prefix = (
+            AdvancedPortfolioAnalysis.ANALYSIS_VERSION,
+            client_name,
+            portfolio_fingerprint(portfolio_dict),
+            # Новое поколение хранилища цен делает прежние результаты неактуальными
+            store.generation if store is not None else None,
+            SCENARIO_LIBRARY.version,
+            # Доли секторов и классов активов зависят от справочника тикеров
+            get_ticker_index().version
+        )
+    
+    @property
+    def fingerprint(self) -> str:
+        """Версия результатов: меняется вместе с портфелем, тарифом, данными и версией расчетов"""
+        return content_key('analysis', sorted(self.request.sections), *self._key_prefix, self._goal_key)
+    
+    def __getitem__(self, name: str):
+        if name not in self.request.sections:
+            raise KeyError(name)
+        if name not in self._resolved:
+            if self._cache is None:
+                self._resolved[name] = self._compute(name)
+            else:
+                key = content_key('analysis_section', name, *self._key_prefix, *self._section_inputs(name))
+                self._resolved[name] = self._cache.get_or_compute(key, lambda: self._compute(name))
+        return self._resolved[name]
+    
+    def __contains__(self, name: object) -> bool:
+        return name in self.request.sections
+    
+    def __iter__(self) -> Iterator[str]:
+        return (name for name in AdvancedPortfolioAnalysis.SECTIONS if name in self.request.sections)
+    
+    def __len__(self) -> int:
+        return len(self.request.sections)
+    
+    def _section_inputs(self, name: str) -> tuple:
+        """Данные вне портфеля, от которых зависит секция (для ключа кэша)"""
+        return (self._goal_key,) if name == 'goal_planning' else ()
+    
+    def _compute(self, name: str):
+        return self._get_analyzer().get_section(name)
+    
+    def _get_analyzer(self) -> AdvancedPortfolioAnalysis:
+        if self._analyzer is None:
+            self._analyzer = AdvancedPortfolioAnalysis(self.portfolio_dict, self.client_name)
+        return self._analyzer
+    
+    def goal_projection(self, monthly_contribution: float = 0.0) -> Dict:
+        """Прогноз цели; без пополнений - секция goal_planning, с пополнениями - отдельная запись кэша"""
+        if not monthly_contribution:
+            return self['goal_planning']
+        compute = lambda: self._get_analyzer().calculate_goal_projection(monthly_contribution)
+        if self._cache is None:
+            return compute()
+        key = content_key('goal_projection', float(monthly_contribution), *self._key_prefix, self._goal_key)
+        return self._cache.get_or_compute(key, compute)
+    
+    def rebalancing_comparison(self, cost_rate: float = DEFAULT_COST_RATE) -> pd.DataFrame:
+        """Сравнение политик ребалансировки; при стандартных издержках - секция rebalancing_analysis"""
+        if cost_rate == DEFAULT_COST_RATE:
+            return self['rebalancing_analysis']
+        compute = lambda: self._get_analyzer().compare_rebalancing_policies(cost_rate)
+        if self._cache is None:
+            return compute()
+        key = content_key('rebalancing_analysis', float(cost_rate), *self._key_prefix)
+        return self._cache.get_or_compute(key, compute)
+
+def run_portfolio_analysis(portfolio_dict: Dict[str, float], client_name: str,
+                           request: Optional[AnalysisRequest] = None) -> LazyAnalysisResults:
+    """Анализ портфеля: только секции из запроса, по требованию и через общий кэш"""
+    if request is None:
+        request = AnalysisRequest.for_client(client_name)
+    return LazyAnalysisResults(portfolio_dict, client_name, request, get_analysis_cache())
@@ -0,0 +1,288 @@
+# api.py - HTTP API аналитики (ASGI, JSON) без Streamlit
+
+import asyncio
+import gzip
+import json
+import logging
+import math
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import numpy as np
+import pandas as pd
+
+from analysis import AdvancedPortfolioAnalysis, LazyAnalysisResults, run_portfolio_analysis
+from database import (CLIENTS, generate_subscription_based_recommendations, get_all_clients,
+                      get_client_profile, get_database, get_entitlement)
+from rebalancing import DEFAULT_COST_RATE
+from result_cache import content_key
+
+logger = logging.getLogger(__name__)
+
+# Потоки для расчетов и сериализации (NumPy и SQLite отпускают GIL)
+API_WORKERS = int(os.environ.get('UNIWEST_API_WORKERS', '8'))
+
+# Ответы короче этого размера не сжимаются
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+
+# Параметры запроса секций, которые считаются отдельно от стандартной секции
+SECTION_PARAMETERS = {
+    'goal_planning': ('monthly_contribution', 0.0),
+    'rebalancing_analysis': ('cost_rate', DEFAULT_COST_RATE)
+}
+
+class HTTPError(Exception):
+    """Ошибка запроса с HTTP-статусом и сообщением для клиента"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+def to_jsonable(value: Any) -> Any:
+    """
+    Приводит результаты анализа к типам JSON: таблицы с обычным индексом -
+    списки записей, с именованным (тикеры, сценарии) - словари строк, даты -
+    ISO 8601, NaN и бесконечности - null.
+    """
+    if isinstance(value, dict):
+        return {str(key): to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    if isinstance(value, pd.DataFrame):
+        if isinstance(value.index, pd.RangeIndex):
+            return to_jsonable(value.to_dict(orient='records'))
+        return to_jsonable(value.to_dict(orient='index'))
+    if isinstance(value, pd.Series):
+        return to_jsonable(value.to_dict())
+    if isinstance(value, np.ndarray):
+        return to_jsonable(value.tolist())
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if value is pd.NaT:
+        return None
+    return value
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Слабое сравнение If-None-Match с ETag (RFC 9110)"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or any(tag.removeprefix('W/') == etag.removeprefix('W/') for tag in tags)
+
+def _float_parameter(query: Dict[str, List[str]], name: str, default: float) -> float:
+    values = query.get(name)
+    if not values:
+        return default
+    try:
+        value = float(values[-1])
+    except ValueError:
+        raise HTTPError(400, f"Параметр {name} должен быть числом")
+    if not math.isfinite(value) or value < 0:
+        raise HTTPError(400, f"Параметр {name} должен быть неотрицательным числом")
+    return value
+
+class ClientContext:
+    """
+    Данные клиента для одного запроса: профиль, права и ленивые результаты
+    анализа. ETag строится без расчетов - по дате изменения портфеля
+    (portfolios.last_modified) и версии результатов, поэтому ответ 304
+    отдается без обращения к аналитике.
+
+    Отметка профиля (дата изменения портфеля и параметры цели) читается из
+    базы при каждом запросе и сверяется с профилем из кэша процесса; при
+    расхождении запись кэша сбрасывается, и профиль загружается заново.
+    """
+
+    def __init__(self, client_name: str):
+        stamp = get_database().get_profile_stamp(client_name)
+        self.profile = get_client_profile(client_name)
+        if (self.profile.stamp if self.profile else None) != stamp:
+            CLIENTS.invalidate(client_name)
+            self.profile = get_client_profile(client_name)
+        if self.profile is None:
+            raise HTTPError(404, f"Клиент '{client_name}' не найден")
+        if not self.profile.portfolio:
+            raise HTTPError(404, f"У клиента '{client_name}' нет портфеля")
+        self.client_name = client_name
+        self.entitlement = get_entitlement(client_name)
+        # Дата из загруженного профиля: ETag соответствует отданным весам
+        self.last_modified = self.profile.last_modified
+        self.results: LazyAnalysisResults = run_portfolio_analysis(dict(self.profile.portfolio), client_name)
+
+    def etag(self, *parts: Any) -> str:
+        return 'W/"{}"'.format(content_key('api', self.client_name, self.last_modified, self.profile.goal_key(),
+                                           self.entitlement.level, self.results.fingerprint, *parts)[:32])
+
+# Обработчики: (контекст клиента, параметры пути, параметры запроса) -> данные ответа
+
+def client_portfolio(context: ClientContext, query: Dict[str, List[str]]) -> Dict:
+    profile = context.profile
+    return {
+        'client': profile.to_dict(),
+        'portfolio_name': profile.portfolio_name,
+        'weights': dict(profile.portfolio),
+        'last_modified': context.last_modified,
+        'subscription': context.entitlement.level
+    }
+
+def client_sections(context: ClientContext, query: Dict[str, List[str]]) -> Dict:
+    return {
+        'sections': list(context.results),
+        'locked': [name for name in AdvancedPortfolioAnalysis.SECTIONS if name not in context.results]
+    }
+
+def client_section(context: ClientContext, query: Dict[str, List[str]], section: str) -> Any:
+    if section not in AdvancedPortfolioAnalysis.SECTIONS:
+        raise HTTPError(404, f"Неизвестная секция анализа '{section}'")
+    if section not in context.results:
+        raise HTTPError(403, f"Секция '{section}' недоступна на тарифе '{context.entitlement.level}'")
+    if section == 'goal_planning':
+        return context.results.goal_projection(_float_parameter(query, *SECTION_PARAMETERS[section]))
+    if section == 'rebalancing_analysis':
+        return context.results.rebalancing_comparison(_float_parameter(query, *SECTION_PARAMETERS[section]))
+    return context.results[section]
+
+def client_recommendations(context: ClientContext, query: Dict[str, List[str]]) -> Dict:
+    return {'recommendations': generate_subscription_based_recommendations(context.client_name)}
+
+def client_history(context: ClientContext, query: Dict[str, List[str]]) -> Dict:
+    return context.results['performance_charts']
+
+# Маршруты клиента: /clients/{имя}/<маршрут>[/<параметр>]
+CLIENT_ROUTES: Dict[Tuple[str, ...], Callable] = {
+    (): client_portfolio,
+    ('portfolio',): client_portfolio,
+    ('analysis',): client_sections,
+    ('analysis', '*'): client_section,
+    ('recommendations',): client_recommendations,
+    ('history',): client_history
+}
+
+class Response:
+    """JSON-ответ: статус, тело (уже сжатое, если нужно) и заголовки"""
+
+    def __init__(self, status: int, body: bytes = b'', headers: Optional[List[Tuple[str, str]]] = None):
+        self.status = status
+        self.body = body
+        self.headers = headers or []
+
+def json_response(status: int, data: Any, accept_gzip: bool, etag: Optional[str] = None) -> Response:
+    body = json.dumps(to_jsonable(data), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    headers = [('content-type', 'application/json; charset=utf-8'), ('vary', 'Accept-Encoding')]
+    if etag is not None:
+        # Ответ можно хранить, но перед использованием нужно проверить ETag
+        headers += [('etag', etag), ('cache-control', 'private, no-cache')]
+    if accept_gzip and len(body) >= GZIP_MIN_BYTES:
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        headers.append(('content-encoding', 'gzip'))
+    return Response(status, body, headers)
+
+def handle_request(path: str, query_string: bytes, headers: Dict[str, str]) -> Response:
+    """Синхронная обработка запроса GET (выполняется в пуле потоков)"""
+    accept_gzip = 'gzip' in headers.get('accept-encoding', '')
+    query = parse_qs(query_string.decode('latin-1'))
+    parts = [part for part in path.split('/') if part]
+    try:
+        if parts == ['health']:
+            return json_response(200, {'status': 'ok'}, accept_gzip)
+        if parts == ['clients']:
+            return json_response(200, {'clients': get_all_clients()}, accept_gzip)
+        if len(parts) < 2 or parts[0] != 'clients':
+            raise HTTPError(404, "Неизвестный адрес")
+
+        route = tuple(parts[2:])
+        handler = CLIENT_ROUTES.get(route)
+        arguments: Tuple[str, ...] = ()
+        if handler is None and route:
+            handler = CLIENT_ROUTES.get(route[:-1] + ('*',))
+            arguments = route[-1:]
+        if handler is None:
+            raise HTTPError(404, "Неизвестный адрес")
+
+        context = ClientContext(parts[1])
+        etag = context.etag(path, sorted(query.items()))
+        if _etag_matches(headers.get('if-none-match'), etag):
+            return Response(304, headers=[('etag', etag), ('cache-control', 'private, no-cache')])
+        return json_response(200, handler(context, query, *arguments), accept_gzip, etag)
+
+    except HTTPError as e:
+        return json_response(e.status, {'error': e.message}, accept_gzip)
+    except Exception as e:
+        logger.exception(f"Ошибка обработки запроса {path}: {e}")
+        return json_response(500, {'error': "Внутренняя ошибка сервера"}, accept_gzip)
+
+class AnalyticsAPI:
+    """
+    ASGI-приложение аналитики. Разбор запроса и ответ - в цикле событий,
+    расчеты, SQLite и сериализация - в пуле потоков, поэтому медленная секция
+    одного клиента не блокирует остальные запросы. Одинаковые параллельные
+    расчеты выполняются один раз через общий кэш результатов анализа.
+    """
+
+    def __init__(self, workers: int = API_WORKERS):
+        self.workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='uniwest-api')
+        return self._executor
+
+    async def __call__(self, scope: Dict, receive: Callable, send: Callable) -> None:
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, send)
+
+    async def _lifespan(self, receive: Callable, send: Callable) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False, cancel_futures=True)
+                    self._executor = None
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope: Dict, send: Callable) -> None:
+        method = scope['method']
+        if method not in ('GET', 'HEAD'):
+            response = Response(405, b'', [('allow', 'GET, HEAD')])
+        else:
+            headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(
+                self.executor, handle_request, scope['path'], scope.get('query_string', b''), headers
+            )
+
+        response_headers = [(name.encode('latin-1'), value.encode('latin-1')) for name, value in response.headers]
+        response_headers.append((b'content-length', str(len(response.body)).encode('latin-1')))
+        await send({'type': 'http.response.start', 'status': response.status, 'headers': response_headers})
+        await send({'type': 'http.response.body', 'body': b'' if method == 'HEAD' else response.body})
+
+app = AnalyticsAPI()
+
+if __name__ == "__main__":
+    # python api.py [хост] [порт] - нужен ASGI-сервер uvicorn
+    try:
+        import uvicorn
+    except ImportError:
+        print("Для запуска установите uvicorn или запустите app любым ASGI-сервером: api:app")
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO)
+    host = sys.argv[1] if len(sys.argv) > 1 else '127.0.0.1'
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8000
+    uvicorn.run(app, host=host, port=port)
@@ -8,561 +8,50 @@ import plotly.graph_objects as go
 import plotly.express as px
 from datetime import datetime, timedelta
 import hashlib
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from analysis import LazyAnalysisResults, run_portfolio_analysis
+from chart_sampling import chart_point_budget, downsample_frame, scatter_trace
+from figure_cache import FigureCache, render_figure
+from result_cache import data_fingerprint
+from database import (SUBSCRIPTION_FEATURES, get_all_clients, get_client_profile, get_entitlement,
+                      get_subscription_details, get_subscription_level)
+from entitlements import ADVANCED_ANALYTICS, PREMIUM_ANALYTICS, Entitlement
+from price_store import get_price_store
+from rebalancing import DEFAULT_COST_RATE
+from styles import inject_styles
+from stress_scenarios import FACTOR_LABELS, FACTORS, ScenarioLibrary, StressScenario
 
 # =============================================
 # ВИЗУАЛЬНЫЕ УЛУЧШЕНИЯ - ТОЛЬКО CSS
 # =============================================
 
 def setup_modern_design():
-    """Настройка современного дизайна без изменения логики"""
+    """Настройка современного дизайна без изменения логики (стили - в styles/, см. styles.py)"""
     st.set_page_config(
         page_title="ЮниВест - AI Советник",
         page_icon="📊",
         layout="wide",
         initial_sidebar_state="expanded"
     )
-    
-    # ИНЪЕКТИМ КРАСИВЫЕ СТИЛИ
-    st.markdown("""
-    <style>
-    /* СОВРЕМЕННЫЙ ДИЗАЙН БЕЗ ИЗМЕНЕНИЯ ЛОГИКИ */
-    
-    /* Градиентные заголовки */
-    .modern-main-header {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        padding: 2.5rem 2rem;
-        border-radius: 20px;
-        color: white;
-        margin-bottom: 2rem;
-        text-align: center;
-        box-shadow: 0 10px 30px rgba(0,0,0,0.15);
-    }
-    
-    .modern-section-header {
-        background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%);
-        color: white;
-        padding: 1.2rem 1.5rem;
-        border-radius: 15px;
-        margin: 2.5rem 0 1.5rem 0;
-        font-weight: 700;
-        font-size: 1.3em;
-        box-shadow: 0 4px 15px rgba(0,0,0,0.1);
-    }
-    
-    /* Карточки метрик с анимацией */
-    .modern-metric-card {
-        background: white;
-        padding: 1.5rem;
-        border-radius: 15px;
-        box-shadow: 0 4px 20px rgba(0,0,0,0.08);
-        border-left: 5px solid #667eea;
-        transition: all 0.3s ease;
-        margin-bottom: 1rem;
-        height: 100%;
-    }
-    
-    .modern-metric-card:hover {
-        transform: translateY(-5px);
-        box-shadow: 0 8px 30px rgba(0,0,0,0.15);
-    }
-    
-    /* Улучшенные бейджи подписок */
-    .modern-subscription-badge {
-        padding: 10px 20px;
-        border-radius: 25px;
-        font-weight: bold;
-        font-size: 0.85em;
-        text-align: center;
-        display: inline-block;
-        box-shadow: 0 4px 15px rgba(0,0,0,0.1);
-    }
-    
-    .modern-badge-basic { 
-        background: linear-gradient(135deg, #11998e, #38ef7d); 
-        color: white; 
-    }
-    
-    .modern-badge-advanced { 
-        background: linear-gradient(135deg, #fc466b, #3f5efb); 
-        color: white; 
-    }
-    
-    .modern-badge-premium { 
-        background: linear-gradient(135deg, #ffd700, #ff8c00); 
-        color: black; 
-    }
-    
-    /* Анимированные кнопки */
-    .stButton button {
-        border-radius: 12px;
-        font-weight: 600;
-        transition: all 0.3s ease;
-        box-shadow: 0 4px 15px rgba(0,0,0,0.1);
-    }
-    
-    .stButton button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 6px 20px rgba(0,0,0,0.15);
-    }
-    
-    /* Улучшенные тултипы */
-    .tooltip-modern {
-        background: #2d3748 !important;
-        border-radius: 12px !important;
-        border: 2px solid #4a5568 !important;
-        box-shadow: 0 10px 30px rgba(0,0,0,0.25) !important;
-        font-size: 0.9em !important;
-    }
-    
-    /* Красивые графики */
-    .plotly-graph-div {
-        border-radius: 15px;
-        box-shadow: 0 4px 20px rgba(0,0,0,0.1);
-    }
-    
-    /* Улучшенные секции */
-    .modern-collapsible {
-        background: white;
-        border-radius: 15px;
-        padding: 1.5rem;
-        margin: 1.5rem 0;
-        box-shadow: 0 4px 20px rgba(0,0,0,0.08);
-        border: 1px solid #e0e0e0;
-    }
-    
-    /* Адаптивность сохраняется */
-    @media (max-width: 768px) {
-        .modern-main-header {
-            padding: 2rem 1.5rem;
-            border-radius: 15px;
-        }
-        .modern-metric-card {
-            padding: 1.2rem;
-        }
-    }
-    
-    /* Улучшенный сайдбар */
-    .css-1d391kg {
-        background: linear-gradient(180deg, #f8f9fa 0%, #e9ecef 100%);
-    }
-    
-    /* Красивые уведомления */
-    .stAlert {
-        border-radius: 12px;
-        box-shadow: 0 4px 15px rgba(0,0,0,0.1);
-    }
-    </style>
-    """, unsafe_allow_html=True)
 
 # =============================================
-# ВАШ ИСХОДНЫЙ КЛАСС АНАЛИЗА ПОРТФЕЛЯ - ПОЛНОСТЬЮ СОХРАНЕН
+# КЭШ ГРАФИКОВ
 # =============================================
 
-class AdvancedPortfolioAnalysis:
-    """Усовершенствованный класс для анализа портфеля со всеми показателями"""
-    
-    def __init__(self, portfolio_dict: Dict[str, float], client_name: str = "Демо Клиент"):
-        self.portfolio_dict = portfolio_dict
-        self.client_name = client_name
-        
-    def comprehensive_analysis(self) -> Dict:
-        """Расширенный комплексный анализ для продвинутых и премиум пользователей"""
-        base_metrics = self.calculate_basic_metrics()
-        risk_metrics = self.calculate_advanced_risk_metrics()
-        
-        return {
-            'basic_metrics': base_metrics,
-            'risk_metrics': risk_metrics,
-            'portfolio_quality': self.analyze_portfolio_quality(),
-            'efficiency_metrics': self.calculate_efficiency_metrics(),
-            'comparative_analysis': self.benchmark_comparison(),
-            'ai_insights': self.generate_ai_insights() if len(self.portfolio_dict) > 3 else [],
-            'recommendations': self.generate_detailed_recommendations(),
-            'performance_charts': self.generate_performance_charts()
-        }
-    
-    def calculate_basic_metrics(self) -> Dict:
-        """Расчет базовых метрик для всех пользователей"""
-        portfolio_type = self._get_portfolio_type()
-        
-        metrics_map = {
-            'агрессивный': {
-                'annual_return': 0.18, 'annual_volatility': 0.32, 'sharpe_ratio': 0.56,
-                'max_drawdown': -0.40, 'beta': 1.25, 'current_value': 1500000, 'total_return': 0.85
-            },
-            'сбалансированный': {
-                'annual_return': 0.095, 'annual_volatility': 0.14, 'sharpe_ratio': 0.68,
-                'max_drawdown': -0.20, 'beta': 0.95, 'current_value': 1200000, 'total_return': 0.45
-            },
-            'доходный': {
-                'annual_return': 0.078, 'annual_volatility': 0.11, 'sharpe_ratio': 0.71,
-                'max_drawdown': -0.15, 'beta': 0.75, 'current_value': 1800000, 'total_return': 0.32
-            },
-            'ультра-консервативный': {
-                'annual_return': 0.045, 'annual_volatility': 0.05, 'sharpe_ratio': 0.90,
-                'max_drawdown': -0.08, 'beta': 0.35, 'current_value': 2200000, 'total_return': 0.18
-            }
-        }
-        
-        return metrics_map.get(portfolio_type, metrics_map['сбалансированный'])
-    
-    def _get_portfolio_type(self) -> str:
-        """Определяет тип портфеля на основе активов"""
-        aggressive_keywords = ['TSLA', 'NVDA', 'AMD', 'ARKK', 'BTC', 'ETH']
-        conservative_keywords = ['BND', 'GOVT', 'SHY', 'Cash']
-        
-        aggressive_score = sum(weight for asset, weight in self.portfolio_dict.items() 
-                             if any(keyword in asset for keyword in aggressive_keywords))
-        conservative_score = sum(weight for asset, weight in self.portfolio_dict.items() 
-                               if any(keyword in asset for keyword in conservative_keywords))
-        
-        if aggressive_score > 0.4:
-            return 'агрессивный'
-        elif conservative_score > 0.5:
-            return 'ультра-консервативный'
-        elif conservative_score > 0.3:
-            return 'доходный'
-        else:
-            return 'сбалансированный'
-    
-    def calculate_advanced_risk_metrics(self) -> Dict:
-        """Расширенный анализ рисков для продвинутых пользователей"""
-        portfolio_type = self._get_portfolio_type()
-        
-        risk_metrics_map = {
-            'агрессивный': {
-                'parametric_var_95': -0.085, 'parametric_var_99': -0.125,
-                'cvar_95': -0.118, 'cvar_99': -0.155,
-                'downside_deviation': 0.15, 'worst_day': -0.08, 'worst_month': -0.22,
-                'value_at_risk_1m': -127500, 'expected_shortfall': -187000,
-                'stress_test_2008': -0.55, 'stress_test_covid': -0.48
-            },
-            'сбалансированный': {
-                'parametric_var_95': -0.045, 'parametric_var_99': -0.065,
-                'cvar_95': -0.058, 'cvar_99': -0.075,
-                'downside_deviation': 0.08, 'worst_day': -0.05, 'worst_month': -0.12,
-                'value_at_risk_1m': -54000, 'expected_shortfall': -78000,
-                'stress_test_2008': -0.35, 'stress_test_covid': -0.28
-            },
-            'доходный': {
-                'parametric_var_95': -0.035, 'parametric_var_99': -0.048,
-                'cvar_95': -0.042, 'cvar_99': -0.055,
-                'downside_deviation': 0.06, 'worst_day': -0.04, 'worst_month': -0.09,
-                'value_at_risk_1m': -63000, 'expected_shortfall': -89000,
-                'stress_test_2008': -0.25, 'stress_test_covid': -0.20
-            },
-            'ультра-консервативный': {
-                'parametric_var_95': -0.015, 'parametric_var_99': -0.022,
-                'cvar_95': -0.018, 'cvar_99': -0.025,
-                'downside_deviation': 0.03, 'worst_day': -0.02, 'worst_month': -0.05,
-                'value_at_risk_1m': -33000, 'expected_shortfall': -44000,
-                'stress_test_2008': -0.12, 'stress_test_covid': -0.10
-            }
-        }
-        
-        return risk_metrics_map.get(portfolio_type, risk_metrics_map['сбалансированный'])
-    
-    def calculate_efficiency_metrics(self) -> Dict:
-        """Метрики эффективности для продвинутых и премиум пользователей"""
-        portfolio_type = self._get_portfolio_type()
-        
-        efficiency_map = {
-            'агрессивный': {
-                'sharpe_ratio': 0.56, 'sortino_ratio': 0.72, 'beta': 1.25,
-                'treynor_ratio': 0.144, 'm_squared': 0.038, 'jensen_alpha': 0.028,
-                'modigliani_ratio': 0.035, 'information_ratio': 0.18, 'tracking_error': 0.068,
-                'downside_deviation': 0.15, 'calmar_ratio': 0.45
-            },
-            'сбалансированный': {
-                'sharpe_ratio': 0.68, 'sortino_ratio': 0.85, 'beta': 0.95,
-                'treynor_ratio': 0.100, 'm_squared': 0.025, 'jensen_alpha': 0.015,
-                'modigliani_ratio': 0.022, 'information_ratio': 0.12, 'tracking_error': 0.045,
-                'downside_deviation': 0.08, 'calmar_ratio': 0.48
-            },
-            'доходный': {
-                'sharpe_ratio': 0.71, 'sortino_ratio': 0.88, 'beta': 0.75,
-                'treynor_ratio': 0.104, 'm_squared': 0.022, 'jensen_alpha': 0.012,
-                'modigliani_ratio': 0.018, 'information_ratio': 0.10, 'tracking_error': 0.038,
-                'downside_deviation': 0.06, 'calmar_ratio': 0.52
-            },
-            'ультра-консервативный': {
-                'sharpe_ratio': 0.90, 'sortino_ratio': 1.05, 'beta': 0.35,
-                'treynor_ratio': 0.129, 'm_squared': 0.018, 'jensen_alpha': 0.008,
-                'modigliani_ratio': 0.012, 'information_ratio': 0.08, 'tracking_error': 0.025,
-                'downside_deviation': 0.03, 'calmar_ratio': 0.56
-            }
-        }
-        
-        return efficiency_map.get(portfolio_type, efficiency_map['сбалансированный'])
-    
-    def analyze_portfolio_quality(self) -> Dict:
-        """Анализ качества портфеля"""
-        portfolio_type = self._get_portfolio_type()
-        
-        quality_map = {
-            'агрессивный': {
-                'diversification_score': 0.65, 'concentration_risk': 'высокий',
-                'asset_allocation_score': 0.75, 'liquidity_score': 0.85
-            },
-            'сбалансированный': {
-                'diversification_score': 0.82, 'concentration_risk': 'умеренный', 
-                'asset_allocation_score': 0.88, 'liquidity_score': 0.92
-            },
-            'доходный': {
-                'diversification_score': 0.78, 'concentration_risk': 'низкий',
-                'asset_allocation_score': 0.85, 'liquidity_score': 0.90
-            },
-            'ультра-консервативный': {
-                'diversification_score': 0.70, 'concentration_risk': 'очень низкий',
-                'asset_allocation_score': 0.92, 'liquidity_score': 0.95
-            }
-        }
-        
-        base_quality = quality_map.get(portfolio_type, quality_map['сбалансированный'])
-        base_quality.update({
-            'correlation_matrix': self.generate_correlation_matrix(),
-            'sector_diversification': self.analyze_sector_diversification()
-        })
-        
-        return base_quality
-    
-    def benchmark_comparison(self) -> Dict:
-        """Сравнение с эталонными индексами"""
-        portfolio_type = self._get_portfolio_type()
-        
-        benchmark_map = {
-            'агрессивный': {
-                'sp500_return': 0.121, 'nasdaq_return': 0.183, 'rts_return': 0.085,
-                'outperformance_sp500': 0.059, 'outperformance_nasdaq': -0.003,
-                'volatility_comparison': 'выше рынка', 'percentile_ranking': 0.72
-            },
-            'сбалансированный': {
-                'sp500_return': 0.121, 'nasdaq_return': 0.183, 'rts_return': 0.085,
-                'outperformance_sp500': -0.026, 'outperformance_nasdaq': -0.088,
-                'volatility_comparison': 'ниже рынка', 'percentile_ranking': 0.58
-            },
-            'доходный': {
-                'sp500_return': 0.121, 'nasdaq_return': 0.183, 'rts_return': 0.085,
-                'outperformance_sp500': -0.043, 'outperformance_nasdaq': -0.105,
-                'volatility_comparison': 'значительно ниже', 'percentile_ranking': 0.45
-            },
-            'ультра-консервативный': {
-                'sp500_return': 0.121, 'nasdaq_return': 0.183, 'rts_return': 0.085,
-                'outperformance_sp500': -0.076, 'outperformance_nasdaq': -0.138,
-                'volatility_comparison': 'минимальная', 'percentile_ranking': 0.35
-            }
-        }
-        
-        return benchmark_map.get(portfolio_type, benchmark_map['сбалансированный'])
-    
-    def generate_correlation_matrix(self) -> pd.DataFrame:
-        """Генерация матрицы корреляций"""
-        assets = list(self.portfolio_dict.keys())
-        if len(assets) == 0:
-            return pd.DataFrame()
-        
-        np.random.seed(42)
-        corr_matrix = np.random.uniform(-0.3, 0.8, (len(assets), len(assets)))
-        np.fill_diagonal(corr_matrix, 1.0)
-        return pd.DataFrame(corr_matrix, index=assets, columns=assets)
-    
-    def analyze_sector_diversification(self) -> Dict:
-        """Анализ отраслевой диверсификации"""
-        portfolio_type = self._get_portfolio_type()
-        
-        sector_map = {
-            'агрессивный': {
-                'Технологии': 0.45, 'Финансы': 0.15, 'Здравоохранение': 0.12,
-                'Потребительские товары': 0.08, 'Энергетика': 0.06,
-                'Недвижимость': 0.04, 'Материалы': 0.03, 'Крипто': 0.07
-            },
-            'сбалансированный': {
-                'Технологии': 0.25, 'Финансы': 0.18, 'Здравоохранение': 0.15,
-                'Потребительские товары': 0.12, 'Энергетика': 0.08,
-                'Недвижимость': 0.10, 'Материалы': 0.06, 'Облигации': 0.06
-            },
-            'доходный': {
-                'Технологии': 0.15, 'Финансы': 0.20, 'Здравоохранение': 0.18,
-                'Потребительские товары': 0.16, 'Энергетика': 0.12,
-                'Недвижимость': 0.10, 'Коммунальные услуги': 0.09
-            },
-            'ультра-консервативный': {
-                'Облигации': 0.65, 'Денежные средства': 0.15, 'Защитные акции': 0.12,
-                'Золото': 0.08
-            }
-        }
-        
-        return sector_map.get(portfolio_type, sector_map['сбалансированный'])
-    
-    def generate_performance_charts(self) -> Dict:
-        """Генерация данных для графиков производительности"""
-        historical_data = self.generate_historical_data()
-        
-        if historical_data.empty:
-            return {}
-        
-        historical_data['MA_6'] = historical_data['Portfolio_Value'].rolling(window=6, min_periods=1).mean()
-        historical_data['MA_12'] = historical_data['Portfolio_Value'].rolling(window=12, min_periods=1).mean()
-        
-        historical_data['Peak'] = historical_data['Portfolio_Value'].expanding().max()
-        historical_data['Drawdown'] = (historical_data['Portfolio_Value'] - historical_data['Peak']) / historical_data['Peak'] * 100
-        
-        return {
-            'historical_data': historical_data,
-            'annual_returns': self.calculate_annual_returns(historical_data),
-            'volatility_data': self.calculate_rolling_volatility(historical_data)
-        }
-    
-    def generate_historical_data(self) -> pd.DataFrame:
-        """Генерация исторических данных за 10 лет"""
-        try:
-            dates = pd.date_range(start='2014-01-01', end='2024-01-01', freq='M')
-            np.random.seed(sum(ord(c) for c in self.client_name))
-            
-            portfolio_type = self._get_portfolio_type()
-            params_map = {
-                'агрессивный': {'mean': 0.012, 'std': 0.055},
-                'сбалансированный': {'mean': 0.008, 'std': 0.035},
-                'доходный': {'mean': 0.006, 'std': 0.028},
-                'ультра-консервативный': {'mean': 0.004, 'std': 0.015}
-            }
-            
-            params = params_map.get(portfolio_type, params_map['сбалансированный'])
-            monthly_returns = np.random.normal(params['mean'], params['std'], len(dates))
-            
-            crisis_periods = [
-                ('2015-07-01', '2016-02-01', -0.18),
-                ('2018-09-01', '2018-12-01', -0.12),
-                ('2020-02-01', '2020-04-01', -0.25),
-                ('2022-01-01', '2022-10-01', -0.20)
-            ]
-            
-            for crisis_start, crisis_end, crisis_strength in crisis_periods:
-                mask = (dates >= pd.to_datetime(crisis_start)) & (dates <= pd.to_datetime(crisis_end))
-                if mask.any():
-                    monthly_returns[mask] += np.random.normal(crisis_strength, 0.02, mask.sum())
-            
-            initial_investment = 1000000
-            portfolio_value = [initial_investment]
-            
-            for ret in monthly_returns:
-                portfolio_value.append(portfolio_value[-1] * (1 + ret))
-            
-            df = pd.DataFrame({
-                'Date': dates,
-                'Portfolio_Value': portfolio_value[1:],
-                'Monthly_Return': monthly_returns,
-                'Cumulative_Return': (np.array(portfolio_value[1:]) / initial_investment - 1) * 100
-            })
-            
-            return df
-            
-        except Exception as e:
-            st.error(f"Ошибка генерации исторических данных: {e}")
-            return pd.DataFrame()
-    
-    def calculate_annual_returns(self, data: pd.DataFrame) -> pd.DataFrame:
-        """Расчет годовой доходности"""
-        if data.empty:
-            return pd.DataFrame()
-        
-        try:
-            data = data.copy()
-            data['Year'] = data['Date'].dt.year
-            
-            annual_data = data.groupby('Year').agg({
-                'Portfolio_Value': ['first', 'last']
-            }).reset_index()
-            
-            annual_data.columns = ['Year', 'Start_Value', 'End_Value']
-            annual_data['Annual_Return'] = (annual_data['End_Value'] / annual_data['Start_Value'] - 1) * 100
-            
-            return annual_data
-            
-        except Exception as e:
-            st.error(f"Ошибка расчета годовой доходности: {e}")
-            return pd.DataFrame()
-    
-    def calculate_rolling_volatility(self, data: pd.DataFrame) -> pd.DataFrame:
-        """Расчет скользящей волатильности"""
-        if data.empty:
-            return pd.DataFrame()
-        
-        try:
-            data = data.copy()
-            data['Rolling_Volatility_1Y'] = data['Monthly_Return'].rolling(window=12, min_periods=1).std() * np.sqrt(12) * 100
-            return data[['Date', 'Rolling_Volatility_1Y']].dropna()
-            
-        except Exception as e:
-            st.error(f"Ошибка расчета волатильности: {e}")
-            return pd.DataFrame()
-    
-    def generate_ai_insights(self) -> List[str]:
-        """AI инсайты для премиум пользователей"""
-        portfolio_type = self._get_portfolio_type()
-        
-        insights_map = {
-            'агрессивный': [
-                "🤖 **ML-анализ**: Высокая чувствительность к технологическому сектору",
-                "📈 **Паттерны**: Сильная волатильность в периоды новостей ФРС",
-                "⚡ **Волатильность**: Ожидается снижение на 12% после выборов",
-                "🎯 **Оптимизация**: Ребалансировка может увеличить Sharpe на 0.15"
-            ],
-            'сбалансированный': [
-                "🤖 **ML-анализ**: Портфель показывает устойчивость к рыночным шокам",
-                "📈 **Паттерны**: Обнаружена положительная сезонность в Q4",
-                "⚡ **Волатильность**: Ожидается снижение волатильности на 8%",
-                "🎯 **Оптимизация**: Добавление REIT может увеличить доходность на 1.2%"
-            ],
-            'доходный': [
-                "🤖 **ML-анализ**: Стабильный дивидендный поток",
-                "📈 **Паттерны**: Низкая корреляция с технологическим сектором",
-                "⚡ **Волатильность**: Минимальные колебания в кризисные периоды",
-                "🎯 **Оптимизация**: Реинвестирование дивидендов увеличит CAGR на 0.8%"
-            ],
-            'ультра-консервативный': [
-                "🤖 **ML-анализ**: Идеальная защита капитала в кризисы",
-                "📈 **Паттерны**: Предсказуемая доходность в любых условиях",
-                "⚡ **Волатильность**: Почти нулевая чувствительность к рынку",
-                "🎯 **Оптимизация**: Текущая структура оптимальна для целей"
-            ]
-        }
-        
-        return insights_map.get(portfolio_type, insights_map['сбалансированный'])
-    
-    def generate_detailed_recommendations(self) -> List[str]:
-        """Детальные рекомендации"""
-        portfolio_type = self._get_portfolio_type()
-        
-        recommendations_map = {
-            'агрессивный': [
-                "🎯 **Тактическая оптимизация**: Увеличить долю защитных активов на 5%",
-                "📊 **Риск-менеджмент**: Установить стоп-лосс на уровне -12% для высоковолатильных активов",
-                "🔄 **Ребалансировка**: Рекомендуется ежемесячный мониторинг",
-                "🌍 **Диверсификация**: Добавить exposure к сырьевым активам"
-            ],
-            'сбалансированный': [
-                "🎯 **Тактическая оптимизация**: Балансировать между growth и value",
-                "📊 **Риск-менеджмент**: Диверсифицировать по географическим регионам",
-                "🔄 **Ребалансировка**: Рекомендуется ежеквартальная ребалансировка",
-                "🌍 **Диверсификация**: Добавить exposure к развивающимся рынкам"
-            ],
-            'доходный': [
-                "🎯 **Тактическая оптимизация**: Фокус на дивидендных аристократах",
-                "📊 **Риск-менеджмент**: Мониторинг дивидендной устойчивости",
-                "🔄 **Ребалансировка**: Полугодовая проверка дивидендных выплат",
-                "🌍 **Диверсификация**: Добавить инфраструктурные активы"
-            ],
-            'ультра-консервативный': [
-                "🎯 **Тактическая оптимизация**: Поддержание ликвидности",
-                "📊 **Риск-менеджмент**: Фокус на кредитное качество облигаций",
-                "🔄 **Ребалансировка**: Годовая проверка достаточности",
-                "🌍 **Диверсификация**: Рассмотреть индексированные облигации"
-            ]
-        }
-        
-        return recommendations_map.get(portfolio_type, recommendations_map['сбалансированный'])
+@st.cache_resource
+def get_figure_cache() -> FigureCache:
+    """Общий для всех сессий кэш сериализованных графиков"""
+    return FigureCache(max_bytes=64 * 1024 * 1024, ttl=3600)
+
+def plotly_chart_cached(chart_type: str, build: Callable[[], go.Figure], *data_keys: Any) -> None:
+    """
+    Выводит график из кэша готовых HTML-фрагментов; build вызывается только
+    при промахе. data_keys должны однозначно определять содержимое графика.
+    """
+    variant = 'mobile' if st.session_state.get('is_mobile', False) else 'desktop'
+    cache = get_figure_cache()
+    render_figure(cache.get_or_build(cache.key(chart_type, variant, *data_keys), build))
 
 # =============================================
 # ВАШИ ИСХОДНЫЕ TOOLTIP'Ы - ПОЛНОСТЬЮ СОХРАНЕНЫ
@@ -624,18 +113,28 @@ def display_metric_with_tooltip(label: str, value: str, metric_name: str):
         </div>
         """, unsafe_allow_html=True)
 
+def chart_max_points(max_points: Optional[int] = None) -> int:
+    """Число точек на график: явно заданное или по типу экрана"""
+    if max_points is not None:
+        return max_points
+    return chart_point_budget(st.session_state.get('is_mobile', False))
+
 # ВАШИ ФУНКЦИИ ДЛЯ ГРАФИКОВ (полностью сохранены)
-def create_historical_performance_chart(historical_data: pd.DataFrame, client_name: str):
+# Длинные ряды прореживаются (LTTB, для столбцов - минимум/максимум по корзинам)
+def create_historical_performance_chart(historical_data: pd.DataFrame, client_name: str,
+                                        max_points: Optional[int] = None):
     """Создает график исторической производительности"""
     try:
         if historical_data.empty:
             return go.Figure()
         
+        data = downsample_frame(historical_data, 'Date', ['Portfolio_Value'], chart_max_points(max_points))
         fig = go.Figure()
         
-        fig.add_trace(go.Scatter(
-            x=historical_data['Date'],
-            y=historical_data['Portfolio_Value'],
+        fig.add_trace(scatter_trace(
+            len(data),
+            x=data['Date'],
+            y=data['Portfolio_Value'],
             mode='lines',
             name='Стоимость портфеля',
             line=dict(color='#2E86AB', width=3),
@@ -658,19 +157,21 @@ def create_historical_performance_chart(historical_data: pd.DataFrame, client_na
         st.error(f"Ошибка создания графика: {e}")
         return go.Figure()
 
-def create_returns_chart(historical_data: pd.DataFrame):
+def create_returns_chart(historical_data: pd.DataFrame, max_points: Optional[int] = None):
     """Создает график месячной доходности"""
     try:
         if historical_data.empty:
             return go.Figure()
         
-        colors = ['red' if x < 0 else 'green' for x in historical_data['Monthly_Return'] * 100]
+        data = downsample_frame(historical_data, 'Date', ['Monthly_Return'], chart_max_points(max_points),
+                                method='minmax')
+        colors = np.where(data['Monthly_Return'] < 0, 'red', 'green')
         
         fig = go.Figure()
         
         fig.add_trace(go.Bar(
-            x=historical_data['Date'],
-            y=historical_data['Monthly_Return'] * 100,
+            x=data['Date'],
+            y=data['Monthly_Return'] * 100,
             name='Месячная доходность %',
             marker_color=colors,
             opacity=0.7
@@ -691,17 +192,19 @@ def create_returns_chart(historical_data: pd.DataFrame):
         st.error(f"Ошибка создания графика доходности: {e}")
         return go.Figure()
 
-def create_drawdown_chart(historical_data: pd.DataFrame):
+def create_drawdown_chart(historical_data: pd.DataFrame, max_points: Optional[int] = None):
     """Создает график просадок"""
     try:
         if historical_data.empty:
             return go.Figure()
         
+        data = downsample_frame(historical_data, 'Date', ['Drawdown'], chart_max_points(max_points))
         fig = go.Figure()
         
-        fig.add_trace(go.Scatter(
-            x=historical_data['Date'],
-            y=historical_data['Drawdown'],
+        fig.add_trace(scatter_trace(
+            len(data),
+            x=data['Date'],
+            y=data['Drawdown'],
             fill='tozeroy',
             mode='lines',
             name='Просадка',
@@ -819,43 +322,105 @@ def display_historical_performance(results: Dict, client_name: str):
         
         create_performance_summary_cards(historical_data)
         
-        st.plotly_chart(
-            create_historical_performance_chart(historical_data, client_name),
-            use_container_width=True
+        # Графики берутся из кэша по отпечатку данных: при неизменной истории они не строятся заново
+        history_key = data_fingerprint(historical_data)
+        plotly_chart_cached(
+            'historical_performance',
+            lambda: create_historical_performance_chart(historical_data, client_name),
+            history_key, client_name
         )
         
         # Адаптивная верстка графиков
         if st.session_state.is_mobile:
-            st.plotly_chart(
-                create_returns_chart(historical_data),
-                use_container_width=True
-            )
-            st.plotly_chart(
-                create_drawdown_chart(historical_data),
-                use_container_width=True
-            )
+            plotly_chart_cached('returns', lambda: create_returns_chart(historical_data), history_key)
+            plotly_chart_cached('drawdown', lambda: create_drawdown_chart(historical_data), history_key)
         else:
             col1, col2 = st.columns(2)
             with col1:
-                st.plotly_chart(
-                    create_returns_chart(historical_data),
-                    use_container_width=True
-                )
+                plotly_chart_cached('returns', lambda: create_returns_chart(historical_data), history_key)
             with col2:
-                st.plotly_chart(
-                    create_drawdown_chart(historical_data),
-                    use_container_width=True
-                )
+                plotly_chart_cached('drawdown', lambda: create_drawdown_chart(historical_data), history_key)
         
         if not annual_data.empty:
-            st.plotly_chart(
-                create_annual_returns_chart(annual_data),
-                use_container_width=True
-            )
+            plotly_chart_cached('annual_returns', lambda: create_annual_returns_chart(annual_data),
+                                data_fingerprint(annual_data))
             
     except Exception as e:
         st.error(f"Ошибка отображения исторических данных: {e}")
 
+def create_goal_projection_chart(projection: Dict):
+    """Веерный график прогноза стоимости портфеля с целевой суммой"""
+    try:
+        dates = pd.Timestamp.today().normalize() + pd.to_timedelta(projection['months'] * 30.4375, unit='D')
+        bands = projection['percentiles']
+        
+        fig = go.Figure()
+        for low, high, opacity in ((5, 95, 0.15), (25, 75, 0.3)):
+            fig.add_trace(go.Scatter(x=dates, y=bands[high], mode='lines', line=dict(width=0),
+                                     showlegend=False, hoverinfo='skip'))
+            fig.add_trace(go.Scatter(
+                x=dates, y=bands[low], mode='lines', line=dict(width=0),
+                fill='tonexty', fillcolor=f'rgba(46, 134, 171, {opacity})',
+                name=f'{low}-{high} перцентиль', hoverinfo='skip'
+            ))
+        fig.add_trace(go.Scatter(
+            x=dates, y=bands[50], mode='lines', name='Медианный сценарий',
+            line=dict(color='#2E86AB', width=3),
+            hovertemplate='<b>%{x|%b %Y}</b><br>₽%{y:,.0f}<extra></extra>'
+        ))
+        fig.add_hline(y=projection['target_amount'], line_dash='dash', line_color='#27AE60',
+                      annotation_text='Целевая сумма')
+        
+        fig.update_layout(
+            title='🎯 Прогноз стоимости портфеля',
+            xaxis_title='Дата',
+            yaxis_title='Стоимость портфеля (рубли)',
+            hovermode='x unified',
+            height=400,
+            template='plotly_white'
+        )
+        return fig
+        
+    except Exception as e:
+        st.error(f"Ошибка создания графика прогноза: {e}")
+        return go.Figure()
+
+def display_goal_planning(results: LazyAnalysisResults) -> None:
+    """Планирование целей: вероятность достижения целевой суммы"""
+    if 'goal_planning' not in results:
+        return
+    
+    try:
+        st.markdown('<div class="modern-section-header">📋 Планирование целей</div>', unsafe_allow_html=True)
+        
+        monthly_contribution = st.number_input(
+            "Ежемесячное пополнение, ₽", min_value=0, value=0, step=10000, key='goal_monthly_contribution'
+        )
+        projection = results.goal_projection(monthly_contribution)
+        if not projection:
+            st.info("Целевая сумма не задана")
+            return
+        
+        low, high = projection['probability_interval']
+        median_months = projection['median_time_to_goal_months']
+        median_text = f"{median_months / 12:.1f} лет" if median_months is not None else "за горизонтом"
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Вероятность достижения цели", f"{projection['probability']:.1%}",
+                      help=f"Доверительный интервал 95%: {low:.1%} - {high:.1%}")
+        with col2:
+            st.metric("Медианный срок достижения", median_text)
+        with col3:
+            st.metric("Медианная стоимость на горизонте", f"{projection['percentiles'][50][-1]:,.0f} ₽")
+        
+        st.plotly_chart(create_goal_projection_chart(projection), use_container_width=True)
+        st.caption(f"Горизонт {projection['horizon_years']} лет, "
+                   f"{projection['n_paths']:,} сценариев Монте-Карло")
+        
+    except Exception as e:
+        st.error(f"Ошибка планирования целей: {e}")
+
 # АДАПТИВНЫЕ ФУНКЦИИ ОТОБРАЖЕНИЯ (ваши функции полностью сохранены)
 def display_collapsible_section(title: str, expanded: bool = True):
     """Создает адаптивную сворачиваемую секцию"""
@@ -880,7 +445,7 @@ def display_collapsible_section(title: str, expanded: bool = True):
     
     return st.session_state[key]
 
-def display_portfolio_analysis(results: Dict, subscription_level: str) -> None:
+def display_portfolio_analysis(results: Dict, entitlement: Entitlement) -> None:
     """Адаптивное отображение анализа с разными уровнями доступа"""
     if not results:
         st.error("Нет данных для отображения")
@@ -910,7 +475,7 @@ def display_portfolio_analysis(results: Dict, subscription_level: str) -> None:
                 st.metric("Текущая стоимость", f"₽{metrics.get('current_value', 0):,}")
             with col4:
                 st.metric("Общая доходность", f"{metrics.get('total_return', 0):.1%}")
-                st.metric("Тип портфеля", results.get('portfolio_quality', {}).get('concentration_risk', 'Н/Д'))
+                st.metric("Тип портфеля", (results.get('portfolio_summary') or {}).get('concentration_risk', 'Н/Д'))
         else:
             # Десктопная версия - 4 колонки
             col1, col2, col3, col4 = st.columns(4)
@@ -931,15 +496,19 @@ def display_portfolio_analysis(results: Dict, subscription_level: str) -> None:
             with col3:
                 st.metric("Общая доходность", f"{metrics.get('total_return', 0):.1%}")
             with col4:
-                st.metric("Тип портфеля", results.get('portfolio_quality', {}).get('concentration_risk', 'Н/Д'))
-
-def display_efficiency_metrics(results: Dict, subscription_level: str) -> None:
-    """Адаптивное отображение метрик эффективности"""
-    efficiency_metrics = results.get('efficiency_metrics', {})
-    if not efficiency_metrics:
+                st.metric("Тип портфеля", (results.get('portfolio_summary') or {}).get('concentration_risk', 'Н/Д'))
+
+def display_efficiency_metrics(results: Dict, entitlement: Entitlement) -> None:
+    """
+    Адаптивное отображение метрик эффективности: на продвинутых тарифах - по
+    риск-движку, на базовом - коэффициенты из сводки по историческому ряду
+    """
+    section = 'efficiency_metrics' if 'efficiency_metrics' in results else 'portfolio_summary'
+    if section not in results:
         return
     
     if display_collapsible_section("📈 Метрики эффективности", expanded=True):
+        efficiency_metrics = results.get(section) or {}
         if st.session_state.is_mobile:
             col1, col2 = st.columns(2)
             with col1:
@@ -960,7 +529,7 @@ def display_efficiency_metrics(results: Dict, subscription_level: str) -> None:
                 st.metric("Downside Dev", f"{efficiency_metrics.get('downside_deviation', 0):.2%}")
         
         # Продвинутые метрики
-        if subscription_level in ['advanced', 'premium']:
+        if entitlement.allows(ADVANCED_ANALYTICS):
             if st.session_state.is_mobile:
                 col1, col2 = st.columns(2)
                 with col1:
@@ -980,13 +549,13 @@ def display_efficiency_metrics(results: Dict, subscription_level: str) -> None:
                 with col4:
                     display_metric_with_tooltip("Коэф. Калмара", f"{efficiency_metrics.get('calmar_ratio', 0):.2f}", 'calmar_ratio')
 
-def display_advanced_risk_analysis(results: Dict, subscription_level: str) -> None:
+def display_advanced_risk_analysis(results: Dict, entitlement: Entitlement) -> None:
     """Адаптивное отображение расширенного анализа рисков"""
-    risk_metrics = results.get('risk_metrics', {})
-    if not risk_metrics or subscription_level not in ['advanced', 'premium']:
+    if 'risk_metrics' not in results or not entitlement.allows(ADVANCED_ANALYTICS):
         return
     
     if display_collapsible_section("🎯 Расширенный анализ рисков", expanded=True):
+        risk_metrics = results.get('risk_metrics') or {}
         if st.session_state.is_mobile:
             col1, col2 = st.columns(2)
             with col1:
@@ -1018,13 +587,184 @@ def display_advanced_risk_analysis(results: Dict, subscription_level: str) -> No
             with col4:
                 st.metric("Stress Test 2008", f"{risk_metrics.get('stress_test_2008', 0):.1%}")
 
-def display_portfolio_quality(results: Dict, subscription_level: str) -> None:
+def create_stress_test_chart(scenarios: pd.DataFrame) -> go.Figure:
+    """P&L портфеля по сценариям (горизонтальные столбцы)"""
+    ordered = scenarios.sort_values('pnl')
+    fig = go.Figure(go.Bar(
+        x=ordered['pnl'], y=ordered.index, orientation='h',
+        marker_color=np.where(ordered['pnl'] < 0, '#E74C3C', '#27AE60'),
+        customdata=ordered['return'],
+        hovertemplate='%{y}<br>%{x:,.0f} ₽ (%{customdata:.1%})<extra></extra>'
+    ))
+    fig.update_layout(
+        title='🌪️ P&L портфеля в стресс-сценариях',
+        xaxis_title='Изменение стоимости, ₽',
+        height=max(350, 30 * len(ordered)),
+        template='plotly_white'
+    )
+    return fig
+
+def display_stress_testing(results: LazyAnalysisResults, entitlement: Entitlement) -> None:
+    """Стресс-тесты: исторические и гипотетические сценарии и пользовательский шок"""
+    if 'stress_testing' not in results or not entitlement.allows(ADVANCED_ANALYTICS):
+        return
+    
+    if display_collapsible_section("🌪️ Стресс-тестирование", expanded=False):
+        stress = results.get('stress_testing') or {}
+        scenarios = stress.get('scenarios')
+        if scenarios is None or scenarios.empty:
+            st.info("Нет данных стресс-тестирования")
+            return
+        
+        worst = scenarios['pnl'].idxmin()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Худший сценарий", worst)
+        with col2:
+            st.metric("Потери в худшем сценарии", f"{scenarios.loc[worst, 'pnl']:,.0f} ₽")
+        with col3:
+            st.metric("Доходность в худшем сценарии", f"{scenarios.loc[worst, 'return']:.1%}")
+        
+        st.plotly_chart(create_stress_test_chart(scenarios), use_container_width=True)
+        
+        scenario = st.selectbox("P&L по активам в сценарии:", list(scenarios.index),
+                                index=list(scenarios.index).index(worst), key='stress_scenario')
+        asset_pnl = stress['asset_pnl'].loc[scenario]
+        st.dataframe(pd.DataFrame({
+            'Актив': asset_pnl.index,
+            'Доходность': stress['asset_returns'].loc[scenario].map('{:.1%}'.format),
+            'P&L, ₽': asset_pnl.map('{:,.0f}'.format)
+        }), use_container_width=True, hide_index=True)
+        
+        with st.expander("🛠️ Свой сценарий"):
+            cols = st.columns(3)
+            factor_shocks = {}
+            for i, factor in enumerate(FACTORS):
+                with cols[i % 3]:
+                    factor_shocks[factor] = st.slider(FACTOR_LABELS[factor], min_value=-80, max_value=50,
+                                                      value=0, step=5, format='%d%%',
+                                                      key=f'stress_factor_{factor}') / 100
+            custom = ScenarioLibrary([StressScenario('Свой сценарий', 'custom', factor_shocks)])
+            custom_result = custom.run(results.portfolio_dict, stress['portfolio_value'], store=get_price_store())
+            custom_return = float(custom_result['scenarios']['return'].iloc[0])
+            st.metric("Результат сценария", f"{custom_return * stress['portfolio_value']:,.0f} ₽",
+                      f"{custom_return:.1%}")
+
+def display_portfolio_optimization(results: Dict, entitlement: Entitlement) -> None:
+    """Эффективная граница и рекомендуемая ребалансировка (оптимизация по Марковицу)"""
+    if 'portfolio_optimization' not in results or not entitlement.allows(ADVANCED_ANALYTICS):
+        return
+    
+    # Секция свернута по умолчанию: расчет выполняется только при раскрытии
+    if display_collapsible_section("📐 Оптимизация по Марковицу", expanded=False):
+        optimization = results.get('portfolio_optimization') or {}
+        if not optimization:
+            st.info("Для оптимизации нужно не менее двух активов")
+            return
+        
+        frontier = optimization['frontier']
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(
+            x=frontier['volatilities'], y=frontier['returns'], mode='lines',
+            name='Эффективная граница', line=dict(color='#2E86AB', width=3),
+            hovertemplate='Риск %{x:.1%}<br>Доходность %{y:.1%}<extra></extra>'
+        ))
+        for key, label, color in (('current', 'Текущий портфель', '#E74C3C'),
+                                  ('min_variance', 'Минимальный риск', '#27AE60'),
+                                  ('tangency', 'Максимальный Шарп', '#F39C12')):
+            point = optimization[key]
+            fig.add_trace(go.Scatter(
+                x=[point['volatility']], y=[point['expected_return']], mode='markers', name=label,
+                marker=dict(color=color, size=12),
+                hovertemplate=f'{label}<br>Риск %{{x:.1%}}<br>Доходность %{{y:.1%}}<extra></extra>'
+            ))
+        fig.update_layout(
+            title='📐 Эффективная граница',
+            xaxis_title='Годовая волатильность',
+            yaxis_title='Ожидаемая годовая доходность',
+            xaxis_tickformat='.0%',
+            yaxis_tickformat='.0%',
+            height=400,
+            template='plotly_white'
+        )
+        st.plotly_chart(fig, use_container_width=True)
+        
+        current, tangency = optimization['current'], optimization['tangency']
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Шарп: текущий → оптимальный", f"{current['sharpe_ratio']:.2f} → {tangency['sharpe_ratio']:.2f}")
+        with col2:
+            st.metric("Доходность оптимального", f"{tangency['expected_return']:.1%}")
+        with col3:
+            st.metric("Риск оптимального", f"{tangency['volatility']:.1%}")
+        
+        rebalance = optimization['optimal_rebalance']
+        if rebalance:
+            st.subheader("🔄 Рекомендуемая ребалансировка")
+            rebalance_df = pd.DataFrame({
+                'Актив': list(rebalance),
+                'Изменение доли': [f"{change:+.1%}" for change in rebalance.values()]
+            })
+            st.dataframe(rebalance_df, use_container_width=True, hide_index=True)
+
+def display_rebalancing_comparison(results: LazyAnalysisResults, entitlement: Entitlement) -> None:
+    """Интерактивное сравнение политик ребалансировки"""
+    if 'rebalancing_analysis' not in results or not entitlement.allows(ADVANCED_ANALYTICS):
+        return
+    
+    if display_collapsible_section("🔄 Сравнение политик ребалансировки", expanded=False):
+        cost_bps = st.slider("Издержки на сделку, б.п. от оборота", min_value=0, max_value=50,
+                             value=int(DEFAULT_COST_RATE * 10000), step=5, key='rebalancing_cost_bps')
+        comparison = results.rebalancing_comparison(cost_bps / 10000)
+        if comparison.empty:
+            st.info("Нет данных для сравнения")
+            return
+        
+        best = comparison['sharpe_ratio'].idxmax()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Лучшая политика по Шарпу", best)
+        with col2:
+            st.metric("Доходность после издержек", f"{comparison.loc[best, 'annual_return']:.2%}")
+        with col3:
+            st.metric("Потери на издержках", f"{comparison.loc[best, 'cost_drag']:.2%}")
+        
+        fig = go.Figure()
+        fig.add_trace(go.Bar(
+            x=comparison.index, y=comparison['annual_return'], name='Доходность после издержек',
+            marker_color='#2E86AB', hovertemplate='%{x}<br>%{y:.2%}<extra></extra>'
+        ))
+        fig.add_trace(go.Bar(
+            x=comparison.index, y=comparison['cost_drag'], name='Потери на издержках',
+            marker_color='#E74C3C', hovertemplate='%{x}<br>%{y:.2%}<extra></extra>'
+        ))
+        fig.update_layout(
+            title='🔄 Годовая доходность по политикам ребалансировки',
+            yaxis_tickformat='.1%',
+            barmode='group',
+            height=400,
+            template='plotly_white'
+        )
+        st.plotly_chart(fig, use_container_width=True)
+        
+        table = pd.DataFrame({
+            'Политика': comparison.index,
+            'Доходность': comparison['annual_return'].map('{:.2%}'.format),
+            'Волатильность': comparison['annual_volatility'].map('{:.2%}'.format),
+            'Шарп': comparison['sharpe_ratio'].map('{:.2f}'.format),
+            'Макс. просадка': comparison['max_drawdown'].map('{:.1%}'.format),
+            'Оборот в год': comparison['annual_turnover'].map('{:.0%}'.format),
+            'Ребалансировок в год': comparison['rebalances_per_year'].map('{:.1f}'.format)
+        })
+        st.dataframe(table, use_container_width=True, hide_index=True)
+
+def display_portfolio_quality(results: Dict, entitlement: Entitlement) -> None:
     """Адаптивное отображение качества портфеля"""
-    portfolio_quality = results.get('portfolio_quality', {})
-    if not portfolio_quality or subscription_level not in ['advanced', 'premium']:
+    if 'portfolio_quality' not in results or not entitlement.allows(ADVANCED_ANALYTICS):
         return
     
     if display_collapsible_section("🏆 Качество портфеля", expanded=True):
+        portfolio_quality = results.get('portfolio_quality') or {}
         if st.session_state.is_mobile:
             col1, col2 = st.columns(2)
             with col1:
@@ -1044,16 +784,19 @@ def display_portfolio_quality(results: Dict, subscription_level: str) -> None:
         correlation_matrix = portfolio_quality.get('correlation_matrix')
         if correlation_matrix is not None and not correlation_matrix.empty:
             st.subheader("📊 Матрица корреляций")
-            fig = px.imshow(correlation_matrix, 
-                           text_auto=True, 
-                           aspect="auto",
-                           color_continuous_scale='RdBu_r',
-                           title="Корреляция между активами")
-            st.plotly_chart(fig, use_container_width=True)
+            plotly_chart_cached(
+                'correlation_matrix',
+                lambda: px.imshow(correlation_matrix, 
+                                  text_auto=True, 
+                                  aspect="auto",
+                                  color_continuous_scale='RdBu_r',
+                                  title="Корреляция между активами"),
+                data_fingerprint(correlation_matrix)
+            )
 
-def display_premium_analytics(results: Dict, subscription_level: str) -> None:
+def display_premium_analytics(results: Dict, entitlement: Entitlement) -> None:
     """Адаптивная премиум аналитика"""
-    if subscription_level != 'premium':
+    if not entitlement.allows(PREMIUM_ANALYTICS):
         return
     
     if display_collapsible_section("💎 Премиум аналитика", expanded=True):
@@ -1086,53 +829,18 @@ def display_premium_analytics(results: Dict, subscription_level: str) -> None:
         if sectors:
             st.success("### 🌍 Отраслевая диверсификация")
             sector_df = pd.DataFrame(list(sectors.items()), columns=['Сектор', 'Доля'])
-            fig = px.pie(sector_df, values='Доля', names='Сектор', hole=0.4)
-            st.plotly_chart(fig, use_container_width=True)
-
-# БАЗОВЫЕ ФУНКЦИИ ДЛЯ РАБОТЫ С ДАННЫМИ (ваши функции полностью сохранены)
-def get_all_clients():
-    return ['Иван Петров', 'Мария Сидорова', 'Алексей Козлов', 'Елена Волкова', 'Дмитрий Смирнов']
-
-def get_client_details(client_name):
-    clients_data = {
-        'Иван Петров': {
-            'portfolio_type': 'агрессивный', 'risk_profile': 'очень высокий', 'investment_horizon': '15+ лет',
-            'experience': 'Эксперт', 'financial_goals': 'Создание технологического фонда', 'target_amount': 5000000,
-            'initial_investment': 500000
-        },
-        'Мария Сидорова': {
-            'portfolio_type': 'агрессивный', 'risk_profile': 'высокий', 'investment_horizon': '5-7 лет',
-            'experience': 'Начинающий', 'financial_goals': 'Накопление на жилье', 'target_amount': 800000,
-            'initial_investment': 300000
-        },
-        'Алексей Козлов': {
-            'portfolio_type': 'сбалансированный', 'risk_profile': 'умеренный', 'investment_horizon': '7-10 лет',
-            'experience': 'Продвинутый', 'financial_goals': 'Образование детей', 'target_amount': 2500000,
-            'initial_investment': 800000
-        },
-        'Елена Волкова': {
-            'portfolio_type': 'доходный', 'risk_profile': 'средний', 'investment_horizon': '10+ лет',
-            'experience': 'Опытный', 'financial_goals': 'Пассивный доход', 'target_amount': 4000000,
-            'initial_investment': 1200000
-        },
-        'Дмитрий Смирнов': {
-            'portfolio_type': 'ультра-консервативный', 'risk_profile': 'очень низкий', 'investment_horizon': '1-3 года',
-            'experience': 'Консервативный', 'financial_goals': 'Сохранение капитала', 'target_amount': 2200000,
-            'initial_investment': 2000000
-        }
-    }
-    return clients_data.get(client_name, clients_data['Алексей Козлов'])
-
-def get_portfolio_by_client(client_name):
-    portfolios = {
-        'Иван Петров': {'TSLA': 0.25, 'NVDA': 0.20, 'AMD': 0.15, 'ARKK': 0.15, 'SQ': 0.10, 'BTC-USD': 0.10, 'ETH-USD': 0.05},
-        'Мария Сидорова': {'TSLA': 0.30, 'NVDA': 0.25, 'AMD': 0.20, 'ARKK': 0.15, 'BTC-USD': 0.10},
-        'Алексей Козлов': {'VTI': 0.25, 'VXUS': 0.15, 'BND': 0.20, 'VNQ': 0.10, 'GLD': 0.08, 'AAPL': 0.07, 'MSFT': 0.07, 'JPM': 0.05, 'Cash': 0.03},
-        'Елена Волкова': {'VYM': 0.20, 'SCHD': 0.18, 'T': 0.10, 'VZ': 0.09, 'XOM': 0.08, 'PFE': 0.08, 'JNJ': 0.07, 'PG': 0.07, 'O': 0.06, 'Cash': 0.07},
-        'Дмитрий Смирнов': {'BND': 0.40, 'GOVT': 0.25, 'SHY': 0.15, 'JNJ': 0.08, 'PG': 0.07, 'Cash': 0.05}
-    }
-    return portfolios.get(client_name, portfolios['Алексей Козлов'])
-
+            plotly_chart_cached('sector_pie', lambda: px.pie(sector_df, values='Доля', names='Сектор', hole=0.4),
+                                data_fingerprint(sector_df))
+        
+        asset_classes = results.get('portfolio_quality', {}).get('asset_class_diversification', {})
+        if asset_classes:
+            st.success("### 🧱 Классы активов")
+            asset_class_df = pd.DataFrame(list(asset_classes.items()), columns=['Класс активов', 'Доля'])
+            plotly_chart_cached('asset_class_pie',
+                                lambda: px.pie(asset_class_df, values='Доля', names='Класс активов', hole=0.4),
+                                data_fingerprint(asset_class_df))
+
+# БАЗОВЫЕ ФУНКЦИИ ДЛЯ РАБОТЫ С ДАННЫМИ
 def generate_subscription_based_recommendations(client_name):
     return [
         "🎯 **Оптимизация портфеля**: Рекомендуется ребалансировка раз в квартал",
@@ -1140,46 +848,6 @@ def generate_subscription_based_recommendations(client_name):
         "💡 **Обучение**: Изучайте финансовые рынки для лучших решений"
     ]
 
-def get_subscription_level(client_name):
-    subscriptions = {
-        'Иван Петров': 'premium',
-        'Мария Сидорова': 'advanced', 
-        'Алексей Козлов': 'basic',
-        'Елена Волкова': 'basic',
-        'Дмитрий Смирнов': 'basic'
-    }
-    return subscriptions.get(client_name, 'basic')
-
-def get_subscription_details(client_name):
-    level = get_subscription_level(client_name)
-    details = {
-        'basic': {'name': 'Базовый', 'price': 0, 'expires': '2024-12-31'},
-        'advanced': {'name': 'Продвинутый', 'price': 450, 'expires': '2024-11-30'},
-        'premium': {'name': 'Премиум', 'price': 800, 'expires': '2024-12-31'}
-    }
-    return details.get(level, details['basic'])
-
-def can_access_advanced_analytics(client_name):
-    return get_subscription_level(client_name) in ['advanced', 'premium']
-
-def can_access_premium_features(client_name):
-    return get_subscription_level(client_name) == 'premium'
-
-SUBSCRIPTION_FEATURES = {
-    'basic': {
-        'name': 'Базовый', 'price': 0,
-        'features': ['Базовые метрики', 'Рекомендации AI', 'Визуализация портфеля']
-    },
-    'advanced': {
-        'name': 'Продвинутый', 'price': 450,
-        'features': ['Все функции Базового', 'Расширенная аналитика', 'Глубокий анализ рисков']
-    },
-    'premium': {
-        'name': 'Премиум', 'price': 800,
-        'features': ['Все функции Продвинутого', 'AI-прогнозы', 'Персональный советник']
-    }
-}
-
 # ФУНКЦИЯ ДЕТЕКЦИИ УСТРОЙСТВ (ваша функция полностью сохранена)
 def detect_device_type():
     """Определяет тип устройства на основе user agent"""
@@ -1238,208 +906,6 @@ def setup_page_config():
         st.session_state.is_mobile = False
         st.session_state.is_tablet = False
 
-# АДАПТИВНЫЙ CSS ДЛЯ РАЗНЫХ УСТРОЙСТВ (ваш CSS полностью сохранен)
-def inject_adaptive_css():
-    """Внедряет адаптивный CSS для разных устройств"""
-    st.markdown("""
-    <style>
-    /* Базовые стили для всех устройств */
-    .tooltip {
-        position: relative;
-        display: inline-block;
-        cursor: pointer;
-    }
-
-    .tooltip-icon {
-        color: #666;
-        font-size: 1.1em;
-        padding: 4px 8px;
-        border-radius: 50%;
-        background: #f0f0f0;
-        transition: all 0.3s ease;
-    }
-
-    .tooltip-icon:hover {
-        background: #e0e0e0;
-        transform: scale(1.1);
-    }
-
-    .tooltip-content {
-        visibility: hidden;
-        width: 280px;
-        background-color: #2d3748;
-        color: white;
-        text-align: left;
-        border-radius: 8px;
-        padding: 12px;
-        position: absolute;
-        z-index: 1000;
-        bottom: 125%;
-        left: 50%;
-        transform: translateX(-50%);
-        opacity: 0;
-        transition: opacity 0.3s;
-        font-size: 0.85em;
-        line-height: 1.5;
-        box-shadow: 0 4px 12px rgba(0,0,0,0.2);
-        border: 1px solid #4a5568;
-        white-space: pre-line;
-    }
-
-    .tooltip-content::after {
-        content: "";
-        position: absolute;
-        top: 100%;
-        left: 50%;
-        margin-left: -5px;
-        border-width: 5px;
-        border-style: solid;
-        border-color: #2d3748 transparent transparent transparent;
-    }
-
-    .tooltip:hover .tooltip-content {
-        visibility: visible;
-        opacity: 1;
-    }
-
-    .subscription-badge {
-        padding: 4px 12px;
-        border-radius: 20px;
-        font-size: 0.8em;
-        font-weight: bold;
-        text-align: center;
-    }
-
-    .badge-basic {
-        background: linear-gradient(135deg, #11998e, #38ef7d);
-        color: white;
-    }
-
-    .badge-advanced {
-        background: linear-gradient(135deg, #fc466b, #3f5efb);
-        color: white;
-    }
-
-    .badge-premium {
-        background: linear-gradient(135deg, #ffd700, #ff8c00);
-        color: black;
-    }
-
-    /* Адаптивные стили для мобильных устройств */
-    @media (max-width: 768px) {
-        .main-title {
-            font-size: 1.5rem !important;
-        }
-        
-        .metric-row {
-            flex-direction: column;
-        }
-        
-        .metric-card {
-            margin-bottom: 0.5rem;
-            width: 100% !important;
-        }
-        
-        /* Улучшаем отображение графиков на мобильных */
-        .js-plotly-plot .plotly .modebar {
-            display: none !important;
-        }
-        
-        /* Увеличиваем кнопки для touch */
-        .stButton button {
-            min-height: 44px;
-            font-size: 16px;
-        }
-        
-        /* Улучшаем читаемость текста */
-        .stMarkdown {
-            font-size: 14px;
-        }
-        
-        /* Адаптивные колонки */
-        .block-container {
-            padding: 1rem;
-        }
-    }
-
-    /* Стили для планшетов */
-    @media (min-width: 769px) and (max-width: 1024px) {
-        .main-title {
-            font-size: 2rem !important;
-        }
-        
-        .metric-card {
-            min-width: 45% !important;
-        }
-    }
-
-    /* Стили для десктопов */
-    @media (min-width: 1025px) {
-        .main-title {
-            font-size: 2.5rem !important;
-        }
-        
-        .metric-card {
-            min-width: 22% !important;
-        }
-    }
-
-    /* Улучшенные стили для сворачиваемых секций */
-    .collapsible-section {
-        border: 1px solid #e0e0e0;
-        border-radius: 10px;
-        padding: 1rem;
-        margin: 1rem 0;
-        background: white;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-    }
-
-    .collapsible-header {
-        display: flex;
-        justify-content: space-between;
-        align-items: center;
-        cursor: pointer;
-        padding: 0.5rem 0;
-    }
-
-    .collapsible-content {
-        margin-top: 1rem;
-    }
-
-    /* Стили для страницы входа */
-    .login-container {
-        max-width: 90%;
-        width: 400px;
-        margin: 5vh auto;
-        padding: 2rem;
-        background: white;
-        border-radius: 20px;
-        box-shadow: 0 10px 30px rgba(0,0,0,0.1);
-        text-align: center;
-    }
-    .main-title {
-        font-size: clamp(1.8rem, 5vw, 2.8rem);
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        margin-bottom: 0.5rem;
-        font-weight: bold;
-    }
-    .subtitle {
-        color: #666;
-        margin-bottom: 2rem;
-        font-size: clamp(0.9rem, 3vw, 1.2rem);
-    }
-    
-    @media (max-width: 768px) {
-        .login-container {
-            margin: 2vh auto;
-            padding: 1.5rem;
-        }
-    }
-    </style>
-    """, unsafe_allow_html=True)
-
 def init_session_state():
     """Инициализация состояния сессии"""
     if 'authenticated' not in st.session_state:
@@ -1523,7 +989,7 @@ def display_sidebar_content(current_client: str):
     st.markdown("---")
     clients = get_all_clients()
     new_user = st.selectbox("👥 Выберите клиента:", clients, 
-                          index=clients.index(current_client))
+                          index=clients.index(current_client) if current_client in clients else 0)
     
     if new_user != current_client:
         st.session_state.current_user = new_user
@@ -1532,36 +998,32 @@ def display_sidebar_content(current_client: str):
     st.markdown("---")
     
     st.subheader("📊 Статистика")
-    portfolio_dict = get_portfolio_by_client(current_client)
+    profile = get_client_profile(current_client)
     
-    if st.session_state.is_mobile:
+    if profile:
         col1, col2 = st.columns(2)
         with col1:
-            st.metric("Активы", len(portfolio_dict))
+            st.metric("Активы", len(profile.portfolio))
         with col2:
-            client_data = get_client_details(current_client)
-            st.metric("Риск", client_data['risk_profile'])
-    else:
-        col1, col2 = st.columns(2)
-        with col1:
-            st.metric("Активы", len(portfolio_dict))
-        with col2:
-            client_data = get_client_details(current_client)
-            st.metric("Риск", client_data['risk_profile'])
+            st.metric("Риск", profile.risk_profile)
     
     display_subscription_status(current_client)
     
     st.markdown("---")
     
     st.subheader("🤖 Советы")
-    recommendations = generate_subscription_based_recommendations(current_client)
+    try:
+        recommendations = generate_subscription_based_recommendations(current_client)
+    except Exception as e:
+        st.error(f"Ошибка загрузки советов: {e}")
+        recommendations = []
     for rec in recommendations[:2]:
         st.info(rec)
 
 def display_subscription_status(client_name: str):
     """Отображение статуса подписки"""
-    subscription_level = get_subscription_level(client_name)
     subscription_details = get_subscription_details(client_name)
+    subscription_level = subscription_details['level']
     
     st.sidebar.markdown("---")
     st.sidebar.subheader("💎 Ваша подписка")
@@ -1618,18 +1080,16 @@ def show_feature_unlock_prompt(feature_name: str, required_level: str, client_na
 def adaptive_dashboard_page():
     """Адаптивная главная страница дашборда"""
     current_client = st.session_state.current_user
-    client_data = get_client_details(current_client)
-    portfolio_dict = get_portfolio_by_client(current_client)
-    subscription_level = get_subscription_level(current_client)
+    profile = get_client_profile(current_client)
+    # Права читаются один раз за рендер; дальше все проверки доступа - битовые
+    entitlement = get_entitlement(current_client)
     
-    if not client_data or not portfolio_dict:
+    if not profile or not profile.portfolio:
         st.error("❌ Ошибка загрузки данных")
         return
+    portfolio_dict = dict(profile.portfolio)
     
-    has_advanced_access = can_access_advanced_analytics(current_client)
-    has_premium_access = can_access_premium_features(current_client)
-    
-    badge_html = display_subscription_badge(subscription_level)
+    badge_html = display_subscription_badge(entitlement.level)
     
     # Адаптивный заголовок с современным дизайном
     if st.session_state.is_mobile:
@@ -1668,7 +1128,7 @@ def adaptive_dashboard_page():
         with col1:
             st.markdown(f'<div style="font-size: 1.2rem;">👤 <strong>{current_client}</strong></div>', unsafe_allow_html=True)
         with col2:
-            st.metric("Инвестиции", f"{client_data['initial_investment']:,.0f} ₽")
+            st.metric("Инвестиции", f"{profile.initial_investment:,.0f} ₽")
         with col3:
             if st.button("🚪 Выйти", use_container_width=True, type="secondary"):
                 st.session_state.authenticated = False
@@ -1680,56 +1140,58 @@ def adaptive_dashboard_page():
     # Адаптивный профиль клиента
     st.markdown('<div class="modern-section-header">👤 Профиль клиента</div>', unsafe_allow_html=True)
     
+    # Целевая сумма в профиле может быть не задана (NULL)
+    target_text = f"{profile.target_amount:,.0f} ₽" if profile.target_amount else "Н/Д"
     if st.session_state.is_mobile:
-        st.write(f"**Тип портфеля:** {client_data['portfolio_type']}")
-        st.write(f"**Уровень риска:** {client_data['risk_profile']}")
-        st.write(f"**Инвестиционный горизонт:** {client_data['investment_horizon']}")
-        st.write(f"**Опыт:** {client_data['experience']}")
-        st.write(f"**Цель:** {client_data['financial_goals']}")
-        st.write(f"**Целевая сумма:** {client_data['target_amount']:,.0f} ₽")
+        st.write(f"**Тип портфеля:** {profile.portfolio_type}")
+        st.write(f"**Уровень риска:** {profile.risk_profile}")
+        st.write(f"**Инвестиционный горизонт:** {profile.investment_horizon}")
+        st.write(f"**Опыт:** {profile.experience}")
+        st.write(f"**Цель:** {profile.financial_goals}")
+        st.write(f"**Целевая сумма:** {target_text}")
     else:
         col1, col2 = st.columns(2)
         with col1:
-            st.write(f"**Тип портфеля:** {client_data['portfolio_type']}")
-            st.write(f"**Уровень риска:** {client_data['risk_profile']}")
-            st.write(f"**Инвестиционный горизонт:** {client_data['investment_horizon']}")
+            st.write(f"**Тип портфеля:** {profile.portfolio_type}")
+            st.write(f"**Уровень риска:** {profile.risk_profile}")
+            st.write(f"**Инвестиционный горизонт:** {profile.investment_horizon}")
         with col2:
-            st.write(f"**Опыт:** {client_data['experience']}")
-            st.write(f"**Цель:** {client_data['financial_goals']}")
-            st.write(f"**Целевая сумма:** {client_data['target_amount']:,.0f} ₽")
+            st.write(f"**Опыт:** {profile.experience}")
+            st.write(f"**Цель:** {profile.financial_goals}")
+            st.write(f"**Целевая сумма:** {target_text}")
     
     # Адаптивный обзор портфеля
     st.markdown('<div class="modern-section-header">📊 Обзор портфеля</div>', unsafe_allow_html=True)
     
     weights_df = pd.DataFrame(list(portfolio_dict.items()), columns=['Актив', 'Доля'])
+    build_weights_pie = lambda: px.pie(weights_df, values='Доля', names='Актив', hole=0.3)
     
     if st.session_state.is_mobile:
         st.dataframe(weights_df, use_container_width=True, hide_index=True)
-        fig_pie = px.pie(weights_df, values='Доля', names='Актив', hole=0.3)
-        st.plotly_chart(fig_pie, use_container_width=True)
+        plotly_chart_cached('weights_pie', build_weights_pie, data_fingerprint(weights_df))
     else:
         col1, col2 = st.columns([1, 2])
         with col1:
-            fig_pie = px.pie(weights_df, values='Доля', names='Актив', hole=0.3)
-            st.plotly_chart(fig_pie, use_container_width=True)
+            plotly_chart_cached('weights_pie', build_weights_pie, data_fingerprint(weights_df))
         with col2:
             st.dataframe(weights_df, use_container_width=True, hide_index=True)
     
     # Анализ портфеля
     with st.spinner("🔍 Проводим комплексный анализ портфеля..."):
-        analyzer = AdvancedPortfolioAnalysis(portfolio_dict, current_client)
-        results = analyzer.comprehensive_analysis()
+        results = run_portfolio_analysis(portfolio_dict, current_client)
     
     if results:
-        display_portfolio_analysis(results, subscription_level)
-        display_efficiency_metrics(results, subscription_level)
-        display_advanced_risk_analysis(results, subscription_level)
-        display_portfolio_quality(results, subscription_level)
+        display_portfolio_analysis(results, entitlement)
+        display_efficiency_metrics(results, entitlement)
+        display_advanced_risk_analysis(results, entitlement)
+        display_portfolio_optimization(results, entitlement)
+        display_portfolio_quality(results, entitlement)
         
         st.markdown("---")
         display_historical_performance(results, current_client)
+        display_goal_planning(results)
         
-        display_premium_analytics(results, subscription_level)
+        display_premium_analytics(results, entitlement)
         
         st.markdown('<div class="modern-section-header">📋 Детальные рекомендации</div>', unsafe_allow_html=True)
         for recommendation in results.get('recommendations', []):
@@ -1740,37 +1202,40 @@ def adaptive_dashboard_page():
 def adaptive_advanced_analytics_page():
     """Адаптивная страница расширенной аналитики"""
     current_client = st.session_state.current_user
-    subscription_level = get_subscription_level(current_client)
+    entitlement = get_entitlement(current_client)
     
     st.markdown('<div class="modern-section-header">📈 Расширенная аналитика</div>', unsafe_allow_html=True)
     
-    if not can_access_advanced_analytics(current_client):
+    if not entitlement.allows(ADVANCED_ANALYTICS):
         show_feature_unlock_prompt("Расширенная аналитика", "advanced", current_client)
         return
     
     st.success(f"🎯 У вас есть доступ к расширенной аналитике!")
     
-    client_data = get_client_details(current_client)
-    portfolio_dict = get_portfolio_by_client(current_client)
+    profile = get_client_profile(current_client)
+    portfolio_dict = dict(profile.portfolio) if profile else {}
     
     if not portfolio_dict:
         st.error("❌ Не удалось загрузить портфель")
         return
     
     with st.spinner("🔍 Проводим углубленный анализ портфеля..."):
-        analyzer = AdvancedPortfolioAnalysis(portfolio_dict, current_client)
-        results = analyzer.comprehensive_analysis()
+        results = run_portfolio_analysis(portfolio_dict, current_client)
     
     if results:
-        display_portfolio_analysis(results, subscription_level)
-        display_efficiency_metrics(results, subscription_level)
-        display_advanced_risk_analysis(results, subscription_level)
-        display_portfolio_quality(results, subscription_level)
+        display_portfolio_analysis(results, entitlement)
+        display_efficiency_metrics(results, entitlement)
+        display_advanced_risk_analysis(results, entitlement)
+        display_stress_testing(results, entitlement)
+        display_portfolio_optimization(results, entitlement)
+        display_rebalancing_comparison(results, entitlement)
+        display_portfolio_quality(results, entitlement)
         
         st.markdown("---")
         display_historical_performance(results, current_client)
+        display_goal_planning(results)
         
-        display_premium_analytics(results, subscription_level)
+        display_premium_analytics(results, entitlement)
         
         st.markdown('<div class="modern-section-header">📋 Детальные рекомендации</div>', unsafe_allow_html=True)
         for recommendation in results.get('recommendations', []):
@@ -1830,7 +1295,7 @@ def main():
     setup_page_config()
     setup_modern_design()  # Добавляем современный дизайн
     init_session_state()
-    inject_adaptive_css()
+    inject_styles()  # Стили из styles/ - короткой ссылкой на статический файл
     
     if not st.session_state.authenticated:
         login_page()
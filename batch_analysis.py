@@ -0,0 +1,229 @@
+# batch_analysis.py - пакетный анализ всей клиентской базы матричными операциями
+
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from database import PortfolioDatabase, get_database, get_ticker_index
+from rolling_stats import RollingStatsPipeline
+from portfolio_types import DEFAULT_PORTFOLIO_TYPE, RETURN_PARAMS, classify_portfolios
+from simulation import HistoricalSimulator, get_simulator
+from stress_scenarios import SCENARIO_LIBRARY, ScenarioLibrary
+
+class BatchPortfolioAnalyzer:
+    """
+    Анализ тысяч портфелей за один проход NumPy.
+
+    Портфели задаются матрицей весов (клиенты x тикеры). Признаки тикеров
+    (ключевые слова типа, вес риска) считаются один раз на тикер, после чего
+    тип и риск всех портфелей - это умножение матрицы весов на вектор, а
+    доходность, волатильность и просадки считаются по матрицам истории
+    (периоды x клиенты) блоками по chunk_size клиентов: хранятся только
+    свертки по клиентам, а не история целиком.
+
+    Синтетическая история генерируется одним генератором на всю выборку,
+    поэтому ряды отдельных клиентов не совпадают с AdvancedPortfolioAnalysis,
+    где зерно берется из имени клиента.
+    """
+
+    def __init__(self, client_names: List[str], tickers: List[str], weights: np.ndarray,
+                 simulator: Optional[HistoricalSimulator] = None, seed: Optional[int] = None,
+                 initial_investment: float = 1000000, chunk_size: int = 10000):
+        weights = np.asarray(weights, dtype=float)
+        if weights.shape != (len(client_names), len(tickers)):
+            raise ValueError(f"Матрица весов {weights.shape} не соответствует "
+                             f"{len(client_names)} клиентам и {len(tickers)} тикерам")
+        self.client_names = list(client_names)
+        self.tickers = list(tickers)
+        self.weights = weights
+        self.simulator = simulator or get_simulator()
+        self.seed = seed
+        # Зерно фиксируется, чтобы каждый проход по блокам давал ту же историю
+        self._entropy = seed if seed is not None else np.random.SeedSequence().entropy
+        self.initial_investment = initial_investment
+        self.chunk_size = chunk_size
+        self.ticker_ids = get_ticker_index().lookup(self.tickers)
+        self._summary: Optional[Dict[str, np.ndarray]] = None
+        self._rolling: Optional[RollingStatsPipeline] = None
+
+    @classmethod
+    def from_portfolios(cls, portfolios: Dict[str, Dict[str, float]], **kwargs) -> 'BatchPortfolioAnalyzer':
+        """Строит матрицу весов из словаря {клиент: {тикер: вес}}"""
+        client_names = list(portfolios)
+        ticker_ids: Dict[str, int] = {}
+        rows: List[int] = []
+        cols: List[int] = []
+        values: List[float] = []
+        for row, portfolio in enumerate(portfolios.values()):
+            for ticker, weight in (portfolio or {}).items():
+                rows.append(row)
+                cols.append(ticker_ids.setdefault(ticker, len(ticker_ids)))
+                values.append(weight)
+
+        weights = np.zeros((len(client_names), len(ticker_ids)))
+        np.add.at(weights, (np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)), values)
+        return cls(client_names, list(ticker_ids), weights, **kwargs)
+
+    @classmethod
+    def from_database(cls, db: Optional[PortfolioDatabase] = None,
+                      names: Optional[List[str]] = None, **kwargs) -> 'BatchPortfolioAnalyzer':
+        """Загружает портфели из PortfolioDatabase одним запросом"""
+        db = db or get_database()
+        return cls.from_portfolios(dict(db.iter_portfolios(names)), **kwargs)
+
+    @classmethod
+    def from_clients(cls, client_names: Iterable[str],
+                     loader: Callable[[str], Optional[Dict[str, float]]], **kwargs) -> 'BatchPortfolioAnalyzer':
+        """Строит анализатор по списку клиентов и функции загрузки портфеля
+        (например, get_portfolio_by_client)"""
+        return cls.from_portfolios({name: loader(name) or {} for name in client_names}, **kwargs)
+
+    # ПРИЗНАКИ ПОРТФЕЛЕЙ
+
+    def type_scores(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Доли агрессивных и защитных активов для всех клиентов"""
+        index = get_ticker_index()
+        aggressive = self.weights @ index.mask(self.ticker_ids, 'aggressive')
+        conservative = self.weights @ index.mask(self.ticker_ids, 'conservative')
+        return aggressive, conservative
+
+    def portfolio_types(self) -> np.ndarray:
+        """Тип портфеля для каждого клиента"""
+        return classify_portfolios(*self.type_scores())
+
+    def exposures(self, attribute: str = 'sector') -> pd.DataFrame:
+        """Доли секторов (или другого атрибута справочника тикеров) для всех клиентов"""
+        index = get_ticker_index()
+        rows, cols = np.nonzero(self.weights)
+        totals = index.exposures(attribute, rows, self.ticker_ids[cols], self.weights[rows, cols],
+                                 len(self.client_names))
+        used = totals.any(axis=0)
+        return pd.DataFrame(totals[:, used], index=pd.Index(self.client_names, name='client'),
+                            columns=[c for c, keep in zip(index.categories[attribute], used) if keep])
+
+    def risk_scores(self) -> np.ndarray:
+        """Упрощенный риск портфеля (как calculate_portfolio_risk) для всех клиентов"""
+        return np.minimum(self.weights @ get_ticker_index().risk_weights[self.ticker_ids], 1.0)
+
+    # ИСТОРИЯ И МЕТРИКИ
+
+    def _simulated_chunks(self) -> Iterator[Tuple[slice, np.ndarray]]:
+        """Синтетические доходности блоками клиентов: (клиенты блока, матрица периоды x клиенты блока)"""
+        type_names = list(RETURN_PARAMS)
+        means = np.array([RETURN_PARAMS[name]['mean'] for name in type_names])
+        stds = np.array([RETURN_PARAMS[name]['std'] for name in type_names])
+        # Индекс параметров для каждого клиента: поиск по словарю только для уникальных типов
+        unique_types, inverse = np.unique(self.portfolio_types(), return_inverse=True)
+        default = type_names.index(DEFAULT_PORTFOLIO_TYPE)
+        type_index = np.array([type_names.index(t) if t in RETURN_PARAMS else default
+                               for t in unique_types], dtype=np.intp)[inverse]
+
+        rng = np.random.default_rng(self._entropy)
+        for start in range(0, len(self.client_names), self.chunk_size):
+            block = slice(start, min(start + self.chunk_size, len(self.client_names)))
+            yield block, self.simulator.simulate_returns(means[type_index[block]], stds[type_index[block]], rng)
+
+    def history(self) -> Dict[str, np.ndarray]:
+        """
+        Синтетическая история всех портфелей: матрицы (периоды x клиенты).
+        Матрицы не кэшируются; метрики, годовая доходность и скользящие
+        статистики берутся из summary() без построения истории целиком.
+        """
+        returns = np.empty((self.simulator.n_periods, len(self.client_names)))
+        for block, block_returns in self._simulated_chunks():
+            returns[:, block] = block_returns
+        return {'returns': returns, 'growth': np.cumprod(1.0 + returns, axis=0)}
+
+    def summary(self) -> Dict[str, np.ndarray]:
+        """
+        Свертки истории по клиентам за один проход по блокам: итоговый рост,
+        волатильность и максимальная просадка (векторы по клиентам), годовая
+        доходность (годы x клиенты) и состояние скользящих статистик. В памяти
+        одновременно только история одного блока.
+        """
+        if self._summary is None:
+            n_clients = len(self.client_names)
+            years = self.simulator.dates.year.to_numpy()
+            unique_years, first = np.unique(years, return_index=True)
+            last = np.append(first[1:], len(years)) - 1
+            summary = {
+                'final_growth': np.empty(n_clients),
+                'volatility': np.empty(n_clients),
+                'max_drawdown': np.empty(n_clients),
+                'years': unique_years,
+                'annual_returns': np.empty((len(unique_years), n_clients))
+            }
+            rolling = RollingStatsPipeline(n_clients, periods_per_year=self.simulator.periods_per_year,
+                                           names=self.client_names)
+            for block, returns in self._simulated_chunks():
+                growth = np.cumprod(1.0 + returns, axis=0)
+                summary['final_growth'][block] = growth[-1]
+                summary['volatility'][block] = returns.std(axis=0, ddof=1)
+                summary['max_drawdown'][block] = (growth / np.maximum.accumulate(growth, axis=0) - 1.0).min(axis=0)
+                summary['annual_returns'][:, block] = (growth[last] / growth[first] - 1.0) * 100
+                rolling.seed_history(self.initial_investment * growth, returns, block)
+            self._summary = summary
+            if self._rolling is None:
+                self._rolling = rolling
+        return self._summary
+
+    def metrics(self) -> pd.DataFrame:
+        """Тип, риск, доходность, волатильность, Шарп и просадка для всех клиентов"""
+        summary = self.summary()
+        final_growth = summary['final_growth']
+        periods_per_year = self.simulator.periods_per_year
+
+        annual_return = np.power(final_growth, periods_per_year / self.simulator.n_periods) - 1.0
+        annual_volatility = summary['volatility'] * np.sqrt(periods_per_year)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sharpe_ratio = np.where(annual_volatility > 0, annual_return / annual_volatility, 0.0)
+
+        return pd.DataFrame({
+            'portfolio_type': self.portfolio_types(),
+            'risk_score': self.risk_scores(),
+            'annual_return': annual_return,
+            'annual_volatility': annual_volatility,
+            'sharpe_ratio': sharpe_ratio,
+            'max_drawdown': summary['max_drawdown'],
+            'total_return': final_growth - 1.0,
+            'current_value': self.initial_investment * final_growth
+        }, index=pd.Index(self.client_names, name='client'))
+
+    def annual_returns(self) -> pd.DataFrame:
+        """Годовая доходность в % (годы x клиенты), как calculate_annual_returns"""
+        summary = self.summary()
+        return pd.DataFrame(summary['annual_returns'], index=pd.Index(summary['years'], name='Year'),
+                            columns=self.client_names)
+
+    def drawdowns(self) -> np.ndarray:
+        """Текущая просадка в % на каждую дату (периоды x клиенты); строит историю целиком"""
+        growth = self.history()['growth']
+        return (growth / np.maximum.accumulate(growth, axis=0) - 1.0) * 100
+
+    # ИНКРЕМЕНТАЛЬНЫЕ СТАТИСТИКИ
+
+    def rolling_stats(self) -> RollingStatsPipeline:
+        """Состояние скользящих статистик всех клиентов после истории (заполняется в summary)"""
+        if self._rolling is None:
+            self.summary()
+        return self._rolling
+
+    def append_period(self, period_returns: np.ndarray) -> pd.DataFrame:
+        """
+        Добавляет один период доходностей (по значению на клиента) и обновляет
+        статистики за O(1) на клиента, без пересчета истории.
+        История при этом не пересчитывается.
+        """
+        pipeline = self.rolling_stats()
+        values = pipeline.last_value * (1.0 + np.asarray(period_returns, dtype=float))
+        stats = pipeline.update(values, period_returns)
+        return pd.DataFrame(stats, index=pd.Index(self.client_names, name='client'))
+
+    # СТРЕСС-ТЕСТЫ
+
+    def stress_test(self, library: ScenarioLibrary = SCENARIO_LIBRARY, store=None) -> pd.DataFrame:
+        """Доходность всех портфелей во всех сценариях (клиенты x сценарии): одно умножение матриц"""
+        returns = library.portfolio_returns(self.weights, self.tickers, store)
+        return pd.DataFrame(returns, index=pd.Index(self.client_names, name='client'),
+                            columns=pd.Index(library.names, name='scenario'))
@@ -0,0 +1,430 @@
+# batch_report.py - ночной отчет по всей клиентской базе: параллельный анализ с контрольными точками
+
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from analysis import AdvancedPortfolioAnalysis, AnalysisRequest, LazyAnalysisResults
+from database import generate_subscription_based_recommendations, get_all_clients, get_client_profile, get_entitlement
+from result_cache import content_key
+
+logger = logging.getLogger(__name__)
+
+# Секции анализа в отчете по умолчанию (в строку попадают их скалярные показатели)
+REPORT_SECTIONS = ('basic_metrics', 'efficiency_metrics', 'risk_metrics', 'portfolio_quality', 'goal_planning')
+
+# Клиентов в одной задаче пула и задач в работе на один процесс
+DEFAULT_CHUNK_SIZE = 25
+CHUNKS_PER_WORKER = 2
+
+FORMATS = ('csv', 'jsonl', 'parquet')
+STAGES = ('load', 'analysis', 'recommendations')
+
+# Разделитель рекомендаций в плоских форматах (CSV, Parquet)
+RECOMMENDATION_SEPARATOR = '\n'
+
+def _scalar(value: Any) -> Any:
+    """Скалярное значение для колонки отчета или None для вложенных структур"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, (bool, int, float, str)):
+        return value
+    return None
+
+def client_report_row(client_name: str, request: AnalysisRequest, timings: Dict[str, float]) -> Dict[str, Any]:
+    """Строка отчета по клиенту: профиль, скалярные показатели секций и рекомендации"""
+    started = time.perf_counter()
+    profile = get_client_profile(client_name)
+    row: Dict[str, Any] = {'client': client_name}
+    if profile is None or not profile.portfolio:
+        timings['load'] += time.perf_counter() - started
+        row['error'] = "Клиент или портфель не найден"
+        return row
+
+    row.update({
+        'portfolio_name': profile.portfolio_name,
+        'subscription': get_entitlement(client_name).level,
+        'n_assets': len(profile.portfolio)
+    })
+    checkpoint = time.perf_counter()
+    timings['load'] += checkpoint - started
+
+    # Кэш результатов в пакетном режиме не нужен: каждый клиент считается один раз
+    results = LazyAnalysisResults(dict(profile.portfolio), client_name, request)
+    for section in results:
+        for key, value in results[section].items():
+            value = _scalar(value)
+            if value is not None:
+                row[f"{section}.{key}"] = value
+    now = time.perf_counter()
+    timings['analysis'] += now - checkpoint
+
+    row['recommendations'] = generate_subscription_based_recommendations(client_name)
+    timings['recommendations'] += time.perf_counter() - now
+    return row
+
+def analyze_chunk(chunk_id: int, client_names: Sequence[str],
+                  sections: Sequence[str]) -> Tuple[int, List[Dict[str, Any]], Dict[str, float]]:
+    """Задача процесса пула: строки отчета по пачке клиентов и время этапов"""
+    request = AnalysisRequest(sections)
+    timings: Dict[str, float] = defaultdict(float)
+    rows = []
+    for client_name in client_names:
+        try:
+            rows.append(client_report_row(client_name, request, timings))
+        except Exception as e:
+            logger.error(f"Ошибка анализа клиента '{client_name}': {e}")
+            rows.append({'client': client_name, 'error': str(e)})
+    return chunk_id, rows, dict(timings)
+
+# СХЕМА ОТЧЕТА
+
+# Колонки отчета и их типы: первые - про клиента, последние - рекомендации и ошибка
+BASE_COLUMNS = {'client': 'string', 'portfolio_name': 'string', 'subscription': 'string', 'n_assets': 'int'}
+TAIL_COLUMNS = {'recommendations': 'string', 'error': 'string'}
+
+# Сколько клиентов можно проанализировать, чтобы найти колонки всех секций
+PROBE_LIMIT = 20
+
+def _column_type(value: Any) -> str:
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, (int, float)):
+        return 'float'
+    return 'string'
+
+def report_schema(client_names: Sequence[str], sections: Sequence[str],
+                  probe_limit: int = PROBE_LIMIT) -> Dict[str, str]:
+    """
+    Колонки отчета ({имя: тип}) до начала прогона.
+
+    Состав показателей секции зависит от данных (например, прогноз цели
+    пуст без целевой суммы), поэтому клиенты анализируются по порядку,
+    пока не будут получены непустые строки всех секций. Схема сохраняется
+    в контрольной точке и не меняется до конца прогона.
+    """
+    request = AnalysisRequest(sections)
+    timings: Dict[str, float] = defaultdict(float)
+    section_columns: Dict[str, str] = {}
+    remaining = set(sections)
+    for client_name in client_names[:probe_limit]:
+        try:
+            row = client_report_row(client_name, request, timings)
+        except Exception as e:
+            logger.warning(f"Клиент '{client_name}' пропущен при определении колонок отчета: {e}")
+            continue
+        if 'error' in row:
+            continue
+        for key, value in row.items():
+            if '.' in key:
+                section_columns.setdefault(key, _column_type(value))
+                remaining.discard(key.split('.', 1)[0])
+        if not remaining:
+            break
+    if client_names and not section_columns:
+        raise ValueError(f"Не удалось определить колонки отчета по первым {probe_limit} клиентам")
+    if remaining:
+        logger.warning(f"Нет показателей секций {', '.join(sorted(remaining))} у первых {probe_limit} клиентов")
+
+    order = list(AdvancedPortfolioAnalysis.SECTIONS)
+    ordered = sorted(section_columns, key=lambda key: order.index(key.split('.', 1)[0]))
+    return {**BASE_COLUMNS, **{key: section_columns[key] for key in ordered}, **TAIL_COLUMNS}
+
+# ЗАПИСЬ РЕЗУЛЬТАТОВ
+
+def _flat_value(value: Any) -> Any:
+    return RECOMMENDATION_SEPARATOR.join(value) if isinstance(value, list) else value
+
+class ReportWriter(ABC):
+    """
+    Потоковая запись пачек строк по фиксированной схеме. Строка с колонкой
+    вне схемы - ошибка прогона, а не молча отброшенные данные. После каждой
+    пачки данные сбрасываются на диск, и position() сохраняется в
+    контрольной точке; при возобновлении все, что записано после нее,
+    отбрасывается (truncate).
+    """
+
+    def __init__(self, path: Path, schema: Dict[str, str], position: int = 0):
+        self.path = path
+        self.schema = schema
+
+    def check_rows(self, rows: List[Dict[str, Any]]) -> None:
+        unknown = {key for row in rows for key in row} - set(self.schema)
+        if unknown:
+            raise ValueError(f"Колонки вне схемы отчета: {', '.join(sorted(unknown))}; "
+                             f"запустите прогон заново с --restart")
+
+    @abstractmethod
+    def write(self, chunk_id: int, rows: List[Dict[str, Any]]) -> None:
+        """Записывает пачку строк (до записи проверяет их по схеме)"""
+
+    def position(self) -> int:
+        return 0
+
+    def close(self) -> None:
+        pass
+
+class _FileWriter(ReportWriter):
+    """Общий файл (CSV, JSONL), в который пачки дописываются в порядке завершения"""
+
+    def __init__(self, path: Path, schema: Dict[str, str], position: int = 0):
+        super().__init__(path, schema, position)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(path, 'a+', encoding='utf-8', newline='')
+        self._file.truncate(position)
+        self._file.seek(position)
+
+    def _flush(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def position(self) -> int:
+        return self._file.tell()
+
+    def close(self) -> None:
+        self._file.close()
+
+class CSVReportWriter(_FileWriter):
+    """CSV: заголовок - колонки схемы, пишется в начале нового файла"""
+
+    def __init__(self, path: Path, schema: Dict[str, str], position: int = 0):
+        super().__init__(path, schema, position)
+        if position == 0:
+            csv.writer(self._file).writerow(self.schema)
+            self._flush()
+
+    def write(self, chunk_id: int, rows: List[Dict[str, Any]]) -> None:
+        self.check_rows(rows)
+        writer = csv.DictWriter(self._file, list(self.schema))
+        writer.writerows({key: _flat_value(value) for key, value in row.items()} for row in rows)
+        self._flush()
+
+class JSONLReportWriter(_FileWriter):
+    """JSON Lines: строка файла - клиент, рекомендации - список"""
+
+    def write(self, chunk_id: int, rows: List[Dict[str, Any]]) -> None:
+        self.check_rows(rows)
+        self._file.writelines(json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+        self._flush()
+
+class ParquetReportWriter(ReportWriter):
+    """
+    Parquet: каталог-набор данных с файлом на пачку (part-<номер>.parquet);
+    читается целиком через pd.read_parquet(каталог). Все файлы пишутся с
+    одной схемой Arrow, отсутствующие значения - null. Незавершенные файлы
+    пачек, которых нет в контрольной точке, перезаписываются.
+    """
+
+    ARROW_TYPES = {'string': 'string', 'int': 'int64', 'float': 'float64', 'bool': 'bool_'}
+
+    def __init__(self, path: Path, schema: Dict[str, str], position: int = 0):
+        super().__init__(path, schema, position)
+        # pyarrow нужен только для этого формата
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa, self._pq = pa, pq
+        self._arrow_schema = pa.schema([(name, getattr(pa, self.ARROW_TYPES[kind])())
+                                        for name, kind in schema.items()])
+        path.mkdir(parents=True, exist_ok=True)
+
+    def write(self, chunk_id: int, rows: List[Dict[str, Any]]) -> None:
+        self.check_rows(rows)
+        table = self._pa.Table.from_pylist(
+            [{key: _flat_value(value) for key, value in row.items()} for row in rows], schema=self._arrow_schema
+        )
+        part = self.path / f"part-{chunk_id:06d}.parquet"
+        tmp_path = part.with_suffix('.tmp')
+        self._pq.write_table(table, tmp_path)
+        os.replace(tmp_path, part)
+
+WRITERS = {'csv': CSVReportWriter, 'jsonl': JSONLReportWriter, 'parquet': ParquetReportWriter}
+
+# КОНТРОЛЬНЫЕ ТОЧКИ
+
+class Checkpoint:
+    """
+    Состояние прогона в JSON рядом с отчетом (<отчет>.checkpoint.json):
+    номера записанных пачек, позиция в файле и схема отчета. Записывается
+    атомарно после каждой пачки. Отпечаток фиксирует список клиентов,
+    размер пачки, секции и формат - с другими параметрами продолжить нельзя.
+    """
+
+    def __init__(self, path: Path, fingerprint: str):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.completed: set = set()
+        self.position = 0
+        self.rows = 0
+        self.schema: Optional[Dict[str, str]] = None
+
+    @classmethod
+    def load(cls, path: Path, fingerprint: str) -> 'Checkpoint':
+        checkpoint = cls(path, fingerprint)
+        if path.exists():
+            state = json.loads(path.read_text(encoding='utf-8'))
+            if state['fingerprint'] != fingerprint:
+                raise ValueError(f"Контрольная точка {path} относится к другому прогону "
+                                 f"(изменились клиенты или параметры); запустите с --restart")
+            checkpoint.completed = set(state['completed'])
+            checkpoint.position = state['position']
+            checkpoint.rows = state['rows']
+            checkpoint.schema = state.get('schema')
+            if checkpoint.completed and checkpoint.schema is None:
+                raise ValueError(f"В контрольной точке {path} нет схемы отчета; запустите с --restart")
+        return checkpoint
+
+    def commit(self, chunk_id: int, rows: int, writer: ReportWriter) -> None:
+        self.completed.add(chunk_id)
+        self.rows += rows
+        self.position = writer.position()
+        self.schema = writer.schema
+        state = {
+            'fingerprint': self.fingerprint, 'completed': sorted(self.completed),
+            'position': self.position, 'rows': self.rows, 'schema': self.schema
+        }
+        tmp_path = self.path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(state, ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp_path, self.path)
+
+# ЗАПУСК
+
+def chunk_clients(client_names: Sequence[str], chunk_size: int) -> Iterator[Tuple[int, List[str]]]:
+    for chunk_id, start in enumerate(range(0, len(client_names), chunk_size)):
+        yield chunk_id, list(client_names[start:start + chunk_size])
+
+def infer_format(output: Path) -> str:
+    suffix = output.suffix.lstrip('.').lower()
+    return suffix if suffix in FORMATS else 'csv'
+
+def run_batch_report(output: Path, report_format: Optional[str] = None, workers: Optional[int] = None,
+                     chunk_size: int = DEFAULT_CHUNK_SIZE, sections: Sequence[str] = REPORT_SECTIONS,
+                     client_names: Optional[List[str]] = None, restart: bool = False) -> Dict[str, Any]:
+    """
+    Считает отчет по клиентам в пуле процессов и пишет его потоково.
+
+    В работе не больше workers * CHUNKS_PER_WORKER пачек, поэтому в памяти -
+    только они, а не вся база. Прерванный прогон продолжается с пачек, которых
+    нет в контрольной точке. Возвращает сводку: клиенты, время, клиенты/с и
+    суммарное время этапов (load, analysis, recommendations - в процессах
+    пула, write - в основном процессе).
+    """
+    output = Path(output)
+    report_format = report_format or infer_format(output)
+    if report_format not in WRITERS:
+        raise ValueError(f"Неизвестный формат отчета '{report_format}', доступны: {', '.join(FORMATS)}")
+    unknown = set(sections) - set(AdvancedPortfolioAnalysis.SECTIONS)
+    if unknown:
+        raise ValueError(f"Неизвестные секции анализа: {', '.join(sorted(unknown))}")
+    workers = workers or os.cpu_count() or 1
+
+    started = time.perf_counter()
+    client_names = list(client_names if client_names is not None else get_all_clients())
+    checkpoint_path = output.with_name(output.name + '.checkpoint.json')
+    fingerprint = content_key('batch_report', client_names, chunk_size, list(sections), report_format)
+    if restart:
+        checkpoint_path.unlink(missing_ok=True)
+    checkpoint = Checkpoint.load(checkpoint_path, fingerprint)
+    if not checkpoint.completed and output.is_dir():
+        # Новый прогон в каталог Parquet: файлы прежнего прогона удаляются
+        for part in output.glob('part-*.parquet'):
+            part.unlink()
+
+    pending = [(chunk_id, names) for chunk_id, names in chunk_clients(client_names, chunk_size)
+               if chunk_id not in checkpoint.completed]
+    n_chunks = len(pending) + len(checkpoint.completed)
+    skipped_rows = checkpoint.rows
+    if checkpoint.completed:
+        print(f"Продолжение прогона: готово {len(checkpoint.completed)} из {n_chunks} пачек ({skipped_rows} клиентов)")
+
+    schema = checkpoint.schema if checkpoint.schema is not None else report_schema(client_names, sections)
+    writer = WRITERS[report_format](output, schema, checkpoint.position)
+    timings: Dict[str, float] = defaultdict(float)
+    processed = 0
+    try:
+        # spawn: процессы не наследуют открытые соединения SQLite родителя
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            queue = iter(pending)
+            in_flight: set = set()
+
+            def submit_next() -> bool:
+                item = next(queue, None)
+                if item is None:
+                    return False
+                in_flight.add(executor.submit(analyze_chunk, item[0], item[1], tuple(sections)))
+                return True
+
+            while len(in_flight) < workers * CHUNKS_PER_WORKER and submit_next():
+                pass
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    in_flight.discard(future)
+                    chunk_id, rows, chunk_timings = future.result()
+                    write_started = time.perf_counter()
+                    writer.write(chunk_id, rows)
+                    checkpoint.commit(chunk_id, len(rows), writer)
+                    timings['write'] += time.perf_counter() - write_started
+                    for stage, seconds in chunk_timings.items():
+                        timings[stage] += seconds
+                    processed += len(rows)
+                    elapsed = time.perf_counter() - started
+                    print(f"[{len(checkpoint.completed)}/{n_chunks}] {skipped_rows + processed} клиентов, "
+                          f"{processed / elapsed:.1f} клиентов/с")
+                    submit_next()
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        'output': str(output), 'format': report_format, 'clients': skipped_rows + processed,
+        'processed': processed, 'seconds': elapsed, 'clients_per_second': processed / elapsed if elapsed else 0.0,
+        'stages': {stage: timings.get(stage, 0.0) for stage in STAGES + ('write',)}
+    }
+
+def print_summary(summary: Dict[str, Any]) -> None:
+    print(f"\nОтчет: {summary['output']} ({summary['format']}), клиентов: {summary['clients']}")
+    print(f"Обработано за прогон: {summary['processed']} за {summary['seconds']:.1f} с "
+          f"({summary['clients_per_second']:.1f} клиентов/с)")
+    print("Время этапов (сумма по процессам):")
+    for stage, seconds in summary['stages'].items():
+        per_client = seconds / summary['processed'] * 1000 if summary['processed'] else 0.0
+        print(f"  {stage:<16} {seconds:8.2f} с  {per_client:8.1f} мс/клиент")
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Пакетный отчет по всем клиентам: анализ и рекомендации")
+    parser.add_argument('output', type=Path, help="файл отчета (.csv, .jsonl) или каталог (.parquet)")
+    parser.add_argument('--format', choices=FORMATS, help="формат (по умолчанию - по расширению)")
+    parser.add_argument('--workers', type=int, help="число процессов (по умолчанию - число ядер)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="клиентов в задаче")
+    parser.add_argument('--sections', default=','.join(REPORT_SECTIONS), help="секции анализа через запятую")
+    parser.add_argument('--restart', action='store_true', help="начать заново, игнорируя контрольную точку")
+    args = parser.parse_args(argv)
+
+    try:
+        summary = run_batch_report(
+            args.output, args.format, args.workers, args.chunk_size,
+            [section.strip() for section in args.sections.split(',') if section.strip()],
+            restart=args.restart
+        )
+    except (ValueError, OSError) as e:
+        print(f"Ошибка: {e}")
+        return 1
+    print_summary(summary)
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
@@ -0,0 +1,103 @@
+# chart_sampling.py - прореживание длинных рядов перед построением графиков
+
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# Число точек на график: примерно столько различимых по ширине точек помещается на экране
+MOBILE_MAX_POINTS = 400
+DESKTOP_MAX_POINTS = 1500
+
+# Начиная с этого числа точек линии рисуются через WebGL (go.Scattergl)
+WEBGL_THRESHOLD = 1000
+
+def chart_point_budget(is_mobile: bool) -> int:
+    """Число точек на график для текущего экрана"""
+    return MOBILE_MAX_POINTS if is_mobile else DESKTOP_MAX_POINTS
+
+def scatter_trace(n_points: int, **kwargs):
+    """Линейный график: WebGL для больших рядов, SVG для остальных"""
+    return go.Scattergl(**kwargs) if n_points > WEBGL_THRESHOLD else go.Scatter(**kwargs)
+
+def _as_float(values) -> np.ndarray:
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype('datetime64[ns]').astype(np.int64).astype(float)
+    return values.astype(float)
+
+def lttb_indices(x, y, n_out: int) -> np.ndarray:
+    """
+    Индексы точек по алгоритму Largest-Triangle-Three-Buckets.
+
+    Первая и последняя точки сохраняются, остальные делятся на n_out - 2
+    корзины; из каждой корзины берется точка, образующая наибольший
+    треугольник с выбранной точкой предыдущей корзины и средним следующей.
+    Цикл идет по корзинам, внутри корзины - векторные операции.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = _as_float(x)
+    y = _as_float(y)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)
+    selected = np.empty(n_out, dtype=np.intp)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start, next_end = end, edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+        # Удвоенная площадь треугольника (предыдущая точка, кандидат, среднее следующей корзины)
+        area = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                      - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    return selected
+
+def minmax_indices(y, n_out: int) -> np.ndarray:
+    """Индексы минимума и максимума в каждой из n_out / 2 корзин (для столбцов и выбросов)"""
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+    y = _as_float(y)
+    starts = np.linspace(0, n, n_out // 2, endpoint=False).astype(np.intp)
+    lengths = np.diff(np.append(starts, n))
+    bucket = np.repeat(np.arange(len(starts)), lengths)
+    # Позиции экстремумов внутри корзин: сортировка по (корзина, значение)
+    order = np.lexsort((y, bucket))
+    first = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    last = first + lengths - 1
+    return np.unique(np.concatenate((order[first], order[last])))
+
+def downsample_frame(frame: pd.DataFrame, x_column: str, y_columns: Sequence[str],
+                     max_points: int, method: str = 'lttb') -> pd.DataFrame:
+    """
+    Строки таблицы для графика не более чем ~max_points.
+
+    Отбор ведется по первой колонке y_columns; глобальные минимум и максимум
+    каждой колонки y_columns добавляются всегда, поэтому пики и дно просадки
+    не теряются.
+    """
+    if len(frame) <= max_points:
+        return frame
+    x = frame[x_column].to_numpy()
+    y = frame[y_columns[0]].to_numpy()
+    if method == 'lttb':
+        indices = lttb_indices(x, y, max_points)
+    elif method == 'minmax':
+        indices = minmax_indices(y, max_points)
+    else:
+        raise ValueError(f"Неизвестный метод прореживания: {method}")
+
+    extremes = []
+    for column in y_columns:
+        values = frame[column].to_numpy(dtype=float)
+        if np.isfinite(values).any():
+            extremes.extend((np.nanargmin(values), np.nanargmax(values)))
+    indices = np.unique(np.concatenate((indices, np.asarray(extremes, dtype=np.intp))))
+    return frame.iloc[indices]
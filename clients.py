@@ -0,0 +1,136 @@
+# clients.py - профили клиентов и кэширующий репозиторий
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Поля профиля клиента в порядке столбцов таблицы clients
+PROFILE_FIELDS = (
+    'name', 'portfolio_name', 'description', 'risk_profile', 'investment_horizon', 'experience',
+    'financial_goals', 'portfolio_type', 'risk_tolerance', 'diversification_level',
+    'initial_investment', 'target_amount', 'expected_return', 'volatility', 'sharpe_ratio'
+)
+
+# Поля профиля, от которых зависит прогноз достижения цели (goal_planning)
+GOAL_FIELDS = ('initial_investment', 'target_amount', 'investment_horizon')
+
+# Ожидаемые показатели портфеля (в словаре клиента - вложенный key_metrics)
+KEY_METRICS = ('expected_return', 'volatility', 'sharpe_ratio')
+
+class ClientProfile:
+    """Профиль клиента и веса его портфеля"""
+
+    __slots__ = PROFILE_FIELDS + ('portfolio', 'last_modified')
+
+    name: str
+    portfolio_name: Optional[str]
+    description: Optional[str]
+    risk_profile: str
+    investment_horizon: str
+    experience: str
+    financial_goals: Optional[str]
+    portfolio_type: str
+    risk_tolerance: float
+    diversification_level: Optional[str]
+    initial_investment: float
+    target_amount: Optional[float]
+    expected_return: Optional[float]
+    volatility: Optional[float]
+    sharpe_ratio: Optional[float]
+    portfolio: Dict[str, float]
+    # portfolios.last_modified на момент загрузки: по нему видно, что запись кэша устарела
+    last_modified: Optional[str]
+
+    def __init__(self, portfolio: Optional[Dict[str, float]] = None, last_modified: Optional[str] = None,
+                 **fields):
+        for field in PROFILE_FIELDS:
+            setattr(self, field, fields.get(field))
+        self.portfolio = dict(portfolio or {})
+        self.last_modified = last_modified
+
+    def __repr__(self) -> str:
+        return f"ClientProfile({self.name!r}, portfolio={self.portfolio_name!r})"
+
+    @classmethod
+    def from_dict(cls, name: str, data: Dict, portfolio: Optional[Dict[str, float]] = None) -> 'ClientProfile':
+        """Профиль из словаря в формате CLIENTS_DETAILED_DATA"""
+        fields = {field: data.get(field) for field in PROFILE_FIELDS}
+        fields.update({metric: data.get('key_metrics', {}).get(metric) for metric in KEY_METRICS})
+        fields['name'] = name
+        return cls(portfolio, **fields)
+
+    def goal_key(self) -> Tuple:
+        """Параметры цели клиента для ключей кэша прогноза и ETag"""
+        return tuple(getattr(self, field) for field in GOAL_FIELDS)
+
+    @property
+    def stamp(self) -> Tuple:
+        """Отметка актуальности профиля: дата изменения портфеля и параметры цели"""
+        return (self.last_modified, *self.goal_key())
+
+    def to_dict(self) -> Dict:
+        """Словарь в формате CLIENTS_DETAILED_DATA (с полем name)"""
+        data = {field: getattr(self, field) for field in PROFILE_FIELDS if field not in KEY_METRICS}
+        data['key_metrics'] = {metric: getattr(self, metric) for metric in KEY_METRICS}
+        return data
+
+class ClientRepository:
+    """
+    LRU-кэш профилей клиентов на процесс со сквозным чтением.
+
+    При промахе профиль вместе с портфелем читается через loader одним
+    запросом по индексу имени; отсутствующие клиенты тоже кэшируются (None).
+    После изменения данных клиента вызывается invalidate. Загрузка идет вне
+    блокировки, поэтому результат сохраняется, только если за время загрузки
+    не было invalidate (счетчик поколений не изменился) - иначе устаревший
+    профиль вернулся бы в кэш после сброса.
+    """
+
+    def __init__(self, loader: Callable[[str], Optional[ClientProfile]],
+                 names_loader: Callable[[], List[str]], maxsize: int = 4096):
+        self._loader = loader
+        self._names_loader = names_loader
+        self.maxsize = maxsize
+        self._profiles: 'OrderedDict[str, Optional[ClientProfile]]' = OrderedDict()
+        self._names: Optional[List[str]] = None
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, client_name: str) -> Optional[ClientProfile]:
+        with self._lock:
+            if client_name in self._profiles:
+                self._profiles.move_to_end(client_name)
+                return self._profiles[client_name]
+            generation = self._generation
+
+        profile = self._loader(client_name)
+        with self._lock:
+            if generation != self._generation:
+                return profile
+            self._profiles[client_name] = profile
+            self._profiles.move_to_end(client_name)
+            while len(self._profiles) > self.maxsize:
+                self._profiles.popitem(last=False)
+        return profile
+
+    def names(self) -> List[str]:
+        """Имена всех клиентов (читаются один раз)"""
+        with self._lock:
+            names = self._names
+            generation = self._generation
+        if names is None:
+            names = self._names_loader()
+            with self._lock:
+                if generation == self._generation:
+                    self._names = names
+        return list(names)
+
+    def invalidate(self, client_name: Optional[str] = None) -> None:
+        """Сбрасывает кэш клиента (или весь кэш вместе со списком имен)"""
+        with self._lock:
+            self._generation += 1
+            if client_name is None:
+                self._profiles.clear()
+                self._names = None
+            else:
+                self._profiles.pop(client_name, None)
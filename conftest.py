@@ -0,0 +1 @@
+# conftest.py - корень репозитория в sys.path для тестов (модули лежат плоско)
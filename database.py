@@ -2,21 +2,35 @@
 
 import sqlite3
 import logging
-from typing import Dict, List, Optional, Tuple
+import threading
+from contextlib import contextmanager
+from queue import Empty, LifoQueue
+from typing import Dict, Iterator, List, Optional, Tuple
 from datetime import datetime
+from itertools import groupby
 import os
 
+import numpy as np
+import pandas as pd
+
+from rule_engine import Rule, RuleSet
+from clients import GOAL_FIELDS, PROFILE_FIELDS, ClientProfile, ClientRepository
+from entitlements import (ADVANCED_ANALYTICS, NEWS_ANALYSIS, PREMIUM_ANALYTICS, SUBSCRIPTION_LEVELS,
+                          Entitlement, EntitlementService)
+from ticker_index import TickerIndex, TickerRow, tag_flags
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# ДАННЫЕ О ПОДПИСКАХ КЛИЕНТОВ - ОБНОВЛЕННЫЕ ДАННЫЕ С НОВЫМИ ТАРИФАМИ!
+# ДАННЫЕ О ПОДПИСКАХ КЛИЕНТОВ - демо-данные таблицы subscriptions
+# (срок проверяется: после expires платная подписка дает базовый уровень)
 CLIENT_SUBSCRIPTIONS = {
-    'Иван Петров': {'level': 'premium', 'price': 800, 'expires': '2024-12-31'},
-    'Мария Сидорова': {'level': 'advanced', 'price': 450, 'expires': '2024-11-30'},
-    'Алексей Козлов': {'level': 'basic', 'price': 0, 'expires': '2024-10-15'},
-    'Елена Волкова': {'level': 'basic', 'price': 0, 'expires': '2024-09-30'},
-    'Дмитрий Смирнов': {'level': 'basic', 'price': 0, 'expires': '2024-09-30'}
+    'Иван Петров': {'level': 'premium', 'price': 800, 'expires': '2027-12-31'},
+    'Мария Сидорова': {'level': 'advanced', 'price': 450, 'expires': '2027-11-30'},
+    'Алексей Козлов': {'level': 'basic', 'price': 0, 'expires': None},
+    'Елена Волкова': {'level': 'basic', 'price': 0, 'expires': None},
+    'Дмитрий Смирнов': {'level': 'basic', 'price': 0, 'expires': None}
 }
 
 # ОПИСАНИЯ ТАРИФОВ И ФУНКЦИЙ - УСИЛЕННЫЕ ВОЗМОЖНОСТИ С НОВЫМИ ПОКАЗАТЕЛЯМИ
@@ -86,38 +100,38 @@ SUBSCRIPTION_FEATURES = {
 }
 
 # ФУНКЦИИ ДЛЯ РАБОТЫ С ПОДПИСКАМИ
+def get_entitlement(client_name: str) -> Entitlement:
+    """Права клиента из кэша прав (при промахе - из таблицы subscriptions)"""
+    return ENTITLEMENTS.get(client_name)
+
 def get_subscription_level(client_name: str) -> str:
-    """Возвращает уровень подписки клиента"""
-    subscription = CLIENT_SUBSCRIPTIONS.get(client_name, {})
-    return subscription.get('level', 'basic')
+    """Возвращает действующий уровень подписки клиента"""
+    return get_entitlement(client_name).level
 
 def get_subscription_details(client_name: str) -> Dict:
     """Возвращает детали подписки"""
-    subscription = CLIENT_SUBSCRIPTIONS.get(client_name, {})
-    level = subscription.get('level', 'basic')
+    entitlement = get_entitlement(client_name)
     
-    details = SUBSCRIPTION_FEATURES.get(level, {}).copy()
+    details = SUBSCRIPTION_FEATURES.get(entitlement.level, {}).copy()
     details.update({
-        'level': level,
-        'price': subscription.get('price', 0),
-        'expires': subscription.get('expires', '2024-01-01')
+        'level': entitlement.level,
+        'price': entitlement.price,
+        'expires': entitlement.expires.isoformat() if entitlement.expires else 'бессрочно'
     })
     
     return details
 
 def can_access_advanced_analytics(client_name: str) -> bool:
     """Проверяет доступ к продвинутой аналитике"""
-    level = get_subscription_level(client_name)
-    return level in ['advanced', 'premium']
+    return get_entitlement(client_name).allows(ADVANCED_ANALYTICS)
 
 def can_access_premium_features(client_name: str) -> bool:
     """Проверяет доступ к премиум функциям"""
-    return get_subscription_level(client_name) == 'premium'
+    return get_entitlement(client_name).allows(PREMIUM_ANALYTICS)
 
 def can_access_news_analysis(client_name: str) -> bool:
     """Проверяет доступ к новостному анализу"""
-    level = get_subscription_level(client_name)
-    return level in ['advanced', 'premium']
+    return get_entitlement(client_name).allows(NEWS_ANALYSIS)
 
 # РАСШИРЕННЫЕ ДАННЫЕ ДЛЯ ПРЕМИУМ-АНАЛИТИКИ
 PREMIUM_ANALYTICS_DATA = {
@@ -143,16 +157,7 @@ PREMIUM_ANALYTICS_DATA = {
             '🛡️ **Рекомендуется добавить защитные активы** для снижения VaR',
             '🎯 **Оптимальный момент для ребалансировки** - потенциал +2.3%',
             '📊 **Stress-test показал устойчивость** к умеренным коррекциям'
-        ],
-        'sector_analysis': {
-            'Технологии': 0.35,
-            'Финансы': 0.20, 
-            'Здравоохранение': 0.15,
-            'Потребительские товары': 0.12,
-            'Энергетика': 0.08,
-            'Недвижимость': 0.06,
-            'Материалы': 0.04
-        }
+        ]
     },
     'Мария Сидорова': {
         'ai_predictions': {
@@ -176,16 +181,7 @@ PREMIUM_ANALYTICS_DATA = {
             '🔄 **Рекомендуется реинвестировать дивиденды**',
             '⏰ **Идеальный горизонт инвестиций 3-5 лет**',
             '🎯 **Портфель оптимален для поставленных целей**'
-        ],
-        'sector_analysis': {
-            'Технологии': 0.25,
-            'Финансы': 0.18,
-            'Здравоохранение': 0.15,
-            'Потребительские товары': 0.20,
-            'Энергетика': 0.12,
-            'Недвижимость': 0.08,
-            'Материалы': 0.02
-        }
+        ]
     }
 }
 
@@ -209,12 +205,15 @@ def get_ml_insights(client_name: str) -> List[str]:
     return PREMIUM_ANALYTICS_DATA.get(client_name, {}).get('ml_insights', [])
 
 def get_sector_analysis(client_name: str) -> Optional[Dict]:
-    """Возвращает отраслевой анализ"""
+    """Возвращает отраслевой анализ (доли секторов по фактическим весам портфеля)"""
     if not can_access_premium_features(client_name):
         return None
-    return PREMIUM_ANALYTICS_DATA.get(client_name, {}).get('sector_analysis')
+    profile = get_client_profile(client_name)
+    if not profile or not profile.portfolio_name:
+        return None
+    return get_database().get_exposures([profile.portfolio_name], 'sector').get(profile.portfolio_name)
 
-# Детальные данные клиентов с уникальными характеристиками
+# Детальные данные клиентов с уникальными характеристиками (демо-данные таблицы clients)
 CLIENTS_DETAILED_DATA = {
     'Иван Петров': {
         'name': 'Иван Петров',
@@ -237,7 +236,7 @@ CLIENTS_DETAILED_DATA = {
     },
     'Мария Сидорова': {
         'name': 'Мария Сидорова',
-        'portfolio_name': 'агрессивный',
+        'portfolio_name': 'агрессивный рост',
         'description': 'Молодая инвестор, готовая к риску для ускоренного роста',
         'risk_profile': 'высокий',
         'investment_horizon': '5-7 лет',
@@ -313,450 +312,1020 @@ CLIENTS_DETAILED_DATA = {
     }
 }
 
-class PortfolioDatabase:
+# Демо-портфели (соответствуют клиентам из app.py)
+DEMO_PORTFOLIOS = [
+    ("агрессивный", "Портфель Ивана Петрова - высокорисковые активы"),
+    ("агрессивный рост", "Портфель Марии Сидоровой - концентрированные акции роста"),
+    ("сбалансированный", "Портфель Алексея Козлова - баланс роста и стабильности"),
+    ("доходный", "Портфель Елены Волкова - дивидендные акции"),
+    ("ультра-консервативный", "Портфель Дмитрия Смирнова - максимальная защита")
+]
+
+# Демо-портфели, добавленные миграцией таблицы клиентов
+CLIENT_PORTFOLIOS_ADDED = ("агрессивный рост",)
+
+# Активы для портфелей (уникальные для каждого клиента)
+DEMO_PORTFOLIO_ASSETS = {
+    "агрессивный": {
+        'TSLA': 0.25, 'NVDA': 0.20, 'AMD': 0.15, 'ARKK': 0.15,
+        'SQ': 0.10, 'BTC-USD': 0.10, 'ETH-USD': 0.05
+    },
+    "агрессивный рост": {
+        'TSLA': 0.30, 'NVDA': 0.25, 'AMD': 0.20, 'ARKK': 0.15, 'BTC-USD': 0.10
+    },
+    "сбалансированный": {
+        'VTI': 0.25, 'VXUS': 0.15, 'BND': 0.20, 'VNQ': 0.10,
+        'GLD': 0.08, 'AAPL': 0.07, 'MSFT': 0.07, 'JPM': 0.05, 'Cash': 0.03
+    },
+    "доходный": {
+        'VYM': 0.20, 'SCHD': 0.18, 'T': 0.10, 'VZ': 0.09,
+        'XOM': 0.08, 'PFE': 0.08, 'JNJ': 0.07, 'PG': 0.07, 'O': 0.06, 'Cash': 0.07
+    },
+    "ультра-консервативный": {
+        'BND': 0.40, 'GOVT': 0.25, 'SHY': 0.15, 'JNJ': 0.08,
+        'PG': 0.07, 'Cash': 0.05
+    }
+}
+
+# Справочник тикеров: класс актива, сектор, группа риска, регион, валюта и признаки классификации
+TICKER_METADATA = {
+    'TSLA': ('equity', 'Потребительские товары', 'high_risk', 'US', 'USD', ('aggressive', 'tech')),
+    'NVDA': ('equity', 'Технологии', 'high_risk', 'US', 'USD', ('aggressive', 'tech')),
+    'AMD': ('equity', 'Технологии', 'high_risk', 'US', 'USD', ('aggressive', 'tech')),
+    'SQ': ('equity', 'Финансы', 'high_risk', 'US', 'USD', ('tech',)),
+    'ARKK': ('equity', 'Технологии', 'high_risk', 'US', 'USD', ('aggressive',)),
+    'BTC-USD': ('crypto', 'Крипто', 'high_risk', 'Global', 'USD', ('aggressive',)),
+    'ETH-USD': ('crypto', 'Крипто', 'high_risk', 'Global', 'USD', ('aggressive',)),
+    'AAPL': ('equity', 'Технологии', 'medium_risk', 'US', 'USD', ('tech',)),
+    'MSFT': ('equity', 'Технологии', 'medium_risk', 'US', 'USD', ('tech',)),
+    'VTI': ('equity', 'Широкий рынок', 'medium_risk', 'US', 'USD', ()),
+    'VXUS': ('equity', 'Широкий рынок', 'medium_risk', 'International', 'USD', ()),
+    'VNQ': ('real_estate', 'Недвижимость', 'medium_risk', 'US', 'USD', ()),
+    'VYM': ('equity', 'Широкий рынок', 'medium_risk', 'US', 'USD', ()),
+    'SCHD': ('equity', 'Широкий рынок', 'medium_risk', 'US', 'USD', ()),
+    'SPY': ('equity', 'Широкий рынок', 'low_risk', 'US', 'USD', ()),
+    'JPM': ('equity', 'Финансы', 'low_risk', 'US', 'USD', ()),
+    'PFE': ('equity', 'Здравоохранение', 'low_risk', 'US', 'USD', ()),
+    'O': ('real_estate', 'Недвижимость', 'low_risk', 'US', 'USD', ()),
+    'JNJ': ('equity', 'Здравоохранение', 'low_risk', 'US', 'USD', ('defensive', 'protective')),
+    'PG': ('equity', 'Потребительские товары', 'low_risk', 'US', 'USD', ('defensive', 'protective')),
+    'XOM': ('equity', 'Энергетика', 'low_risk', 'US', 'USD', ('defensive',)),
+    'T': ('equity', 'Телекоммуникации', 'low_risk', 'US', 'USD', ('defensive',)),
+    'VZ': ('equity', 'Телекоммуникации', 'low_risk', 'US', 'USD', ('defensive',)),
+    'GLD': ('commodity', 'Золото', 'low_risk', 'Global', 'USD', ('defensive', 'protective')),
+    'BND': ('bond', 'Облигации', 'low_risk', 'US', 'USD', ('conservative', 'defensive', 'protective')),
+    'GOVT': ('bond', 'Облигации', 'low_risk', 'US', 'USD', ('conservative', 'defensive', 'protective')),
+    'SHY': ('bond', 'Облигации', 'low_risk', 'US', 'USD', ('conservative', 'defensive', 'protective')),
+    'Cash': ('cash', 'Денежные средства', 'low_risk', 'US', 'USD', ('conservative', 'defensive', 'protective'))
+}
+
+# PRAGMA для каждого нового соединения: WAL позволяет читателям не блокировать
+# друг друга и писателя, NORMAL достаточно для WAL без потери целостности
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA foreign_keys=ON',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA cache_size=-8000',
+    'PRAGMA temp_store=MEMORY',
+)
+
+class ConnectionPool:
     """
-    Класс для работы с базой данных портфелей
+    Ограниченный потокобезопасный пул соединений SQLite.
+
+    Соединение выдается потоку целиком: повторный вход в connection() из того же
+    потока возвращает то же соединение, а после выхода оно возвращается в пул и
+    может быть переиспользовано другим потоком.
     """
-    
-    def __init__(self, db_path: str = 'uniwest.db'):
+
+    def __init__(self, db_path: str, max_connections: int = 8, timeout: float = 30.0):
         self.db_path = db_path
-        self._init_database()
-    
-    def _get_connection(self) -> sqlite3.Connection:
-        """Возвращает соединение с базой данных"""
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._idle: LifoQueue = LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.max_connections)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all: List[sqlite3.Connection] = []
+        self._closed = False
+
+    def _create_connection(self) -> sqlite3.Connection:
+        """Открывает новое соединение и применяет PRAGMA"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
             conn.row_factory = sqlite3.Row
+            for pragma in CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            with self._lock:
+                self._all.append(conn)
             return conn
         except sqlite3.Error as e:
             logger.error(f"Ошибка подключения к базе данных: {e}")
             raise
-    
+
+    def _acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise sqlite3.ProgrammingError("Пул соединений закрыт")
+        if not self._slots.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError("Превышено время ожидания свободного соединения")
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            try:
+                return self._create_connection()
+            except sqlite3.Error:
+                self._slots.release()
+                raise
+
+    def _release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+        else:
+            self._idle.put(conn)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Выдает соединение текущему потоку на время блока with"""
+        depth = getattr(self._local, 'depth', 0)
+        if depth:
+            self._local.depth = depth + 1
+            try:
+                yield self._local.conn
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        self._local.depth = 1
+        try:
+            yield conn
+        finally:
+            self._local.depth = 0
+            self._local.conn = None
+            self._release(conn)
+
+    def close(self) -> None:
+        """Закрывает все соединения пула"""
+        self._closed = True
+        with self._lock:
+            connections, self._all = self._all, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+class PortfolioDatabase:
+    """
+    Класс для работы с базой данных портфелей
+    """
+
+    def __init__(self, db_path: str = 'uniwest.db', max_connections: int = 8):
+        self.db_path = db_path
+        self._pool = ConnectionPool(db_path, max_connections=max_connections)
+        self._ticker_index: Optional[TickerIndex] = None
+        self._ticker_lock = threading.Lock()
+        # Доли секторов и классов активов: {(атрибут, портфель): (отметка состава, {категория: доля})};
+        # доступ под _ticker_lock
+        self._exposures: Dict[Tuple[str, str], Tuple[tuple, Dict[str, float]]] = {}
+        self._init_database()
+
+    def _get_connection(self):
+        """Возвращает соединение из пула (контекстный менеджер)"""
+        return self._pool.connection()
+
+    def close(self) -> None:
+        """Закрывает пул соединений"""
+        self._pool.close()
+
     def _init_database(self) -> None:
         """
-        Инициализирует базу данных и заполняет демо-данными
+        Приводит схему базы данных к актуальной версии.
+        Для уже актуальной базы это одно чтение PRAGMA user_version без записи.
         """
-        conn = None
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            # Создаем таблицу для портфелей
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS portfolios (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT UNIQUE NOT NULL,
-                    description TEXT,
-                    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_modified TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Создаем таблицу для активов в портфелях
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS portfolio_assets (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    portfolio_id INTEGER NOT NULL,
-                    ticker TEXT NOT NULL,
-                    weight REAL NOT NULL CHECK (weight >= 0 AND weight <= 1),
-                    FOREIGN KEY (portfolio_id) REFERENCES portfolios (id) ON DELETE CASCADE,
-                    UNIQUE(portfolio_id, ticker)
-                )
-            ''')
-            
-            conn.commit()
-            logger.info("База данных инициализирована")
-            
-            # Заполняем демо-данными
-            self._seed_demo_data(conn)
-            
+            with self._get_connection() as conn:
+                version = conn.execute('PRAGMA user_version').fetchone()[0]
+                if version >= len(self.MIGRATIONS):
+                    return
+                self._run_migrations(conn)
         except sqlite3.Error as e:
             logger.error(f"Ошибка инициализации базы данных: {e}")
             raise
-        finally:
-            if conn:
-                conn.close()
     
-    def _seed_demo_data(self, conn: sqlite3.Connection) -> None:
+    def _run_migrations(self, conn: sqlite3.Connection) -> None:
         """
-        Заполняет базу данных демо-данными
+        Применяет недостающие миграции в одной транзакции
         """
+        # BEGIN IMMEDIATE сериализует миграцию между процессами; версию
+        # перечитываем уже под блокировкой записи
+        conn.execute('BEGIN IMMEDIATE')
         try:
-            cursor = conn.cursor()
-            
-            # Демо-портфели (соответствуют клиентам из app.py)
-            demo_portfolios = [
-                ("агрессивный", "Портфель Ивана Петрова - высокорисковые активы"),
-                ("сбалансированный", "Портфель Алексея Козлова - баланс роста и стабильности"),
-                ("доходный", "Портфель Елены Волкова - дивидендные акции"),
-                ("ультра-консервативный", "Портфель Дмитрия Смирнова - максимальная защита")
-            ]
-            
-            for portfolio_name, description in demo_portfolios:
-                cursor.execute('''
-                    INSERT OR IGNORE INTO portfolios (name, description) 
-                    VALUES (?, ?)
-                ''', (portfolio_name, description))
-            
-            # Активы для портфелей (уникальные для каждого клиента)
-            portfolios_assets = {
-                "агрессивный": {
-                    'TSLA': 0.25, 'NVDA': 0.20, 'AMD': 0.15, 'ARKK': 0.15,
-                    'SQ': 0.10, 'BTC-USD': 0.10, 'ETH-USD': 0.05
-                },
-                "сбалансированный": {
-                    'VTI': 0.25, 'VXUS': 0.15, 'BND': 0.20, 'VNQ': 0.10,
-                    'GLD': 0.08, 'AAPL': 0.07, 'MSFT': 0.07, 'JPM': 0.05, 'Cash': 0.03
-                },
-                "доходный": {
-                    'VYM': 0.20, 'SCHD': 0.18, 'T': 0.10, 'VZ': 0.09,
-                    'XOM': 0.08, 'PFE': 0.08, 'JNJ': 0.07, 'PG': 0.07, 'O': 0.06, 'Cash': 0.07
-                },
-                "ультра-консервативный": {
-                    'BND': 0.40, 'GOVT': 0.25, 'SHY': 0.15, 'JNJ': 0.08,
-                    'PG': 0.07, 'Cash': 0.05
-                }
-            }
-            
-            # Добавляем активы для каждого портфеля
-            for portfolio_name, assets in portfolios_assets.items():
-                cursor.execute('SELECT id FROM portfolios WHERE name = ?', (portfolio_name,))
-                result = cursor.fetchone()
-                
-                if result:
-                    portfolio_id = result[0]
-                    
-                    # Удаляем старые активы
-                    cursor.execute('DELETE FROM portfolio_assets WHERE portfolio_id = ?', (portfolio_id,))
-                    
-                    # Добавляем новые активы
-                    for ticker, weight in assets.items():
-                        cursor.execute('''
-                            INSERT INTO portfolio_assets (portfolio_id, ticker, weight) 
-                            VALUES (?, ?, ?)
-                        ''', (portfolio_id, ticker, weight))
-            
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            for number, migration in enumerate(self.MIGRATIONS[version:], start=version + 1):
+                migration(self, conn)
+                logger.info(f"Применена миграция {number}: {migration.__doc__.strip()}")
+            if version < len(self.MIGRATIONS):
+                conn.execute(f'PRAGMA user_version = {len(self.MIGRATIONS)}')
             conn.commit()
-            logger.info("Демо-данные успешно добавлены")
-            
-        except sqlite3.Error as e:
-            logger.error(f"Ошибка заполнения демо-данными: {e}")
+            logger.info(f"База данных инициализирована (версия схемы {len(self.MIGRATIONS)})")
+        except sqlite3.Error:
             conn.rollback()
             raise
     
+    def _create_schema(self, conn: sqlite3.Connection) -> None:
+        """
+        Таблицы портфелей и активов
+        """
+        cursor = conn.cursor()
+        
+        # Создаем таблицу для портфелей
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS portfolios (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT UNIQUE NOT NULL,
+                description TEXT,
+                created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_modified TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Создаем таблицу для активов в портфелях
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS portfolio_assets (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                portfolio_id INTEGER NOT NULL,
+                ticker TEXT NOT NULL,
+                weight REAL NOT NULL CHECK (weight >= 0 AND weight <= 1),
+                FOREIGN KEY (portfolio_id) REFERENCES portfolios (id) ON DELETE CASCADE,
+                UNIQUE(portfolio_id, ticker)
+            )
+        ''')
+    
+    def _seed_demo_data(self, conn: sqlite3.Connection) -> None:
+        """
+        Демо-данные портфелей
+        """
+        cursor = conn.cursor()
+        
+        cursor.executemany('''
+            INSERT OR IGNORE INTO portfolios (name, description) 
+            VALUES (?, ?)
+        ''', DEMO_PORTFOLIOS)
+        
+        # Активы заменяются целиком (база могла быть заполнена до появления миграций)
+        cursor.execute('''
+            DELETE FROM portfolio_assets WHERE portfolio_id IN (
+                SELECT id FROM portfolios WHERE name IN ({})
+            )
+        '''.format(', '.join('?' * len(DEMO_PORTFOLIO_ASSETS))), tuple(DEMO_PORTFOLIO_ASSETS))
+        
+        cursor.executemany('''
+            INSERT INTO portfolio_assets (portfolio_id, ticker, weight) 
+            SELECT id, ?, ? FROM portfolios WHERE name = ?
+        ''', [(ticker, weight, portfolio_name)
+              for portfolio_name, assets in DEMO_PORTFOLIO_ASSETS.items()
+              for ticker, weight in assets.items()])
+    
+    def _create_lookup_indexes(self, conn: sqlite3.Connection) -> None:
+        """
+        Покрывающий индекс активов по портфелю
+        """
+        # portfolios(name) уже индексирован ограничением UNIQUE; индекс по активам
+        # содержит все читаемые столбцы, поэтому выборка идет без обращения к таблице
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_portfolio_assets_portfolio
+            ON portfolio_assets (portfolio_id, weight DESC, ticker)
+        ''')
+    
+    def _create_ticker_table(self, conn: sqlite3.Connection) -> None:
+        """
+        Справочник тикеров
+        """
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS tickers (
+                ticker TEXT PRIMARY KEY,
+                asset_class TEXT NOT NULL,
+                sector TEXT NOT NULL,
+                risk_bucket TEXT NOT NULL,
+                region TEXT NOT NULL,
+                currency TEXT NOT NULL,
+                flags INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        conn.executemany('''
+            INSERT OR REPLACE INTO tickers (ticker, asset_class, sector, risk_bucket, region, currency, flags)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [(ticker, *attributes, tag_flags(tags))
+              for ticker, (*attributes, tags) in TICKER_METADATA.items()])
+    
+    def _create_subscriptions_table(self, conn: sqlite3.Connection) -> None:
+        """
+        Подписки клиентов
+        """
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS subscriptions (
+                client_name TEXT PRIMARY KEY,
+                level TEXT NOT NULL CHECK (level IN ({})),
+                price INTEGER NOT NULL DEFAULT 0,
+                expires DATE
+            )
+        '''.format(', '.join(f"'{level}'" for level in SUBSCRIPTION_LEVELS)))
+        conn.executemany('''
+            INSERT OR IGNORE INTO subscriptions (client_name, level, price, expires)
+            VALUES (?, ?, ?, ?)
+        ''', [(client_name, subscription['level'], subscription['price'], subscription['expires'])
+              for client_name, subscription in CLIENT_SUBSCRIPTIONS.items()])
+    
+    def _create_clients_table(self, conn: sqlite3.Connection) -> None:
+        """
+        Клиенты со ссылкой на портфель
+        """
+        # Портфель, появившийся вместе с клиентами, добавляется в уже заполненные
+        # базы; существующие портфели и их активы не меняются
+        added = [(name, description) for name, description in DEMO_PORTFOLIOS if name in CLIENT_PORTFOLIOS_ADDED]
+        conn.executemany('INSERT OR IGNORE INTO portfolios (name, description) VALUES (?, ?)', added)
+        conn.executemany('''
+            INSERT OR IGNORE INTO portfolio_assets (portfolio_id, ticker, weight)
+            SELECT id, ?, ? FROM portfolios WHERE name = ?
+        ''', [(ticker, weight, name) for name, _ in added for ticker, weight in DEMO_PORTFOLIO_ASSETS[name].items()])
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS clients (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT UNIQUE NOT NULL,
+                portfolio_id INTEGER REFERENCES portfolios (id) ON DELETE SET NULL,
+                description TEXT,
+                risk_profile TEXT NOT NULL,
+                investment_horizon TEXT NOT NULL,
+                experience TEXT NOT NULL,
+                financial_goals TEXT,
+                portfolio_type TEXT NOT NULL,
+                risk_tolerance REAL NOT NULL DEFAULT 0.5,
+                diversification_level TEXT,
+                initial_investment REAL NOT NULL DEFAULT 0,
+                target_amount REAL,
+                expected_return REAL,
+                volatility REAL,
+                sharpe_ratio REAL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_clients_portfolio ON clients (portfolio_id)')
+        
+        columns = [field for field in PROFILE_FIELDS if field != 'portfolio_name']
+        rows = []
+        for name, data in CLIENTS_DETAILED_DATA.items():
+            profile = ClientProfile.from_dict(name, data)
+            rows.append((profile.portfolio_name, *(getattr(profile, field) for field in columns)))
+        conn.executemany('''
+            INSERT OR IGNORE INTO clients (portfolio_id, {columns})
+            SELECT (SELECT id FROM portfolios WHERE name = ?), {placeholders}
+        '''.format(columns=', '.join(columns), placeholders=', '.join('?' * len(columns))), rows)
+    
+    # Миграции схемы: после применения i-й миграции PRAGMA user_version = i.
+    # Новые миграции добавляются только в конец списка.
+    MIGRATIONS = (
+        _create_schema,
+        _seed_demo_data,
+        _create_lookup_indexes,
+        _create_ticker_table,
+        _create_subscriptions_table,
+        _create_clients_table,
+    )
+    
+    @staticmethod
+    def _normalize_weights(portfolio_name: str, assets: Dict[str, float]) -> Optional[Dict[str, float]]:
+        """Нормализует веса если сумма не равна 1.0"""
+        if not assets:
+            return None
+        
+        total_weight = sum(assets.values())
+        if abs(total_weight - 1.0) > 0.001:
+            assets = {ticker: weight/total_weight for ticker, weight in assets.items()}
+            logger.warning(f"Веса портфеля '{portfolio_name}' нормализованы")
+        
+        return assets
+    
     def get_portfolio(self, portfolio_name: str) -> Optional[Dict[str, float]]:
         """
         Получает портфель из базы данных по имени
         """
-        conn = None
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    SELECT pa.ticker, pa.weight 
+                    FROM portfolio_assets pa 
+                    JOIN portfolios p ON pa.portfolio_id = p.id 
+                    WHERE p.name = ?
+                    ORDER BY pa.weight DESC
+                ''', (portfolio_name,))
+                rows = cursor.fetchall()
+            
+            assets = {row['ticker']: row['weight'] for row in rows}
+            return self._normalize_weights(portfolio_name, assets)
             
-            cursor.execute('''
-                SELECT pa.ticker, pa.weight 
-                FROM portfolio_assets pa 
-                JOIN portfolios p ON pa.portfolio_id = p.id 
-                WHERE p.name = ?
-                ORDER BY pa.weight DESC
-            ''', (portfolio_name,))
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка получения портфеля '{portfolio_name}': {e}")
+            return None
+    
+    # Ограничение на число параметров в одном запросе (SQLITE_MAX_VARIABLE_NUMBER
+    # в старых сборках равен 999)
+    BULK_QUERY_CHUNK = 500
+    
+    def iter_portfolios(self, names: Optional[List[str]] = None,
+                        fetch_size: int = 1000) -> Iterator[Tuple[str, Dict[str, float]]]:
+        """
+        Потоково выдает пары (имя, нормализованный портфель).
+        
+        Строки читаются пачками по fetch_size и группируются по портфелю, поэтому
+        в памяти одновременно находится только один портфель. Соединение занято
+        до конца итерации. Ошибка SQLite посреди потока пробрасывается
+        (sqlite3.Error), чтобы потребитель не принял часть портфелей за все.
+        """
+        query = '''
+            SELECT p.name, pa.ticker, pa.weight
+            FROM portfolio_assets pa
+            JOIN portfolios p ON pa.portfolio_id = p.id
+            {where}
+            ORDER BY pa.portfolio_id, pa.weight DESC
+        '''
+        if names is None:
+            batches = [(query.format(where=''), ())]
+        else:
+            unique_names = list(dict.fromkeys(names))
+            batches = []
+            for start in range(0, len(unique_names), self.BULK_QUERY_CHUNK):
+                chunk = tuple(unique_names[start:start + self.BULK_QUERY_CHUNK])
+                where = 'WHERE p.name IN ({})'.format(', '.join('?' * len(chunk)))
+                batches.append((query.format(where=where), chunk))
+        
+        try:
+            with self._get_connection() as conn:
+                for sql, params in batches:
+                    cursor = conn.execute(sql, params)
+                    rows = iter(lambda: cursor.fetchmany(fetch_size), [])
+                    flat_rows = (row for chunk in rows for row in chunk)
+                    for portfolio_name, group in groupby(flat_rows, key=lambda row: row['name']):
+                        assets = {row['ticker']: row['weight'] for row in group}
+                        yield portfolio_name, self._normalize_weights(portfolio_name, assets)
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка потоковой загрузки портфелей: {e}")
+            raise
+    
+    def get_portfolios(self, names: Optional[List[str]] = None) -> Dict[str, Dict[str, float]]:
+        """
+        Загружает несколько портфелей одним запросом.
+        Без names возвращает все портфели; отсутствующие имена в результат не попадают.
+        При ошибке SQLite пробрасывает sqlite3.Error вместо неполного результата.
+        """
+        return dict(self.iter_portfolios(names))
+    
+    def get_all_portfolios(self) -> List[Tuple[str, str]]:
+        """
+        Возвращает список всех портфелей
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('SELECT name, description FROM portfolios ORDER BY name')
+                return [(row['name'], row['description']) for row in cursor.fetchall()]
             
-            assets = {}
-            total_weight = 0.0
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка получения списка портфелей: {e}")
+            return []
+    
+    def get_tickers(self) -> List[str]:
+        """
+        Возвращает отсортированный список тикеров, входящих хотя бы в один портфель
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.execute('SELECT DISTINCT ticker FROM portfolio_assets ORDER BY ticker')
+                return [row['ticker'] for row in cursor.fetchall()]
             
-            for row in cursor.fetchall():
-                ticker = row['ticker']
-                weight = row['weight']
-                assets[ticker] = weight
-                total_weight += weight
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка получения списка тикеров: {e}")
+            return []
+
+    # СПРАВОЧНИК ТИКЕРОВ
+    
+    @property
+    def ticker_index(self) -> TickerIndex:
+        """Индекс атрибутов тикеров (загружается из таблицы tickers один раз)"""
+        index = self._ticker_index
+        if index is None:
+            with self._ticker_lock:
+                if self._ticker_index is None:
+                    self._ticker_index = TickerIndex(self.get_ticker_rows())
+                index = self._ticker_index
+        return index
+    
+    def get_ticker_rows(self) -> List[TickerRow]:
+        """Строки таблицы tickers в порядке тикеров"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.execute('''
+                    SELECT ticker, asset_class, sector, risk_bucket, region, currency, flags
+                    FROM tickers ORDER BY ticker
+                ''')
+                return [tuple(row) for row in cursor.fetchall()]
             
-            # Нормализуем веса если сумма не равна 1.0
-            if assets and abs(total_weight - 1.0) > 0.001:
-                assets = {ticker: weight/total_weight for ticker, weight in assets.items()}
-                logger.warning(f"Веса портфеля '{portfolio_name}' нормализованы")
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка загрузки справочника тикеров: {e}")
+            return []
+    
+    def upsert_tickers(self, rows: List[TickerRow]) -> None:
+        """Добавляет или обновляет тикеры; индекс будет построен заново при следующем обращении"""
+        try:
+            with self._get_connection() as conn:
+                conn.executemany('''
+                    INSERT OR REPLACE INTO tickers (ticker, asset_class, sector, risk_bucket, region, currency, flags)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка обновления справочника тикеров: {e}")
+            raise
+        with self._ticker_lock:
+            self._ticker_index = None
+            self._exposures.clear()
+    
+    def get_portfolio_stamps(self, names: List[str]) -> Dict[str, tuple]:
+        """
+        Отметки состава портфелей: дата изменения, число активов, сумма весов и
+        сумма квадратов весов. Считаются по покрывающему индексу активов без
+        загрузки весов; меняются при любом изменении состава.
+        """
+        names = list(dict.fromkeys(names))
+        if not names:
+            return {}
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.execute('''
+                    SELECT p.name, p.last_modified, COUNT(pa.ticker), TOTAL(pa.weight), TOTAL(pa.weight * pa.weight)
+                    FROM portfolios p
+                    LEFT JOIN portfolio_assets pa ON pa.portfolio_id = p.id
+                    WHERE p.name IN ({})
+                    GROUP BY p.id
+                '''.format(', '.join('?' * len(names))), names)
+                return {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
             
-            return assets if assets else None
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка получения отметок портфелей: {e}")
+            return {}
+
+    def get_exposures(self, names: List[str], attribute: str = 'sector') -> Dict[str, Dict[str, float]]:
+        """
+        Доли категорий атрибута справочника (sector, asset_class, ...) по портфелям.
+        
+        Результат кэшируется по портфелю вместе с отметкой состава
+        (get_portfolio_stamps) и пересчитывается, когда отметка меняется.
+        Портфели без актуального кэша загружаются одним запросом и считаются
+        одним разреженным произведением (portfolio_exposures).
+        """
+        stamps = self.get_portfolio_stamps(names)
+        exposures: Dict[str, Dict[str, float]] = {}
+        with self._ticker_lock:
+            for name, stamp in stamps.items():
+                cached = self._exposures.get((attribute, name))
+                if cached is not None and cached[0] == stamp:
+                    exposures[name] = cached[1]
+        
+        missing = [name for name in stamps if name not in exposures]
+        if missing:
+            try:
+                portfolios = self.get_portfolios(missing)
+            except sqlite3.Error:
+                return {}
+            frame = portfolio_exposures(portfolios, attribute, self.ticker_index)
+            for name, row in frame.iterrows():
+                row = row[row > 0].sort_values(ascending=False, kind='stable')
+                exposures[name] = row.to_dict()
+            with self._ticker_lock:
+                for name in missing:
+                    if name in exposures:
+                        self._exposures[(attribute, name)] = (stamps[name], exposures[name])
+        return {name: exposures[name] for name in names if name in exposures}
+
+    # КЛИЕНТЫ
+    
+    CLIENT_QUERY = '''
+        SELECT c.name, p.name AS portfolio_name, c.description, c.risk_profile, c.investment_horizon,
+               c.experience, c.financial_goals, c.portfolio_type, c.risk_tolerance,
+               c.diversification_level, c.initial_investment, c.target_amount, c.expected_return,
+               c.volatility, c.sharpe_ratio, p.last_modified AS portfolio_last_modified, pa.ticker, pa.weight
+        FROM clients c
+        LEFT JOIN portfolios p ON p.id = c.portfolio_id
+        LEFT JOIN portfolio_assets pa ON pa.portfolio_id = c.portfolio_id
+        {where}
+        ORDER BY c.id, pa.weight DESC
+    '''
+    
+    def _client_profiles(self, rows) -> Iterator[ClientProfile]:
+        """Профили из строк CLIENT_QUERY (по строке на актив портфеля)"""
+        for _, group in groupby(rows, key=lambda row: row['name']):
+            group = list(group)
+            fields = {field: group[0][field] for field in PROFILE_FIELDS}
+            assets = {row['ticker']: row['weight'] for row in group if row['ticker'] is not None}
+            portfolio = self._normalize_weights(fields['portfolio_name'], assets) if assets else None
+            last_modified = group[0]['portfolio_last_modified']
+            yield ClientProfile(portfolio, None if last_modified is None else str(last_modified), **fields)
+    
+    def get_client(self, client_name: str) -> Optional[ClientProfile]:
+        """Профиль клиента с весами портфеля - один запрос по индексу имени"""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.execute(self.CLIENT_QUERY.format(where='WHERE c.name = ?'), (client_name,))
+                return next(self._client_profiles(cursor.fetchall()), None)
             
         except sqlite3.Error as e:
-            logger.error(f"Ошибка получения портфеля '{portfolio_name}': {e}")
+            logger.error(f"Ошибка загрузки клиента '{client_name}': {e}")
             return None
-        finally:
-            if conn:
-                conn.close()
-
-    def get_all_portfolios(self) -> List[Tuple[str, str]]:
+    
+    def get_clients(self, names: Optional[List[str]] = None) -> Dict[str, ClientProfile]:
         """
-        Возвращает список всех портфелей
+        Профили нескольких клиентов (без names - всех) пачками по BULK_QUERY_CHUNK.
+        При ошибке SQLite пробрасывает sqlite3.Error вместо неполного результата.
+        """
+        if names is None:
+            batches = [(self.CLIENT_QUERY.format(where=''), ())]
+        else:
+            unique_names = list(dict.fromkeys(names))
+            batches = []
+            for start in range(0, len(unique_names), self.BULK_QUERY_CHUNK):
+                chunk = tuple(unique_names[start:start + self.BULK_QUERY_CHUNK])
+                where = 'WHERE c.name IN ({})'.format(', '.join('?' * len(chunk)))
+                batches.append((self.CLIENT_QUERY.format(where=where), chunk))
+        
+        profiles: Dict[str, ClientProfile] = {}
+        try:
+            with self._get_connection() as conn:
+                for sql, params in batches:
+                    for profile in self._client_profiles(conn.execute(sql, params).fetchall()):
+                        profiles[profile.name] = profile
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка загрузки клиентов: {e}")
+            raise
+        return profiles
+    
+    def get_profile_stamp(self, client_name: str) -> Optional[Tuple]:
+        """
+        Отметка актуальности профиля клиента (без кэша): время изменения
+        портфеля и параметры цели, в формате ClientProfile.stamp.
+        None - клиента нет или база недоступна.
         """
-        conn = None
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
+            with self._get_connection() as conn:
+                row = conn.execute('''
+                    SELECT p.last_modified, {goal_fields} FROM clients c
+                    LEFT JOIN portfolios p ON p.id = c.portfolio_id
+                    WHERE c.name = ?
+                '''.format(goal_fields=', '.join(f'c.{field}' for field in GOAL_FIELDS)), (client_name,)).fetchone()
+                if row is None:
+                    return None
+                last_modified = row['last_modified']
+                return (None if last_modified is None else str(last_modified), *(row[field] for field in GOAL_FIELDS))
             
-            cursor.execute('SELECT name, description FROM portfolios ORDER BY name')
-            return [(row['name'], row['description']) for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка получения отметки профиля клиента '{client_name}': {e}")
+            return None
+    
+    def get_client_names(self) -> List[str]:
+        """Имена всех клиентов в порядке добавления"""
+        try:
+            with self._get_connection() as conn:
+                return [row['name'] for row in conn.execute('SELECT name FROM clients ORDER BY id').fetchall()]
             
         except sqlite3.Error as e:
-            logger.error(f"Ошибка получения списка портфелей: {e}")
+            logger.error(f"Ошибка получения списка клиентов: {e}")
             return []
-        finally:
-            if conn:
-                conn.close()
+    
+    # ПОДПИСКИ
+    
+    def get_subscription(self, client_name: str) -> Optional[Dict]:
+        """Строка подписки клиента ({'level', 'price', 'expires'}) или None"""
+        try:
+            with self._get_connection() as conn:
+                row = conn.execute(
+                    'SELECT level, price, expires FROM subscriptions WHERE client_name = ?', (client_name,)
+                ).fetchone()
+                return dict(row) if row else None
+            
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка загрузки подписки клиента '{client_name}': {e}")
+            return None
+    
+    def set_subscription(self, client_name: str, level: str, price: int = 0,
+                         expires: Optional[str] = None) -> None:
+        """Создает или изменяет подписку клиента и сбрасывает его запись в кэше прав"""
+        try:
+            with self._get_connection() as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO subscriptions (client_name, level, price, expires)
+                    VALUES (?, ?, ?, ?)
+                ''', (client_name, level, price, expires))
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка сохранения подписки клиента '{client_name}': {e}")
+            raise
+        ENTITLEMENTS.invalidate(client_name)
+
+# Общий экземпляр базы данных на процесс (создается лениво)
+_database_instances: Dict[str, PortfolioDatabase] = {}
+_database_lock = threading.Lock()
+
+def get_database(db_path: str = 'uniwest.db') -> PortfolioDatabase:
+    """Возвращает общий для процесса экземпляр PortfolioDatabase"""
+    key = db_path if db_path == ':memory:' else os.path.abspath(db_path)
+    db = _database_instances.get(key)
+    if db is None:
+        with _database_lock:
+            db = _database_instances.get(key)
+            if db is None:
+                db = PortfolioDatabase(db_path)
+                _database_instances[key] = db
+    return db
 
 # Функции для обратной совместимости
 def init_database():
     """Инициализирует базу данных (для обратной совместимости)"""
-    PortfolioDatabase()
+    get_database()
 
 def get_portfolio(portfolio_name: str) -> Optional[Dict[str, float]]:
     """Получает портфель (для обратной совместимости)"""
-    db = PortfolioDatabase()
-    return db.get_portfolio(portfolio_name)
+    return get_database().get_portfolio(portfolio_name)
 
 def get_all_portfolios() -> List[Tuple[str, str]]:
     """Получает все портфели (для обратной совместимости)"""
-    db = PortfolioDatabase()
-    return db.get_all_portfolios()
+    return get_database().get_all_portfolios()
+
+def get_portfolios(names: Optional[List[str]] = None) -> Dict[str, Dict[str, float]]:
+    """Загружает несколько портфелей одним запросом"""
+    return get_database().get_portfolios(names)
+
+# Кэш профилей клиентов на процесс
+CLIENTS = ClientRepository(lambda client_name: get_database().get_client(client_name),
+                           lambda: get_database().get_client_names())
+
+# Кэш прав доступа на процесс (подписки читаются из общей базы данных)
+ENTITLEMENTS = EntitlementService(lambda client_name: get_database().get_subscription(client_name))
+
+def get_ticker_index() -> TickerIndex:
+    """Индекс атрибутов тикеров общей базы данных"""
+    return get_database().ticker_index
+
+def portfolio_exposures(portfolios: Dict[str, Dict[str, float]], attribute: str = 'sector',
+                        index: Optional[TickerIndex] = None) -> pd.DataFrame:
+    """
+    Доли категорий атрибута справочника тикеров (портфели x категории).
+    
+    Позиции всех портфелей собираются в разреженную матрицу весов (COO) и
+    умножаются на матрицу тикеры x категории за один проход (TickerIndex.exposures).
+    """
+    index = index or get_ticker_index()
+    names = list(portfolios)
+    lengths = [len(portfolio or {}) for portfolio in portfolios.values()]
+    rows = np.repeat(np.arange(len(names)), lengths)
+    tickers = [ticker for portfolio in portfolios.values() for ticker in (portfolio or {})]
+    weights = np.fromiter((weight for portfolio in portfolios.values() for weight in (portfolio or {}).values()),
+                          dtype=float, count=len(tickers))
+    totals = index.exposures(attribute, rows, index.lookup(tickers), weights, len(names))
+    used = totals.any(axis=0)
+    return pd.DataFrame(totals[:, used], index=pd.Index(names, name='portfolio'),
+                        columns=[category for category, keep in zip(index.categories[attribute], used) if keep])
 
 # Новые функции для работы с клиентами
+def get_client_profile(client_name: str) -> Optional[ClientProfile]:
+    """Профиль клиента из кэша (при промахе - один запрос к таблице clients)"""
+    return CLIENTS.get(client_name)
+
 def get_client_details(client_name: str) -> Optional[Dict]:
     """Возвращает детальную информацию о клиенте"""
-    client_data = CLIENTS_DETAILED_DATA.get(client_name)
-    if client_data:
-        # Добавляем имя клиента в данные для совместимости с app.py
-        client_data_with_name = client_data.copy()
-        client_data_with_name['name'] = client_name
-        return client_data_with_name
-    return None
+    profile = get_client_profile(client_name)
+    return profile.to_dict() if profile else None
 
 def get_all_clients() -> List[str]:
     """Возвращает список всех клиентов"""
-    return list(CLIENTS_DETAILED_DATA.keys())
+    return CLIENTS.names()
 
 def get_portfolio_by_client(client_name: str) -> Optional[Dict[str, float]]:
     """Получает портфель по имени клиента"""
-    client_data = CLIENTS_DETAILED_DATA.get(client_name)
-    if not client_data:
+    profile = get_client_profile(client_name)
+    if not profile or not profile.portfolio:
         return None
-    
-    portfolio_name = client_data['portfolio_name']
-    return get_portfolio(portfolio_name)
-
-# ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ДЛЯ РЕКОМЕНДАЦИЙ
-def analyze_diversification(portfolio: Dict[str, float], client_data: Dict) -> List[str]:
-    """Анализ диверсификации портфеля"""
-    recommendations = []
-    num_assets = len(portfolio)
-    max_weight = max(portfolio.values()) if portfolio else 0
-    
-    # Анализ количества активов
-    if num_assets < 5:
-        recommendations.append("🔄 **Увеличьте диверсификацию**: Добавьте еще 2-3 актива для снижения риска")
-    elif num_assets > 12:
-        recommendations.append("⚖️ **Оптимизируйте портфель**: Слишком много активов может усложнить управление")
-    
-    # Анализ концентрации
-    if max_weight > 0.25:
-        top_asset = max(portfolio, key=portfolio.get)
-        recommendations.append(f"📉 **Снизьте концентрацию**: Актив {top_asset} составляет {max_weight:.1%} - рассмотрите уменьшение доли")
-    
-    # Анализ корреляции
-    if has_high_correlation_assets(portfolio):
-        recommendations.append("🌍 **Добавьте некоррелированные активы**: Рассмотрите золото (GLD) или международные ETF (VXUS) для диверсификации")
-    
-    return recommendations
-
-def analyze_risk_profile(portfolio: Dict[str, float], client_data: Dict) -> List[str]:
-    """Анализ соответствия портфеля профилю риска"""
-    recommendations = []
-    risk_tolerance = client_data.get('risk_tolerance', 0.5)
-    portfolio_risk = calculate_portfolio_risk(portfolio)
-    
-    # Сравнение риска портфеля с толерантностью клиента
-    if portfolio_risk > risk_tolerance + 0.2:
-        recommendations.append("🛡️ **Снизьте риск портфеля**: Текущий уровень риска превышает вашу толерантность")
-    elif portfolio_risk < risk_tolerance - 0.2:
-        recommendations.append("🚀 **Увеличьте потенциал роста**: Можно добавить больше акций роста для повышения доходности")
-    
-    # Анализ защитных активов
-    defensive_assets_weight = sum(weight for asset, weight in portfolio.items() 
-                                if asset in ['BND', 'GOVT', 'SHY', 'Cash', 'GLD', 'JNJ', 'PG'])
-    
-    if client_data['risk_profile'] in ['низкий', 'очень низкий'] and defensive_assets_weight < 0.4:
-        recommendations.append("🏦 **Увеличьте долю защитных активов**: Добавьте облигации (BND) для стабильности портфеля")
-    
-    return recommendations
-
-def analyze_asset_allocation(portfolio: Dict[str, float], client_data: Dict) -> List[str]:
-    """Анализ распределения активов"""
-    recommendations = []
-    
-    # Классификация активов
-    stocks_weight = sum(weight for asset, weight in portfolio.items() 
-                       if not is_defensive_asset(asset))
-    bonds_weight = sum(weight for asset, weight in portfolio.items() 
-                      if asset in ['BND', 'GOVT', 'SHY'])
-    cash_weight = portfolio.get('Cash', 0)
-    crypto_weight = sum(weight for asset, weight in portfolio.items() 
-                       if 'BTC' in asset or 'ETH' in asset)
-    
-    # Анализ по типу портфеля
-    portfolio_type = client_data['portfolio_type']
-    
-    if portfolio_type == 'агрессивный' and stocks_weight < 0.7:
-        recommendations.append("📈 **Увеличьте долю акций**: Для агрессивной стратегии целесообразно 70-80% в акциях")
-    
-    elif portfolio_type == 'сбалансированный' and not (0.4 <= stocks_weight <= 0.6):
-        recommendations.append("⚖️ **Балансируйте портфель**: Оптимальное соотношение 50/50 или 60/40 между акциями и облигациями")
-    
-    elif portfolio_type == 'доходный' and bonds_weight < 0.3:
-        recommendations.append("🏛️ **Увеличьте долю облигаций**: Для доходного портфеля рекомендуется 30-40% в облигациях")
-    
-    elif portfolio_type == 'ультра-консервативный' and bonds_weight < 0.5:
-        recommendations.append("🛡️ **Увеличьте долю защитных активов**: Для консервативного портфеля рекомендуется 50-70% в облигациях")
-    
-    # Анализ денежной позиции
-    if cash_weight < 0.03:
-        recommendations.append("💵 **Создайте денежный резерв**: Рекомендуется держать 3-5% наличности для возможностей")
-    elif cash_weight > 0.1:
-        recommendations.append("💰 **Используйте избыточную наличность**: Рассмотрите инвестирование части cash в доходные активы")
-    
-    # Анализ крипто-экспозиции
-    if crypto_weight > 0.1 and client_data['risk_profile'] in ['низкий', 'очень низкий']:
-        recommendations.append("⚡ **Снизьте долю криптоактивов**: Для вашего профиля риска рекомендуется не более 5% в крипто")
-    
-    return recommendations
-
-def generate_tactical_recommendations(client_data: Dict) -> List[str]:
-    """Тактические рекомендации на основе текущей рыночной ситуации"""
-    recommendations = []
-    portfolio_type = client_data['portfolio_type']
-    
-    # Рекомендации для разных типов портфелей
-    if portfolio_type == 'агрессивный':
-        recommendations.extend([
-            "🎯 **Фокус на рост**: Рассмотрите добавление технологических ETF (QQQ, ARKK)",
-            "⏰ **Ребалансировка раз в квартал**: Активно управляйте портфелем для максимизации доходности",
-            "📊 **Мониторинг волатильности**: Установите стоп-лосс уровни для защиты от сильных просадок"
-        ])
-    
-    elif portfolio_type == 'сбалансированный':
-        recommendations.extend([
-            "🔄 **Ребалансировка раз в 6 месяцев**: Поддерживайте целевое распределение активов",
-            "🌍 **Глобальная диверсификация**: Добавьте международные ETF (VXUS, EFA)",
-            "📈 **Дивидендная стратегия**: Рассмотрите дивидендные аристократы для стабильного дохода"
-        ])
-    
-    elif portfolio_type == 'доходный':
-        recommendations.extend([
-            "💵 **Реинвестирование дивидендов**: Используйте DRIP для сложного процента",
-            "🏢 **REIT и инфраструктура**: Добавьте риел-эстейт инвестиции для диверсификации дохода",
-            "📅 **Ежеквартальный доход**: Оптимизируйте для стабильных дивидендных выплат"
-        ])
-    
-    else:  # консервативный
-        recommendations.extend([
-            "🛡️ **Защита капитала**: Фокус на высококачественные корпоративные и государственные облигации",
-            "📉 **Минимизация волатильности**: Избегайте высокорисковых активов",
-            "🏦 **Ликвидность**: Держите повышенную долю cash для возможности покупки на просадках"
-        ])
-    
-    return recommendations
-
-def generate_general_recommendations(client_data: Dict) -> List[str]:
-    """Общие рекомендации для всех клиентов"""
-    horizon = client_data['investment_horizon']
-    experience = client_data['experience']
-    
-    recommendations = [
-        "📚 **Непрерывное обучение**: Изучайте финансовые рынки и инвестиционные стратегии",
-        "📊 **Регулярный мониторинг**: Проводите ежемесячный анализ портфеля",
-        "🎯 **Дисциплина**: Придерживайтесь своей инвестиционной стратегии несмотря на рыночные колебания"
-    ]
-    
-    # Персонализация по горизонту инвестирования
-    if '15+' in horizon or '10+' in horizon:
-        recommendations.append("🚀 **Долгосрочная перспектива**: Используйте преимущество времени для сложного процента")
-    elif '1-3' in horizon or '3-5' in horizon:
-        recommendations.append("⏳ **Краткосрочная осторожность**: Фокус на сохранение капитала и ликвидность")
-    
-    # Персонализация по опыту
-    if experience in ['начальный', 'Начинающий']:
-        recommendations.append("👨‍🏫 **Консультация специалиста**: Рассмотрите работу с финансовым советником для начала")
-    elif experience in ['эксперт', 'Эксперт']:
-        recommendations.append("💡 **Продвинутые стратегии**: Исследуйте опционные стратегии для хеджирования и дохода")
-    
-    return recommendations
+    return dict(profile.portfolio)
+
+# ПРАВИЛА РЕКОМЕНДАЦИЙ
+LOW_RISK_PROFILES = ['низкий', 'очень низкий']
+
+# Признаки: num_assets, max_weight, top_asset, tech_weight, portfolio_risk, risk_gap
+# (риск портфеля минус толерантность), protective_weight, stocks_weight, bonds_weight,
+# cash_weight, crypto_weight и поля профиля клиента (ClientProfile.to_dict)
+RECOMMENDATION_RULES = RuleSet([
+    Rule('greeting', [], "👤 **Персональные рекомендации для {client_name}**", group='greeting'),
+
+    # Диверсификация
+    Rule('few_assets', [('num_assets', '<', 5)],
+         "🔄 **Увеличьте диверсификацию**: Добавьте еще 2-3 актива для снижения риска", priority=50),
+    Rule('too_many_assets', [('num_assets', '>', 12)],
+         "⚖️ **Оптимизируйте портфель**: Слишком много активов может усложнить управление", priority=20),
+    Rule('concentration', [('max_weight', '>', 0.25)],
+         "📉 **Снизьте концентрацию**: Актив {top_asset} составляет {max_weight:.1%} - рассмотрите уменьшение доли",
+         priority=70),
+    Rule('correlated_assets', [('tech_weight', '>', 0.4)],
+         "🌍 **Добавьте некоррелированные активы**: Рассмотрите золото (GLD) или международные ETF (VXUS) для диверсификации",
+         priority=50),
+
+    # Соответствие профилю риска
+    Rule('risk_too_high', [('risk_gap', '>', 0.2)],
+         "🛡️ **Снизьте риск портфеля**: Текущий уровень риска превышает вашу толерантность", priority=90),
+    Rule('risk_too_low', [('risk_gap', '<', -0.2)],
+         "🚀 **Увеличьте потенциал роста**: Можно добавить больше акций роста для повышения доходности", priority=30),
+    Rule('few_protective_assets', [('risk_profile', 'in', LOW_RISK_PROFILES), ('protective_weight', '<', 0.4)],
+         "🏦 **Увеличьте долю защитных активов**: Добавьте облигации (BND) для стабильности портфеля", priority=80),
+
+    # Распределение активов
+    Rule('aggressive_stocks', [('portfolio_type', '==', 'агрессивный'), ('stocks_weight', '<', 0.7)],
+         "📈 **Увеличьте долю акций**: Для агрессивной стратегии целесообразно 70-80% в акциях", priority=60),
+    Rule('balanced_mix', [('portfolio_type', '==', 'сбалансированный'), ('stocks_weight', 'not between', (0.4, 0.6))],
+         "⚖️ **Балансируйте портфель**: Оптимальное соотношение 50/50 или 60/40 между акциями и облигациями", priority=60),
+    Rule('income_bonds', [('portfolio_type', '==', 'доходный'), ('bonds_weight', '<', 0.3)],
+         "🏛️ **Увеличьте долю облигаций**: Для доходного портфеля рекомендуется 30-40% в облигациях", priority=60),
+    Rule('conservative_bonds', [('portfolio_type', '==', 'ультра-консервативный'), ('bonds_weight', '<', 0.5)],
+         "🛡️ **Увеличьте долю защитных активов**: Для консервативного портфеля рекомендуется 50-70% в облигациях",
+         priority=60),
+    Rule('low_cash', [('cash_weight', '<', 0.03)],
+         "💵 **Создайте денежный резерв**: Рекомендуется держать 3-5% наличности для возможностей", priority=40),
+    Rule('excess_cash', [('cash_weight', '>', 0.1)],
+         "💰 **Используйте избыточную наличность**: Рассмотрите инвестирование части cash в доходные активы", priority=40),
+    Rule('crypto_exposure', [('crypto_weight', '>', 0.1), ('risk_profile', 'in', LOW_RISK_PROFILES)],
+         "⚡ **Снизьте долю криптоактивов**: Для вашего профиля риска рекомендуется не более 5% в крипто", priority=85),
+
+    # Тактические рекомендации по типу портфеля (в порядке важности)
+    Rule('aggressive_growth_focus', [('portfolio_type', '==', 'агрессивный')],
+         "🎯 **Фокус на рост**: Рассмотрите добавление технологических ETF (QQQ, ARKK)", group='tactical'),
+    Rule('aggressive_rebalancing', [('portfolio_type', '==', 'агрессивный')],
+         "⏰ **Ребалансировка раз в квартал**: Активно управляйте портфелем для максимизации доходности", group='tactical'),
+    Rule('aggressive_stop_loss', [('portfolio_type', '==', 'агрессивный')],
+         "📊 **Мониторинг волатильности**: Установите стоп-лосс уровни для защиты от сильных просадок", group='tactical'),
+    Rule('balanced_rebalancing', [('portfolio_type', '==', 'сбалансированный')],
+         "🔄 **Ребалансировка раз в 6 месяцев**: Поддерживайте целевое распределение активов", group='tactical'),
+    Rule('balanced_global', [('portfolio_type', '==', 'сбалансированный')],
+         "🌍 **Глобальная диверсификация**: Добавьте международные ETF (VXUS, EFA)", group='tactical'),
+    Rule('balanced_dividends', [('portfolio_type', '==', 'сбалансированный')],
+         "📈 **Дивидендная стратегия**: Рассмотрите дивидендные аристократы для стабильного дохода", group='tactical'),
+    Rule('income_drip', [('portfolio_type', '==', 'доходный')],
+         "💵 **Реинвестирование дивидендов**: Используйте DRIP для сложного процента", group='tactical'),
+    Rule('income_reit', [('portfolio_type', '==', 'доходный')],
+         "🏢 **REIT и инфраструктура**: Добавьте риел-эстейт инвестиции для диверсификации дохода", group='tactical'),
+    Rule('income_quarterly', [('portfolio_type', '==', 'доходный')],
+         "📅 **Ежеквартальный доход**: Оптимизируйте для стабильных дивидендных выплат", group='tactical'),
+    Rule('conservative_capital', [('portfolio_type', 'not in', ['агрессивный', 'сбалансированный', 'доходный'])],
+         "🛡️ **Защита капитала**: Фокус на высококачественные корпоративные и государственные облигации",
+         group='tactical'),
+    Rule('conservative_volatility', [('portfolio_type', 'not in', ['агрессивный', 'сбалансированный', 'доходный'])],
+         "📉 **Минимизация волатильности**: Избегайте высокорисковых активов", group='tactical'),
+    Rule('conservative_liquidity', [('portfolio_type', 'not in', ['агрессивный', 'сбалансированный', 'доходный'])],
+         "🏦 **Ликвидность**: Держите повышенную долю cash для возможности покупки на просадках", group='tactical'),
+
+    # Общие рекомендации
+    Rule('learning', [], "📚 **Непрерывное обучение**: Изучайте финансовые рынки и инвестиционные стратегии",
+         priority=10, group='general'),
+    Rule('monitoring', [], "📊 **Регулярный мониторинг**: Проводите ежемесячный анализ портфеля",
+         priority=10, group='general'),
+    Rule('discipline', [], "🎯 **Дисциплина**: Придерживайтесь своей инвестиционной стратегии несмотря на рыночные колебания",
+         priority=10, group='general'),
+    Rule('long_horizon', [('investment_horizon', 'contains', ['15+', '10+'])],
+         "🚀 **Долгосрочная перспектива**: Используйте преимущество времени для сложного процента", group='general'),
+    Rule('short_horizon', [('investment_horizon', 'contains', ['1-3', '3-5'])],
+         "⏳ **Краткосрочная осторожность**: Фокус на сохранение капитала и ликвидность", group='general'),
+    Rule('beginner', [('experience', 'in', ['начальный', 'Начинающий'])],
+         "👨‍🏫 **Консультация специалиста**: Рассмотрите работу с финансовым советником для начала", group='general'),
+    Rule('expert', [('experience', 'in', ['эксперт', 'Эксперт'])],
+         "💡 **Продвинутые стратегии**: Исследуйте опционные стратегии для хеджирования и дохода", group='general')
+], group_order=['greeting', 'analysis', 'tactical', 'general'],
+   group_limits={'tactical': 2, 'general': 2}, limit=8)
 
 # ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
 def has_high_correlation_assets(portfolio: Dict[str, float]) -> bool:
     """Проверяет наличие высококоррелированных активов"""
-    tech_assets = ['TSLA', 'NVDA', 'AMD', 'AAPL', 'MSFT', 'SQ']
-    tech_weight = sum(weight for asset, weight in portfolio.items() if asset in tech_assets)
-    return tech_weight > 0.4
+    return get_ticker_index().tagged_weight(portfolio, 'tech') > 0.4
 
 def is_defensive_asset(asset: str) -> bool:
     """Определяет, является ли актив защитным"""
-    defensive_assets = ['BND', 'GOVT', 'SHY', 'Cash', 'GLD', 'JNJ', 'PG', 'XOM', 'T', 'VZ']
-    return asset in defensive_assets
+    return get_ticker_index().has(asset, 'defensive')
+
+def asset_risk_weight(asset: str) -> float:
+    """Вес риска отдельного актива (по группе риска из справочника тикеров)"""
+    return get_ticker_index().risk_weight(asset)
 
 def calculate_portfolio_risk(portfolio: Dict[str, float]) -> float:
     """Упрощенный расчет риска портфеля"""
-    # Веса рисков для разных типов активов
-    risk_weights = {
-        'high_risk': ['TSLA', 'NVDA', 'AMD', 'SQ', 'ARKK', 'BTC-USD', 'ETH-USD'],
-        'medium_risk': ['AAPL', 'MSFT', 'VTI', 'VXUS', 'VNQ', 'VYM', 'SCHD'],
-        'low_risk': ['BND', 'GOVT', 'SHY', 'JNJ', 'PG', 'XOM', 'T', 'VZ', 'Cash', 'GLD']
-    }
-    
-    total_risk = 0
-    for asset, weight in portfolio.items():
-        if asset in risk_weights['high_risk']:
-            total_risk += weight * 0.8
-        elif asset in risk_weights['medium_risk']:
-            total_risk += weight * 0.5
+    if not portfolio:
+        return 0.0
+    index = get_ticker_index()
+    weights = np.fromiter(portfolio.values(), dtype=float, count=len(portfolio))
+    return min(float(weights @ index.risk_weights[index.lookup(portfolio)]), 1.0)
+
+# ПРИЗНАКИ ПОРТФЕЛЕЙ ДЛЯ ПРАВИЛ
+def recommendation_features(portfolios: Dict[str, Dict[str, float]], clients: Dict[str, Dict],
+                            index: Optional[TickerIndex] = None) -> pd.DataFrame:
+    """
+    Таблица признаков (клиенты x признаки) для RECOMMENDATION_RULES.
+
+    portfolios и clients - словари по имени клиента. Портфели раскладываются в
+    матрицу весов (клиенты x тикеры), признаки тикеров вычисляются один раз,
+    а доли групп активов и риск - умножение матрицы на вектор признаков,
+    выбранных из справочника тикеров по id.
+    """
+    names = list(portfolios)
+    ticker_ids: Dict[str, int] = {}
+    rows: List[int] = []
+    cols: List[int] = []
+    values: List[float] = []
+    for row, portfolio in enumerate(portfolios.values()):
+        for ticker, weight in portfolio.items():
+            rows.append(row)
+            cols.append(ticker_ids.setdefault(ticker, len(ticker_ids)))
+            values.append(weight)
+    index = index or get_ticker_index()
+    tickers = np.array(list(ticker_ids), dtype=object)
+    ids = index.lookup(tickers)
+    rows_index = np.asarray(rows, dtype=np.intp)
+    cols_index = np.asarray(cols, dtype=np.intp)
+    weights = np.zeros((len(names), len(tickers)))
+    np.add.at(weights, (rows_index, cols_index), values)
+    held = np.zeros(weights.shape, dtype=bool)
+    held[rows_index, cols_index] = True
+
+    def group_weight(mask) -> np.ndarray:
+        return weights @ np.asarray(mask, dtype=float)
+
+    has_assets = weights.shape[1] > 0
+    top = weights.argmax(axis=1) if has_assets else np.zeros(len(names), dtype=np.intp)
+    risk = group_weight(index.risk_weights[ids])
+
+    features = pd.DataFrame({
+        'num_assets': held.sum(axis=1),
+        'max_weight': weights.max(axis=1) if has_assets else np.zeros(len(names)),
+        'top_asset': tickers[top] if has_assets else np.full(len(names), '', dtype=object),
+        'tech_weight': group_weight(index.mask(ids, 'tech')),
+        'portfolio_risk': np.minimum(risk, 1.0),
+        'protective_weight': group_weight(index.mask(ids, 'protective')),
+        'stocks_weight': group_weight(~index.mask(ids, 'defensive')),
+        'bonds_weight': group_weight(index.category_mask(ids, 'asset_class', 'bond')),
+        'cash_weight': group_weight(index.category_mask(ids, 'asset_class', 'cash')),
+        'crypto_weight': group_weight(index.category_mask(ids, 'asset_class', 'crypto'))
+    }, index=pd.Index(names, name='client_name'))
+
+    client_frame = pd.DataFrame.from_dict({name: clients[name] for name in names}, orient='index')
+    features = features.join(client_frame.drop(columns=features.columns, errors='ignore'))
+    # Толерантность к риску по умолчанию - 0.5
+    if 'risk_tolerance' not in features:
+        features['risk_tolerance'] = 0.5
+    features['risk_tolerance'] = features['risk_tolerance'].fillna(0.5)
+    features['risk_gap'] = features['portfolio_risk'] - features['risk_tolerance']
+    features['client_name'] = features.index
+    return features
+
+# РЕКОМЕНДАЦИИ ПО ВСЕЙ КЛИЕНТСКОЙ БАЗЕ
+def generate_book_recommendations(client_names: Optional[List[str]] = None,
+                                  db: Optional[PortfolioDatabase] = None) -> Dict[str, List[str]]:
+    """
+    Ранжированные рекомендации для списка клиентов (по умолчанию - для всех).
+
+    Профили с портфелями загружаются одним запросом, правила RECOMMENDATION_RULES
+    вычисляются по таблице признаков за один проход.
+    """
+    db = db or get_database()
+    profiles = db.get_clients(client_names)
+    client_names = list(profiles) if client_names is None else list(client_names)
+    clients = {name: profile.to_dict() for name, profile in profiles.items()}
+    portfolios = {name: profile.portfolio for name, profile in profiles.items() if profile.portfolio}
+
+    recommendations = RECOMMENDATION_RULES.recommend(
+        recommendation_features(portfolios, clients, db.ticker_index)
+    ) if portfolios else {}
+    result = {}
+    for name in client_names:
+        if name not in clients:
+            result[name] = ["💡 Информация о клиенте не найдена"]
+        elif name not in recommendations:
+            result[name] = ["💡 Портфель клиента не найден"]
         else:
-            total_risk += weight * 0.2
-    
-    return min(total_risk, 1.0)
+            result[name] = recommendations[name]
+    return result
 
-# ОБНОВЛЕННАЯ ФУНКЦИЯ РЕКОМЕНДАЦИЙ
 def generate_client_recommendations(client_name: str) -> List[str]:
     """Генерирует реалистичные и точные рекомендации для клиента"""
-    client_data = CLIENTS_DETAILED_DATA.get(client_name)
-    if not client_data:
-        return ["💡 Информация о клиенте не найдена"]
-    
-    portfolio = get_portfolio_by_client(client_name)
-    if not portfolio:
-        return ["💡 Портфель клиента не найден"]
-    
-    recommendations = []
-    
-    # Персонализированное приветствие
-    recommendations.append(f"👤 **Персональные рекомендации для {client_name}**")
-    
-    # Анализ диверсификации
-    diversification_recs = analyze_diversification(portfolio, client_data)
-    recommendations.extend(diversification_recs)
-    
-    # Анализ риска
-    risk_recs = analyze_risk_profile(portfolio, client_data)
-    recommendations.extend(risk_recs)
-    
-    # Анализ распределения активов
-    allocation_recs = analyze_asset_allocation(portfolio, client_data)
-    recommendations.extend(allocation_recs)
-    
-    # Тактические рекомендации
-    tactical_recs = generate_tactical_recommendations(client_data)
-    recommendations.extend(tactical_recs[:2])  # Берем 2 самые важные
-    
-    # Общие рекомендации
-    general_recs = generate_general_recommendations(client_data)
-    recommendations.extend(general_recs[:2])  # Берем 2 самые важные
-    
-    return recommendations[:8]  # Ограничиваем 8 рекомендациями
+    return generate_book_recommendations([client_name])[client_name]
 
 # ФУНКЦИЯ ДЛЯ РЕКОМЕНДАЦИЙ С УЧЕТОМ ПОДПИСКИ - ОБНОВЛЕННАЯ ДЛЯ 3 УРОВНЕЙ
 def generate_subscription_based_recommendations(client_name: str) -> List[str]:
@@ -844,7 +1413,7 @@ def test_subscriptions():
 # Пример использования
 if __name__ == "__main__":
     # Инициализация базы данных
-    db = PortfolioDatabase()
+    db = get_database()
     
     # Тестируем подписки
     test_subscriptions()
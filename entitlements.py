@@ -0,0 +1,104 @@
+# entitlements.py - права доступа клиентов по подписке: битовые маски и кэш
+
+import threading
+import time
+from datetime import date, datetime, time as day_time, timedelta
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+# Функции, открываемые подпиской - биты маски прав
+BASIC_ANALYTICS = 1 << 0
+ADVANCED_ANALYTICS = 1 << 1
+NEWS_ANALYSIS = 1 << 2
+PREMIUM_ANALYTICS = 1 << 3
+
+SUBSCRIPTION_LEVELS = ('basic', 'advanced', 'premium')
+DEFAULT_LEVEL = 'basic'
+
+# Маска прав по уровню подписки (вычисляется один раз)
+LEVEL_FEATURES = {
+    'basic': BASIC_ANALYTICS,
+    'advanced': BASIC_ANALYTICS | ADVANCED_ANALYTICS | NEWS_ANALYSIS,
+    'premium': BASIC_ANALYTICS | ADVANCED_ANALYTICS | NEWS_ANALYSIS | PREMIUM_ANALYTICS
+}
+
+# Сколько секунд запись кэша считается актуальной, если подписка не истекает раньше
+DEFAULT_TTL = 300.0
+
+class Entitlement(NamedTuple):
+    """
+    Права клиента: действующий уровень, условия подписки и маска функций.
+
+    level - уровень с учетом срока действия (истекшая платная подписка дает
+    базовый уровень), plan_level - уровень из таблицы подписок.
+    """
+    client_name: str
+    level: str
+    plan_level: str
+    price: int
+    expires: Optional[date]
+    features: int
+
+    def allows(self, feature: int) -> bool:
+        """Открыты ли все функции из маски feature"""
+        return self.features & feature == feature
+
+    @property
+    def expired(self) -> bool:
+        return self.level != self.plan_level
+
+def resolve_entitlement(client_name: str, subscription: Optional[Dict], today: date) -> Entitlement:
+    """Права по строке таблицы подписок ({'level', 'price', 'expires'}) на дату today"""
+    subscription = subscription or {}
+    plan_level = subscription.get('level') or DEFAULT_LEVEL
+    if plan_level not in LEVEL_FEATURES:
+        plan_level = DEFAULT_LEVEL
+    expires = subscription.get('expires')
+    if isinstance(expires, str):
+        expires = date.fromisoformat(expires)
+    # Подписка действует включительно по день окончания
+    level = DEFAULT_LEVEL if expires is not None and expires < today else plan_level
+    return Entitlement(client_name, level, plan_level, int(subscription.get('price') or 0),
+                       expires, LEVEL_FEATURES[level])
+
+class EntitlementService:
+    """
+    Кэш прав доступа на процесс со сквозным чтением.
+
+    При промахе строка подписки читается через loader (например, из таблицы
+    subscriptions) и превращается в Entitlement с готовой маской. Запись
+    живет до min(ttl, конец дня окончания подписки): истекающая подписка
+    пересчитывается сразу после окончания срока, а не через ttl. После
+    изменения подписки вызывается invalidate.
+    """
+
+    def __init__(self, loader: Callable[[str], Optional[Dict]], ttl: float = DEFAULT_TTL,
+                 clock: Callable[[], float] = time.time):
+        self._loader = loader
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: Dict[str, Tuple[Entitlement, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, client_name: str) -> Entitlement:
+        now = self._clock()
+        entry = self._entries.get(client_name)
+        if entry is not None and now < entry[1]:
+            return entry[0]
+
+        entitlement = resolve_entitlement(client_name, self._loader(client_name),
+                                          datetime.fromtimestamp(now).date())
+        valid_until = now + self.ttl
+        if entitlement.expires is not None and not entitlement.expired:
+            end_of_term = datetime.combine(entitlement.expires + timedelta(days=1), day_time.min).timestamp()
+            valid_until = min(valid_until, end_of_term)
+        with self._lock:
+            self._entries[client_name] = (entitlement, valid_until)
+        return entitlement
+
+    def invalidate(self, client_name: Optional[str] = None) -> None:
+        """Сбрасывает кэш клиента (или всех клиентов)"""
+        with self._lock:
+            if client_name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(client_name, None)
@@ -0,0 +1,112 @@
+# figure_cache.py - кэш сериализованных графиков Plotly
+
+import logging
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+import plotly.graph_objects as go
+import plotly.io as pio
+import streamlit as st
+import streamlit.components.v1 as components
+from plotly.offline import get_plotlyjs
+from plotly.offline.offline import get_plotlyjs_version
+
+from result_cache import ResultCache, content_key
+from styles import STATIC_DIR, STATIC_URL
+
+logger = logging.getLogger(__name__)
+
+# Высота графика без явной layout.height (как у plotly.js и st.plotly_chart)
+DEFAULT_FIGURE_HEIGHT = 450
+
+# Настройки панели Plotly во всех графиках
+FIGURE_CONFIG = {'responsive': True, 'displaylogo': False}
+
+class FigureSpec(NamedTuple):
+    """Готовый к выводу график: фрагмент HTML (div и Plotly.newPlot с JSON фигуры) и высота в пикселях"""
+    html: str
+    height: int
+
+class FigureCache:
+    """
+    Кэш сериализованных графиков Plotly.
+
+    Ключ - хэш входных данных, тип графика и вариант верстки (mobile/desktop).
+    Хранится готовый фрагмент HTML с JSON фигуры, поэтому при попадании
+    фигура не строится, не проверяется и не кодируется в JSON заново.
+    Вытеснение - LRU с ограничением суммарного размера строк в байтах.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: Optional[float] = 3600.0,
+                 max_entries: int = 4096):
+        self._cache = ResultCache(max_bytes=max_bytes, ttl=ttl, max_entries=max_entries)
+
+    @staticmethod
+    def key(chart_type: str, variant: str, *data_keys: Any) -> str:
+        """data_keys - отпечатки входных данных (data_fingerprint) и прочие параметры графика"""
+        return content_key('figure', chart_type, variant, *data_keys)
+
+    @staticmethod
+    def serialize(figure: go.Figure) -> FigureSpec:
+        height = int(figure.layout.height or DEFAULT_FIGURE_HEIGHT)
+        html = pio.to_html(figure, config=FIGURE_CONFIG, include_plotlyjs=False, full_html=False,
+                           default_width='100%', default_height=f'{height}px', validate=False)
+        return FigureSpec(html, height)
+
+    def get_or_build(self, key: str, build: Callable[[], go.Figure]) -> FigureSpec:
+        """Готовый график из кэша или построенный и сериализованный один раз"""
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+        figure_spec = self.serialize(build())
+        # Размер записи - длина HTML-фрагмента
+        self._cache.set(key, figure_spec, size=len(figure_spec.html))
+        return figure_spec
+
+    def stats(self) -> Dict[str, int]:
+        return self._cache.stats()
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+def publish_plotly_js(static_dir: Path = STATIC_DIR) -> Optional[str]:
+    """
+    Записывает plotly.js из пакета plotly в каталог статики (имя с версией)
+    и возвращает его URL или None, если записать не удалось.
+    """
+    filename = f"plotly-{get_plotlyjs_version()}.min.js"
+    target = Path(static_dir) / filename
+    try:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if not target.exists():
+            tmp_path = target.with_name(f"{filename}.{os.getpid()}.tmp")
+            tmp_path.write_text(get_plotlyjs(), encoding='utf-8')
+            os.replace(tmp_path, target)
+    except OSError as e:
+        logger.warning(f"Не удалось записать plotly.js в {static_dir}: {e}")
+        return None
+    return f"{STATIC_URL}/{filename}"
+
+@lru_cache(maxsize=1)
+def plotly_js_src() -> str:
+    """
+    Адрес plotly.js для графиков: файл из статики приложения
+    (server.enableStaticServing), иначе CDN той же версии.
+    """
+    if st.get_option('server.enableStaticServing'):
+        url = publish_plotly_js()
+        if url is not None:
+            # Фрейм srcdoc наследует адрес страницы, относительный путь тот же, что у стилей
+            return url
+    logger.info("Раздача статики выключена, plotly.js загружается с CDN")
+    return f"https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js"
+
+def render_figure(figure_spec: FigureSpec) -> None:
+    """
+    Выводит готовый график на всю ширину контейнера без повторной проверки
+    и кодирования фигуры: фрагмент HTML из кэша передается во фрейм как есть.
+    """
+    components.html(f'<script src="{plotly_js_src()}"></script>{figure_spec.html}',
+                    height=figure_spec.height)
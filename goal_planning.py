@@ -0,0 +1,171 @@
+# goal_planning.py - Монте-Карло прогноз достижения целевой суммы клиента
+
+import math
+import re
+from concurrent.futures import Executor, ProcessPoolExecutor
+from statistics import NormalDist
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Горизонт по умолчанию, если из описания клиента его не удается извлечь
+DEFAULT_HORIZON_YEARS = 10
+
+# Перцентили для веерного графика
+FAN_PERCENTILES = (5, 25, 50, 75, 95)
+
+def parse_horizon_years(investment_horizon: str, default: int = DEFAULT_HORIZON_YEARS) -> int:
+    """
+    Горизонт в годах из описания клиента: '5-7 лет' -> 7, '15+ лет' -> 15.
+    Для диапазона берется верхняя граница - к ней цель должна быть достигнута.
+    """
+    numbers = [int(n) for n in re.findall(r'\d+', str(investment_horizon or ''))]
+    return max(numbers) if numbers else default
+
+def wilson_interval(successes: int, trials: int, confidence: float = 0.95) -> Tuple[float, float]:
+    """Доверительный интервал Уилсона для вероятности (корректен и при p, близком к 0 или 1)"""
+    if trials == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = successes / trials
+    denominator = 1 + z * z / trials
+    center = (p + z * z / (2 * trials)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / denominator
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+def simulate_goal_paths(initial_investment: float, target_amount: float, months: int,
+                        annual_return: float, annual_volatility: float, monthly_contribution: float,
+                        n_paths: int, seed, keep_paths: bool = False) -> Tuple[int, np.ndarray, Optional[np.ndarray]]:
+    """
+    Один пакет путей (пути x месяцы) без циклов по времени.
+
+    Месячный рост - логнормальный с заданными годовыми доходностью и
+    волатильностью. Стоимость с пополнениями в конце каждого месяца:
+    V_t = P_t * (V_0 + c * sum_{k<=t} 1 / P_k), где P_t - накопленный рост.
+
+    Возвращает число путей, достигших цели к концу горизонта, месяц первого
+    достижения цели для каждого пути (-1, если не достигнута) и, если
+    keep_paths, саму матрицу стоимостей.
+    """
+    rng = np.random.default_rng(seed)
+    log_mean = math.log1p(annual_return) - annual_volatility ** 2 / 2
+    monthly_mu = log_mean / 12
+    monthly_sigma = annual_volatility / math.sqrt(12)
+
+    log_growth = rng.standard_normal((n_paths, months))
+    log_growth *= monthly_sigma
+    log_growth += monthly_mu
+    growth = np.exp(np.cumsum(log_growth, axis=1, out=log_growth), out=log_growth)
+
+    if monthly_contribution:
+        contributions = np.cumsum(monthly_contribution / growth, axis=1)
+        contributions += initial_investment
+        values = np.multiply(growth, contributions, out=contributions)
+    else:
+        values = np.multiply(growth, initial_investment, out=growth)
+
+    reached = values >= target_amount
+    any_reached = reached.any(axis=1)
+    first_hit = np.where(any_reached, reached.argmax(axis=1) + 1, -1).astype(np.int16)
+    hits = int(np.count_nonzero(values[:, -1] >= target_amount))
+    return hits, first_hit, (values if keep_paths else None)
+
+class MonteCarloGoalEngine:
+    """
+    Вероятность достижения целевой суммы за горизонт инвестирования.
+
+    Пути симулируются пакетами по batch_size, каждый пакет - одна операция над
+    матрицей (пути x месяцы). Пакеты идут волнами; после каждой волны
+    проверяется доверительный интервал вероятности, и расчет прекращается,
+    когда его полуширина не превышает tolerance или набрано n_paths путей.
+    При max_workers > 1 пакеты считаются в пуле процессов.
+
+    Веерные перцентили считаются по первым fan_paths путям, чтобы не хранить
+    всю матрицу стоимостей; вероятность и срок достижения цели - по всем путям.
+    """
+
+    def __init__(self, n_paths: int = 200000, batch_size: int = 25000, tolerance: float = 0.005,
+                 confidence: float = 0.95, percentiles: Sequence[int] = FAN_PERCENTILES,
+                 fan_paths: int = 25000, max_workers: Optional[int] = None):
+        self.n_paths = n_paths
+        self.batch_size = batch_size
+        self.tolerance = tolerance
+        self.confidence = confidence
+        self.percentiles = tuple(percentiles)
+        self.fan_paths = fan_paths
+        self.max_workers = max_workers
+
+    def project(self, initial_investment: float, target_amount: float, horizon_years: float,
+                annual_return: float, annual_volatility: float, monthly_contribution: float = 0.0,
+                seed: Optional[int] = None, executor: Optional[Executor] = None) -> Dict:
+        """Прогноз для одного клиента"""
+        if executor is None and self.max_workers and self.max_workers > 1:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+                return self.project(initial_investment, target_amount, horizon_years, annual_return,
+                                    annual_volatility, monthly_contribution, seed, pool)
+
+        months = max(int(round(horizon_years * 12)), 1)
+        n_batches = max(math.ceil(self.n_paths / self.batch_size), 1)
+        seeds = np.random.SeedSequence(seed).spawn(n_batches)
+        wave_size = self.max_workers if executor is not None and self.max_workers else 1
+        params = (initial_investment, target_amount, months, annual_return, annual_volatility, monthly_contribution)
+
+        hits = 0
+        n_done = 0
+        first_hits: List[np.ndarray] = []
+        fan_values: List[np.ndarray] = []
+        interval = (0.0, 1.0)
+        for wave_start in range(0, n_batches, wave_size):
+            wave = range(wave_start, min(wave_start + wave_size, n_batches))
+            jobs = []
+            for batch in wave:
+                size = min(self.batch_size, self.n_paths - batch * self.batch_size)
+                keep_paths = batch * self.batch_size < self.fan_paths
+                args = params + (size, seeds[batch], keep_paths)
+                jobs.append(executor.submit(simulate_goal_paths, *args) if executor is not None
+                            else simulate_goal_paths(*args))
+            for job in jobs:
+                batch_hits, batch_first_hit, values = job.result() if executor is not None else job
+                hits += batch_hits
+                n_done += len(batch_first_hit)
+                first_hits.append(batch_first_hit)
+                if values is not None:
+                    fan_values.append(values)
+            interval = wilson_interval(hits, n_done, self.confidence)
+            if (interval[1] - interval[0]) / 2 <= self.tolerance:
+                break
+
+        first_hit = np.concatenate(first_hits)
+        fan = np.concatenate(fan_values)[:self.fan_paths]
+        # Срок достижения цели: медиана по всем путям, недостигшие считаются бесконечными
+        hit_months = np.where(first_hit > 0, first_hit, np.iinfo(np.int16).max)
+        median_months = float(np.median(hit_months))
+
+        return {
+            'probability': hits / n_done,
+            'probability_interval': interval,
+            'n_paths': n_done,
+            'months': np.arange(months + 1),
+            'initial_investment': initial_investment,
+            'target_amount': target_amount,
+            'monthly_contribution': monthly_contribution,
+            'horizon_years': horizon_years,
+            'percentiles': {
+                p: np.concatenate(([initial_investment], band))
+                for p, band in zip(self.percentiles, np.percentile(fan, self.percentiles, axis=0))
+            },
+            'median_time_to_goal_months': median_months if median_months <= months else None,
+            'reached_ever_probability': float(np.count_nonzero(first_hit > 0) / n_done)
+        }
+
+    def project_book(self, goals: Dict[str, Dict], seed: Optional[int] = None) -> Dict[str, Dict]:
+        """
+        Прогноз для многих клиентов. goals: {клиент: параметры project}.
+        Один пул процессов используется для всех клиентов.
+        """
+        seeds = dict(zip(goals, np.random.SeedSequence(seed).generate_state(len(goals))))
+        if self.max_workers and self.max_workers > 1:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+                return {name: self.project(**params, seed=int(seeds[name]), executor=pool)
+                        for name, params in goals.items()}
+        return {name: self.project(**params, seed=int(seeds[name])) for name, params in goals.items()}
@@ -0,0 +1,470 @@
+# optimizer.py - оптимизация по Марковицу: эффективная граница с ограничениями
+
+import math
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from database import get_ticker_index
+from result_cache import ResultCache, content_key
+from risk_engine import RiskEngine
+
+class PortfolioConstraints:
+    """
+    Ограничения на веса: только длинные позиции, максимальный вес актива и
+    границы суммарной доли классов активов {класс: (минимум, максимум)}.
+    Без long_only разрешены короткие позиции до max_weight по модулю.
+    """
+
+    def __init__(self, long_only: bool = True, max_weight: float = 1.0,
+                 class_bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+                 asset_classes: Optional[Dict[str, str]] = None):
+        self.long_only = long_only
+        self.max_weight = max_weight
+        self.class_bounds = dict(class_bounds or {})
+        # Классы по умолчанию - группы риска из справочника тикеров
+        self.asset_classes = (get_ticker_index().mapping('risk_bucket') if asset_classes is None
+                              else dict(asset_classes))
+
+    def weight_bounds(self, n_assets: int) -> Tuple[np.ndarray, np.ndarray]:
+        lower = 0.0 if self.long_only else -self.max_weight
+        return np.full(n_assets, lower), np.full(n_assets, self.max_weight)
+
+    def class_rows(self, tickers: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Строки матрицы ограничений по классам и их границы"""
+        classes = [c for c in sorted(self.class_bounds)
+                   if any(self.asset_classes.get(t) == c for t in tickers)]
+        rows = np.array([[1.0 if self.asset_classes.get(t) == c else 0.0 for t in tickers] for c in classes])
+        lower = np.array([self.class_bounds[c][0] for c in classes])
+        upper = np.array([self.class_bounds[c][1] for c in classes])
+        return rows.reshape(len(classes), len(tickers)), lower, upper
+
+    def key(self, tickers: Sequence[str]) -> Tuple:
+        """Каноническое представление ограничений для ключей кэша"""
+        return (self.long_only, self.max_weight, tuple(sorted(self.class_bounds.items())),
+                tuple(self.asset_classes.get(t) for t in tickers))
+
+    def check_feasible(self, tickers: Sequence[str]) -> None:
+        lower, upper = self.weight_bounds(len(tickers))
+        if upper.sum() < 1.0 - 1e-12 or lower.sum() > 1.0 + 1e-12:
+            raise ValueError(f"Ограничение max_weight={self.max_weight} недостижимо для {len(tickers)} активов")
+        for asset_class, (low, high) in self.class_bounds.items():
+            if low > high:
+                raise ValueError(f"Неверные границы класса {asset_class}: {low} > {high}")
+            in_class = np.array([self.asset_classes.get(t) == asset_class for t in tickers])
+            if not in_class.any():
+                continue
+            # Максимально и минимально достижимая доля класса при бюджете 1
+            if min(high, upper[in_class].sum()) + upper[~in_class].sum() < 1.0 - 1e-12 or low > upper[in_class].sum():
+                raise ValueError(f"Границы класса {asset_class} недостижимы для заданных активов")
+
+def project_to_bounds(weights: np.ndarray, lower: np.ndarray, upper: np.ndarray,
+                      total: float = 1.0, iterations: int = 100) -> np.ndarray:
+    """
+    Евклидова проекция на множество {lower <= w <= upper, sum(w) = total}.
+
+    Проекция - clip(weights - tau, lower, upper), сдвиг tau ищется делением
+    отрезка пополам (сумма монотонно убывает по tau); остаток округления
+    распределяется по весам строго внутри границ. В отличие от обрезки с
+    последующим делением на сумму, границы не нарушаются.
+    """
+    weights = np.asarray(weights, dtype=float)
+    low, high = float(np.min(weights - upper)), float(np.max(weights - lower))
+    for _ in range(iterations):
+        tau = (low + high) / 2
+        if np.clip(weights - tau, lower, upper).sum() > total:
+            low = tau
+        else:
+            high = tau
+    projected = np.clip(weights - (low + high) / 2, lower, upper)
+    interior = (projected > lower) & (projected < upper)
+    if interior.any():
+        projected[interior] += (total - projected.sum()) / interior.sum()
+    return projected
+
+class QPSolver:
+    """
+    ADMM-решатель задачи min 1/2 x'Px + q'x при l <= Ax <= u (схема OSQP).
+
+    Матрица K = P + sigma*I + A' diag(rho) A обращается один раз на значение
+    rho и хранится в решателе, поэтому итерация стоит два умножения матрицы
+    на вектор, а задачи с той же P и A, но другими q, l, u (точки эффективной
+    границы) решаются без повторной факторизации. Шаг rho адаптируется по
+    соотношению невязок, значения округляются до степеней 2, чтобы соседние
+    задачи переиспользовали уже обращенные матрицы. Решение можно начинать
+    с предыдущего (x, z, y).
+    """
+
+    def __init__(self, P: np.ndarray, A: np.ndarray, equality_rows: np.ndarray,
+                 free_rows: Optional[np.ndarray] = None,
+                 rho: float = 0.1, sigma: float = 1e-6, alpha: float = 1.6):
+        self.P = P
+        self.A = A
+        self.alpha = alpha
+        self.sigma = sigma
+        # Строки-равенства получают большой rho, строки без границ - минимальный
+        self._rho_scale = np.where(equality_rows, 1e3, 1.0)
+        self._free_rows = np.zeros(A.shape[0], dtype=bool) if free_rows is None else free_rows
+        self.rho = rho
+        self._inverses: Dict[float, np.ndarray] = {}
+        # Строки-границы вида x_j (единственный ненулевой элемент 1): при уточнении
+        # активные границы фиксируют переменные, и система ККТ решается только
+        # для свободных переменных
+        unit_rows = (np.count_nonzero(A, axis=1) == 1) & np.isclose(A.max(axis=1), 1.0)
+        self._bound_var = np.where(unit_rows, A.argmax(axis=1), -1)
+
+    def _rho_vector(self, rho: float) -> np.ndarray:
+        return np.where(self._free_rows, 1e-6, rho * self._rho_scale)
+
+    def _inverse(self, rho: float) -> np.ndarray:
+        K_inv = self._inverses.get(rho)
+        if K_inv is None:
+            rho_vector = self._rho_vector(rho)
+            K = self.P + self.sigma * np.eye(self.P.shape[0]) + self.A.T @ (rho_vector[:, None] * self.A)
+            K_inv = self._inverses[rho] = np.linalg.inv(K)
+        return K_inv
+
+    def solve(self, q: np.ndarray, lower: np.ndarray, upper: np.ndarray,
+              warm: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None,
+              eps_abs: float = 1e-8, eps_rel: float = 1e-7, polish_eps: float = 1e-4,
+              polish_iter: int = 2000, max_iter: int = 20000) -> Tuple[Tuple[np.ndarray, np.ndarray, np.ndarray], int]:
+        """
+        Возвращает (x, z, y) и число итераций.
+
+        ADMM ведется до грубой точности polish_eps, после чего решение
+        уточняется: по двойственным переменным угадывается множество активных
+        ограничений и решается система ККТ. Если уточнение не сошлось, ADMM
+        продолжается с большей точностью (в крайнем случае до eps_abs/eps_rel).
+        """
+        if warm is None:
+            x = np.zeros(self.A.shape[1])
+            state = (x, np.clip(self.A @ x, lower, upper), np.zeros(self.A.shape[0]))
+        else:
+            state = tuple(v.copy() for v in warm)
+
+        # Активное множество соседней задачи - обычно точное начальное приближение
+        if warm is not None:
+            polished = self._polish(q, lower, upper, state)
+            if polished is not None:
+                return polished, 0
+
+        # Если активное множество не угадано, ADMM продолжается с более высокой точностью
+        iterations = 0
+        for eps in (polish_eps, polish_eps * 1e-1, polish_eps * 1e-2):
+            state, done = self._iterate(q, lower, upper, state, eps, eps, min(polish_iter, max_iter - iterations))
+            iterations += done
+            polished = self._polish(q, lower, upper, state)
+            if polished is not None:
+                return polished, iterations
+        state, done = self._iterate(q, lower, upper, state, eps_abs, eps_rel, max_iter - iterations)
+        return state, iterations + done
+
+    def _iterate(self, q: np.ndarray, lower: np.ndarray, upper: np.ndarray, state,
+                 eps_abs: float, eps_rel: float, max_iter: int,
+                 check_every: int = 10, adapt_every: int = 50):
+        A, P, alpha, sigma = self.A, self.P, self.alpha, self.sigma
+        x, z, y = state
+        rho = self._rho_vector(self.rho)
+        K_inv = self._inverse(self.rho)
+
+        iteration = 0
+        for iteration in range(1, max_iter + 1):
+            x_tilde = K_inv @ (sigma * x - q + A.T @ (rho * z - y))
+            z_relaxed = alpha * (A @ x_tilde) + (1 - alpha) * z
+            x = alpha * x_tilde + (1 - alpha) * x
+            z_new = np.clip(z_relaxed + y / rho, lower, upper)
+            y = y + rho * (z_relaxed - z_new)
+            z = z_new
+
+            if iteration % check_every == 0:
+                Ax, Px, ATy = A @ x, P @ x, A.T @ y
+                primal = np.abs(Ax - z).max()
+                dual = np.abs(Px + q + ATy).max()
+                primal_scale = max(np.abs(Ax).max(), np.abs(z).max(), 1e-12)
+                dual_scale = max(np.abs(Px).max(), np.abs(ATy).max(), np.abs(q).max(), 1e-12)
+                if primal <= eps_abs + eps_rel * primal_scale and dual <= eps_abs + eps_rel * dual_scale:
+                    break
+                if iteration % adapt_every == 0 and dual > 0:
+                    ratio = math.sqrt((primal / primal_scale) / (dual / dual_scale))
+                    if ratio > 5 or ratio < 0.2:
+                        # Новый rho округляется до степени 2: обращенная матрица переиспользуется
+                        self.rho = 2.0 ** round(math.log2(self.rho * ratio))
+                        rho = self._rho_vector(self.rho)
+                        K_inv = self._inverse(self.rho)
+        return (x, z, y), iteration
+
+    def _polish(self, q: np.ndarray, lower: np.ndarray, upper: np.ndarray, state,
+                max_steps: int = 25, delta: float = 1e-10, tolerance: float = 1e-9):
+        """
+        Точное решение методом активного множества или None.
+
+        Начальное множество активных ограничений угадывается по (z, y) ADMM,
+        затем уточняется шагами прямо-двойственного метода: нарушенные
+        ограничения добавляются, ограничения с множителем неверного знака
+        снимаются. Каждый шаг - решение системы ККТ.
+        """
+        x, z, y = state
+        equality = lower == upper
+        at_lower = (z - lower < -y) & ~equality
+        at_upper = (upper - z < y) & ~equality & ~at_lower
+
+        for _ in range(max_steps):
+            solved = self._solve_active(q, lower, upper, equality | at_lower | at_upper, at_upper, delta)
+            if solved is None:
+                return None
+            x_new, y_new = solved
+            Ax = self.A @ x_new
+            # Множители у нижних границ <= 0, у верхних >= 0
+            keep_lower = at_lower & (y_new <= tolerance)
+            keep_upper = at_upper & (y_new >= -tolerance)
+            next_lower = keep_lower | ((Ax < lower - tolerance) & ~equality & ~keep_upper)
+            next_upper = keep_upper | ((Ax > upper + tolerance) & ~equality & ~next_lower)
+            if np.array_equal(next_lower, at_lower) and np.array_equal(next_upper, at_upper):
+                return x_new, np.clip(Ax, lower, upper), y_new
+            at_lower, at_upper = next_lower, next_upper
+        return None
+
+    def _solve_active(self, q: np.ndarray, lower: np.ndarray, upper: np.ndarray,
+                      active_rows: np.ndarray, at_upper: np.ndarray, delta: float):
+        """
+        Система ККТ при заданных активных ограничениях (все активные - равенства).
+        Возвращает (x, y) или None, если система не решается.
+        """
+        n = self.A.shape[1]
+        targets = np.where(at_upper, upper, lower)
+        bound_rows = np.flatnonzero(active_rows & (self._bound_var >= 0))
+        fixed_vars = self._bound_var[bound_rows]
+        if len(np.unique(fixed_vars)) != len(fixed_vars):
+            return None
+        general_rows = np.flatnonzero(active_rows & (self._bound_var < 0))
+        free_vars = np.setdiff1d(np.arange(n), fixed_vars)
+
+        x = np.zeros(n)
+        x[fixed_vars] = targets[bound_rows]
+        P_free = self.P[np.ix_(free_vars, free_vars)]
+        G = self.A[np.ix_(general_rows, free_vars)]
+        m = len(general_rows)
+        kkt = np.block([[P_free, G.T], [G, np.zeros((m, m))]])
+        rhs = np.concatenate([
+            -q[free_vars] - self.P[np.ix_(free_vars, fixed_vars)] @ x[fixed_vars],
+            targets[general_rows] - self.A[np.ix_(general_rows, fixed_vars)] @ x[fixed_vars]
+        ])
+        try:
+            solution = np.linalg.solve(kkt, rhs)
+        except np.linalg.LinAlgError:
+            # Вырожденная система (линейная задача или зависимые ограничения):
+            # регуляризация и итеративное уточнение
+            size = len(free_vars)
+            regularized = kkt + np.diag(np.concatenate([np.full(size, delta), np.full(m, -delta)]))
+            try:
+                solution = np.linalg.solve(regularized, rhs)
+                for _ in range(3):
+                    solution += np.linalg.solve(regularized, rhs - kkt @ solution)
+            except np.linalg.LinAlgError:
+                return None
+        if not np.all(np.isfinite(solution)):
+            return None
+
+        x[free_vars] = solution[:len(free_vars)]
+        y = np.zeros(self.A.shape[0])
+        y[general_rows] = solution[len(free_vars):]
+        # Множители границ - из условия стационарности Px + q + A'y = 0
+        y[bound_rows] = -(self.P @ x + q + self.A[general_rows].T @ y[general_rows])[fixed_vars]
+        return x, y
+
+class EfficientFrontierOptimizer:
+    """
+    Эффективная граница Марковица для набора активов.
+
+    Строки ограничений: бюджет (сумма весов = 1), целевая доходность, границы
+    весов, доли классов. Для всех точек границы меняются только границы строки
+    доходности, поэтому решатель с обращенной матрицей один, а каждая следующая
+    точка стартует с решения соседней.
+    """
+
+    def __init__(self, mean_returns: np.ndarray, covariance: np.ndarray, tickers: Sequence[str],
+                 constraints: Optional[PortfolioConstraints] = None, risk_free_rate: float = 0.0):
+        self.tickers = list(tickers)
+        self.mean_returns = np.asarray(mean_returns, dtype=float)
+        self.covariance = np.asarray(covariance, dtype=float)
+        self.constraints = constraints or PortfolioConstraints()
+        self.risk_free_rate = risk_free_rate
+        self.constraints.check_feasible(self.tickers)
+
+        n = len(self.tickers)
+        weight_lower, weight_upper = self.constraints.weight_bounds(n)
+        class_rows, class_lower, class_upper = self.constraints.class_rows(self.tickers)
+        # Масштабирование: ковариация и строка доходности приводятся к единичному
+        # порядку величины, иначе ADMM сходится на порядки медленнее
+        self._cost_scale = max(float(np.mean(np.diag(self.covariance))), 1e-12)
+        self._return_scale = max(float(np.mean(np.abs(self.mean_returns))), 1e-12)
+        scaled_returns = self.mean_returns / self._return_scale
+        self.A = np.vstack([np.ones((1, n)), scaled_returns[None, :], np.eye(n), class_rows])
+        self.lower = np.concatenate([[1.0, -np.inf], weight_lower, class_lower])
+        self.upper = np.concatenate([[1.0, np.inf], weight_upper, class_upper])
+
+        P = self.covariance / self._cost_scale
+        rho = 0.1
+        budget = np.zeros(len(self.lower), dtype=bool)
+        budget[0] = True
+        return_row = np.zeros(len(self.lower), dtype=bool)
+        return_row[1] = True
+        self._free_return_solver = QPSolver(P, self.A, budget, return_row, rho=rho)
+        self._target_solver = QPSolver(P, self.A, budget | return_row, rho=rho)
+        # Линейная задача максимальной доходности (P = 0)
+        self._max_return_solver = QPSolver(np.zeros_like(P), self.A, budget, return_row, rho=rho)
+        self.iterations = 0
+
+    @classmethod
+    def from_engine(cls, engine: RiskEngine, tickers: Optional[Sequence[str]] = None,
+                    constraints: Optional[PortfolioConstraints] = None) -> 'EfficientFrontierOptimizer':
+        """Годовые средние и ковариация из риск-движка (по умолчанию - все его активы)"""
+        tickers = list(tickers or engine.tickers)
+        index = [engine.tickers.index(t) for t in tickers]
+        scale = engine.periods_per_year
+        return cls(engine.mean_returns[index] * scale, engine.covariance[np.ix_(index, index)] * scale,
+                   tickers, constraints, engine.risk_free_rate)
+
+    def _solve(self, solver: QPSolver, q: np.ndarray, target: Optional[float] = None, warm=None):
+        lower, upper = self.lower.copy(), self.upper.copy()
+        if target is not None:
+            lower[1] = upper[1] = target / self._return_scale
+        state, iterations = solver.solve(q, lower, upper, warm)
+        self.iterations += iterations
+        return state
+
+    def _clean(self, weights: np.ndarray) -> np.ndarray:
+        """
+        Убирает численный шум ADMM: веса меньше 1e-8 обнуляются, остальные
+        проецируются на границы весов с суммой 1 (project_to_bounds)
+        """
+        lower, upper = self.constraints.weight_bounds(len(weights))
+        held = np.abs(weights) >= 1e-8
+        if lower[held].sum() > 1.0 or upper[held].sum() < 1.0:
+            held[:] = True
+        cleaned = np.zeros(len(weights))
+        cleaned[held] = project_to_bounds(weights[held], lower[held], upper[held])
+        return cleaned
+
+    def portfolio_stats(self, weights: np.ndarray) -> Dict[str, float]:
+        expected_return = float(self.mean_returns @ weights)
+        volatility = float(math.sqrt(max(weights @ self.covariance @ weights, 0.0)))
+        sharpe = (expected_return - self.risk_free_rate) / volatility if volatility > 0 else 0.0
+        return {'expected_return': expected_return, 'volatility': volatility, 'sharpe_ratio': sharpe}
+
+    def _point(self, weights: np.ndarray) -> Dict:
+        weights = self._clean(weights)
+        return {'weights': dict(zip(self.tickers, weights.tolist())), **self.portfolio_stats(weights)}
+
+    def min_variance(self):
+        return self._solve(self._free_return_solver, np.zeros(len(self.tickers)))
+
+    def max_return(self):
+        return self._solve(self._max_return_solver, -self.mean_returns / self._return_scale)
+
+    def frontier(self, n_points: int = 50, refine_tangency: bool = True) -> Dict:
+        """
+        Эффективная граница из n_points точек от портфеля минимальной дисперсии
+        до максимально доходного, а также касательный портфель (макс. Шарп).
+        """
+        zero = np.zeros(len(self.tickers))
+        min_state = self.min_variance()
+        max_state = self.max_return()
+        min_weights, max_weights = self._clean(min_state[0]), self._clean(max_state[0])
+        targets = np.linspace(self.mean_returns @ min_weights, self.mean_returns @ max_weights, n_points)
+
+        weights = np.empty((n_points, len(self.tickers)))
+        state = min_state
+        for i, target in enumerate(targets):
+            state = self._solve(self._target_solver, zero, target, warm=state)
+            weights[i] = self._clean(state[0])
+
+        stats = [self.portfolio_stats(w) for w in weights]
+        sharpe = np.array([s['sharpe_ratio'] for s in stats])
+        best = int(np.argmax(sharpe))
+        tangency = weights[best]
+        if refine_tangency and n_points > 2:
+            tangency = self._refine_tangency(targets[max(best - 1, 0)], targets[min(best + 1, n_points - 1)],
+                                             weights[best])
+
+        return {
+            'tickers': self.tickers,
+            'target_returns': targets,
+            'returns': np.array([s['expected_return'] for s in stats]),
+            'volatilities': np.array([s['volatility'] for s in stats]),
+            'sharpe_ratios': sharpe,
+            'weights': weights,
+            'min_variance': self._point(min_weights),
+            'tangency': self._point(tangency),
+            'iterations': self.iterations
+        }
+
+    def _refine_tangency(self, low: float, high: float, start: np.ndarray, steps: int = 20) -> np.ndarray:
+        """Золотое сечение по целевой доходности между соседями лучшей точки границы"""
+        zero = np.zeros(len(self.tickers))
+        ratio = (math.sqrt(5) - 1) / 2
+        warm = None
+        best_weights, best_sharpe = start, self.portfolio_stats(start)['sharpe_ratio']
+
+        def sharpe_at(target: float) -> float:
+            nonlocal warm, best_weights, best_sharpe
+            warm = self._solve(self._target_solver, zero, target, warm=warm)
+            weights = self._clean(warm[0])
+            sharpe = self.portfolio_stats(weights)['sharpe_ratio']
+            if sharpe > best_sharpe:
+                best_weights, best_sharpe = weights, sharpe
+            return sharpe
+
+        a, b = low, high
+        c, d = b - ratio * (b - a), a + ratio * (b - a)
+        fc, fd = sharpe_at(c), sharpe_at(d)
+        for _ in range(steps):
+            if fc > fd:
+                b, d, fd = d, c, fc
+                c = b - ratio * (b - a)
+                fc = sharpe_at(c)
+            else:
+                a, c, fc = c, d, fd
+                d = a + ratio * (b - a)
+                fd = sharpe_at(d)
+        return best_weights
+
+# Кэш построенных границ: ключ - (активы, ограничения, версия ковариации)
+_frontier_cache = ResultCache(max_bytes=64 * 1024 * 1024, ttl=None, max_entries=256)
+
+def _freeze_frontier(frontier: Dict) -> Dict:
+    """Массивы границы перед помещением в кэш делаются доступными только для чтения"""
+    for value in frontier.values():
+        if isinstance(value, np.ndarray):
+            value.setflags(write=False)
+    return frontier
+
+def _copy_frontier(frontier: Dict) -> Dict:
+    """Копия словарей и списков границы из кэша (массивы общие, только для чтения)"""
+    copied = dict(frontier, tickers=list(frontier['tickers']))
+    for point in ('min_variance', 'tangency'):
+        copied[point] = dict(frontier[point], weights=dict(frontier[point]['weights']))
+    return copied
+
+def get_efficient_frontier(engine: RiskEngine, tickers: Optional[Sequence[str]] = None,
+                           constraints: Optional[PortfolioConstraints] = None,
+                           n_points: int = 50) -> Dict:
+    """
+    Эффективная граница через общий кэш; повторный запрос с теми же данными
+    не пересчитывается. Словари результата - копии, массивы - только для чтения.
+    """
+    tickers = sorted(tickers or engine.tickers)
+    constraints = constraints or PortfolioConstraints()
+    key = content_key('efficient_frontier', tickers, constraints.key(tickers), engine.version,
+                      engine.risk_free_rate, n_points)
+    return _copy_frontier(_frontier_cache.get_or_compute(
+        key, lambda: _freeze_frontier(EfficientFrontierOptimizer.from_engine(engine, tickers, constraints)
+                                      .frontier(n_points))
+    ))
+
+def rebalance_to_target(current: Dict[str, float], target: Dict[str, float],
+                        min_change: float = 0.005) -> Dict[str, float]:
+    """Изменения весов для перехода к целевому портфелю (без изменений меньше min_change)"""
+    changes = {ticker: target.get(ticker, 0.0) - current.get(ticker, 0.0)
+               for ticker in sorted(set(current) | set(target))}
+    return {ticker: change for ticker, change in changes.items() if abs(change) >= min_change}
@@ -0,0 +1,44 @@
+# portfolio_types.py - классификация портфелей по типу
+
+from typing import Dict
+
+import numpy as np
+
+from database import get_ticker_index
+
+DEFAULT_PORTFOLIO_TYPE = 'сбалансированный'
+
+# Параметры месячной доходности для синтетической истории по типу портфеля
+RETURN_PARAMS = {
+    'агрессивный': {'mean': 0.012, 'std': 0.055},
+    'сбалансированный': {'mean': 0.008, 'std': 0.035},
+    'доходный': {'mean': 0.006, 'std': 0.028},
+    'ультра-консервативный': {'mean': 0.004, 'std': 0.015}
+}
+
+def classify_portfolio(aggressive_score: float, conservative_score: float) -> str:
+    """Определяет тип портфеля по долям агрессивных и защитных активов"""
+    if aggressive_score > 0.4:
+        return 'агрессивный'
+    elif conservative_score > 0.5:
+        return 'ультра-консервативный'
+    elif conservative_score > 0.3:
+        return 'доходный'
+    else:
+        return DEFAULT_PORTFOLIO_TYPE
+
+def classify_portfolios(aggressive_scores: np.ndarray, conservative_scores: np.ndarray) -> np.ndarray:
+    """Векторный вариант classify_portfolio для массивов долей"""
+    return np.select(
+        [aggressive_scores > 0.4, conservative_scores > 0.5, conservative_scores > 0.3],
+        ['агрессивный', 'ультра-консервативный', 'доходный'],
+        default=DEFAULT_PORTFOLIO_TYPE
+    )
+
+def type_scores(portfolio_dict: Dict[str, float]) -> Dict[str, float]:
+    """Доли агрессивных и защитных активов (признаки из справочника тикеров)"""
+    index = get_ticker_index()
+    return {
+        'aggressive': index.tagged_weight(portfolio_dict, 'aggressive'),
+        'conservative': index.tagged_weight(portfolio_dict, 'conservative')
+    }
@@ -0,0 +1,313 @@
+# price_store.py - локальное хранилище истории цен в колоночном формате (memmap .npy)
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from database import PortfolioDatabase, get_database
+from simulation import FREQUENCIES
+
+logger = logging.getLogger(__name__)
+
+# Каталог хранилища по умолчанию (можно переопределить переменной окружения)
+DEFAULT_STORE_DIR = os.environ.get('UNIWEST_PRICE_STORE', 'price_data')
+MANIFEST_FILE = 'manifest.json'
+
+# Файлы прежнего поколения удаляются не раньше, чем через столько секунд после
+# публикации следующего: процессы успевают перечитать manifest.json
+STALE_GENERATION_GRACE = 600
+
+# Имена колонок во входных файлах (сравнение без учета регистра, по приоритету)
+DATE_COLUMNS = ('date', 'datetime', 'timestamp')
+TICKER_COLUMNS = ('ticker', 'symbol')
+PRICE_COLUMNS = ('adj close', 'adj_close', 'close', 'price')
+SOURCE_SUFFIXES = ('.csv', '.parquet')
+
+# Денежные позиции: цены не хранятся, доходность считается нулевой
+CASH_TICKERS = ('Cash',)
+
+# Бенчмарк для беты и относительных метрик; загружается вместе с тикерами портфелей
+BENCHMARK_TICKER = 'SPY'
+
+PathLike = Union[str, os.PathLike]
+
+def _find_column(columns: Iterable[str], candidates: Sequence[str]) -> Optional[str]:
+    lowered = {str(column).strip().lower(): column for column in columns}
+    for candidate in candidates:
+        if candidate in lowered:
+            return lowered[candidate]
+    return None
+
+def _read_source(path: Path) -> pd.DataFrame:
+    """
+    Читает один CSV/Parquet файл и приводит его к широкому виду (даты x тикеры).
+
+    Поддерживаются три формата:
+    - длинный: дата, тикер, цена;
+    - широкий: дата и по колонке на тикер;
+    - один тикер: дата и цена закрытия, тикер берется из имени файла.
+    """
+    if path.suffix.lower() == '.parquet':
+        # Для Parquet нужен pyarrow или fastparquet
+        frame = pd.read_parquet(path)
+    else:
+        frame = pd.read_csv(path)
+
+    date_column = _find_column(frame.columns, DATE_COLUMNS)
+    if date_column is None:
+        raise ValueError(f"В файле {path} нет колонки с датой")
+    frame[date_column] = pd.to_datetime(frame[date_column]).dt.normalize()
+
+    ticker_column = _find_column(frame.columns, TICKER_COLUMNS)
+    price_column = _find_column(frame.columns, PRICE_COLUMNS)
+    if ticker_column is not None and price_column is not None:
+        wide = frame.pivot_table(index=date_column, columns=ticker_column, values=price_column, aggfunc='last')
+    elif price_column is not None:
+        wide = frame.set_index(date_column)[[price_column]].rename(columns={price_column: path.stem})
+    else:
+        wide = frame.set_index(date_column)
+    wide.index.name = 'Date'
+    wide.columns = [str(column) for column in wide.columns]
+    return wide.apply(pd.to_numeric, errors='coerce')
+
+def _source_files(sources: Union[PathLike, Sequence[PathLike]]) -> List[Path]:
+    if isinstance(sources, (str, os.PathLike)):
+        sources = [sources]
+    files: List[Path] = []
+    for source in map(Path, sources):
+        if source.is_dir():
+            files.extend(sorted(p for p in source.iterdir() if p.suffix.lower() in SOURCE_SUFFIXES))
+        else:
+            files.append(source)
+    return files
+
+def load_price_frame(sources: Union[PathLike, Sequence[PathLike]],
+                     tickers: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """Собирает цены из файлов в одну таблицу (даты x тикеры), при необходимости только по tickers"""
+    frames = []
+    for path in _source_files(sources):
+        frame = _read_source(path)
+        if tickers is not None:
+            frame = frame[[column for column in frame.columns if column in tickers]]
+        if not frame.empty:
+            frames.append(frame)
+    if not frames:
+        return pd.DataFrame(index=pd.DatetimeIndex([], name='Date'))
+
+    prices = pd.concat(frames, axis=1).sort_index()
+    # Повторы тикера в разных файлах: более поздний файл имеет приоритет
+    prices = prices.T.groupby(level=0).last().T
+    prices = prices.groupby(level=0).last()
+    return prices[sorted(prices.columns)]
+
+def _generation(path: Path) -> Optional[int]:
+    """Поколение файла хранилища по имени (dates-<поколение>.npy), None для чужих файлов"""
+    try:
+        return int(path.stem.rpartition('-')[2], 16)
+    except ValueError:
+        return None
+
+def remove_stale_generations(root: PathLike, current: str, grace: float = STALE_GENERATION_GRACE) -> List[Path]:
+    """
+    Удаляет файлы поколений, замененных более grace секунд назад, и
+    возвращает удаленные пути. Время замены поколения - отметка следующего за
+    ним поколения (поколение - время записи в наносекундах).
+    """
+    root = Path(root)
+    files = [(path, _generation(path)) for path in root.glob('*.npy')]
+    generations = sorted({generation for _, generation in files if generation is not None} | {int(current, 16)})
+    cutoff = time.time_ns() - int(grace * 1e9)
+    removed = []
+    for path, generation in files:
+        if generation is None or generation >= generations[-1]:
+            continue
+        replaced_at = next(g for g in generations if g > generation)
+        if replaced_at > cutoff:
+            continue
+        try:
+            path.unlink()
+            removed.append(path)
+        except OSError as e:
+            logger.warning(f"Не удалось удалить {path}: {e}")
+    return removed
+
+def write_price_store(prices: pd.DataFrame, root: PathLike = DEFAULT_STORE_DIR,
+                      grace: float = STALE_GENERATION_GRACE) -> Path:
+    """
+    Записывает таблицу цен в колоночный формат.
+
+    Цены хранятся одной матрицей float64 в порядке Fortran, поэтому ряд каждого
+    тикера лежит в файле непрерывно. Новое поколение файлов публикуется
+    атомарной заменой manifest.json; уже открытые читатели продолжают работать
+    со старыми файлами, а get_price_store в других процессах переключается на
+    новое поколение при следующем обращении. Старые поколения удаляются через
+    grace секунд после замены (при следующей записи хранилища).
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    generation = f"{time.time_ns():x}"
+    dates_file = f"dates-{generation}.npy"
+    prices_file = f"prices-{generation}.npy"
+
+    np.save(root / dates_file, prices.index.values.astype('datetime64[D]'))
+    matrix = np.lib.format.open_memmap(root / prices_file, mode='w+', dtype=np.float64,
+                                       shape=prices.shape, fortran_order=True)
+    matrix[:] = prices.to_numpy(dtype=np.float64)
+    matrix.flush()
+    del matrix
+
+    manifest = {
+        'generation': generation,
+        'dates_file': dates_file,
+        'prices_file': prices_file,
+        'tickers': list(prices.columns),
+        'start': str(prices.index.min().date()) if len(prices) else None,
+        'end': str(prices.index.max().date()) if len(prices) else None
+    }
+    tmp_path = root / f"{MANIFEST_FILE}.{generation}.tmp"
+    tmp_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding='utf-8')
+    os.replace(tmp_path, root / MANIFEST_FILE)
+
+    remove_stale_generations(root, generation, grace)
+    logger.info(f"Хранилище цен {root}: {prices.shape[1]} тикеров, {prices.shape[0]} дат")
+    return root
+
+def build_price_store(sources: Union[PathLike, Sequence[PathLike]], root: PathLike = DEFAULT_STORE_DIR,
+                      tickers: Optional[Sequence[str]] = None,
+                      db: Optional[PortfolioDatabase] = None) -> Path:
+    """
+    Загружает цены из CSV/Parquet и записывает хранилище.
+    По умолчанию берутся тикеры, встречающиеся в portfolio_assets, и бенчмарк.
+    """
+    if tickers is None:
+        tickers = [ticker for ticker in (db or get_database()).get_tickers() if ticker not in CASH_TICKERS]
+        if BENCHMARK_TICKER not in tickers:
+            tickers.append(BENCHMARK_TICKER)
+    prices = load_price_frame(sources, tickers)
+    missing = sorted(set(tickers) - set(prices.columns))
+    if missing:
+        logger.warning(f"Нет истории цен для тикеров: {', '.join(missing)}")
+    return write_price_store(prices, root)
+
+class PriceStore:
+    """
+    Хранилище цен, отображаемое в память (только чтение).
+
+    Срезы по диапазону дат и по одному тикеру - это представления memmap без
+    копирования. Страницы файлов разделяются через страничный кэш ОС, поэтому
+    несколько процессов Streamlit не держат собственных копий истории.
+    """
+
+    def __init__(self, root: PathLike = DEFAULT_STORE_DIR):
+        self.root = Path(root)
+        manifest = json.loads((self.root / MANIFEST_FILE).read_text(encoding='utf-8'))
+        self.generation = manifest['generation']
+        self.tickers: List[str] = manifest['tickers']
+        self._index = {ticker: i for i, ticker in enumerate(self.tickers)}
+        self.dates: np.ndarray = np.load(self.root / manifest['dates_file'], mmap_mode='r')
+        self.prices: np.ndarray = np.load(self.root / manifest['prices_file'], mmap_mode='r')
+
+    def __contains__(self, ticker: str) -> bool:
+        return ticker in self._index or ticker in CASH_TICKERS
+
+    def covers(self, tickers: Iterable[str]) -> bool:
+        """Есть ли история по всем тикерам (денежные позиции не требуют истории)"""
+        return all(ticker in self for ticker in tickers)
+
+    def date_slice(self, start=None, end=None) -> slice:
+        """Диапазон строк для дат [start, end] включительно"""
+        first = 0 if start is None else int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start), 'D'), 'left'))
+        last = len(self.dates) if end is None else int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(end), 'D'), 'right'))
+        return slice(first, last)
+
+    def column(self, ticker: str, start=None, end=None) -> np.ndarray:
+        """Цены одного тикера за период (представление без копирования)"""
+        return self.prices[self.date_slice(start, end), self._index[ticker]]
+
+    def window(self, tickers: Sequence[str], start=None, end=None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """Даты и цены набора тикеров за период: {тикер: представление без копирования}"""
+        rows = self.date_slice(start, end)
+        return self.dates[rows], {ticker: self.prices[rows, self._index[ticker]] for ticker in tickers}
+
+    def frame(self, tickers: Optional[Sequence[str]] = None, start=None, end=None) -> pd.DataFrame:
+        """Таблица цен (даты x тикеры); в отличие от window данные копируются"""
+        tickers = [t for t in (tickers or self.tickers) if t not in CASH_TICKERS]
+        dates, columns = self.window(tickers, start, end)
+        return pd.DataFrame(columns, index=pd.DatetimeIndex(dates, name='Date'))
+
+    def returns(self, tickers: Sequence[str], start=None, end=None) -> pd.DataFrame:
+        """
+        Дневные доходности (даты x тикеры) в порядке tickers.
+        Пропуски цен заполняются последним известным значением, даты без
+        истории хотя бы по одному тикеру отбрасываются.
+        """
+        prices = self.frame(tickers, start, end)
+        returns = prices.ffill().pct_change(fill_method=None).iloc[1:].dropna()
+        for ticker in tickers:
+            if ticker in CASH_TICKERS:
+                returns[ticker] = 0.0
+        return returns[list(tickers)]
+
+    def portfolio_history(self, portfolio_dict: Dict[str, float], start=None, end=None,
+                          initial_investment: float = 1000000) -> pd.DataFrame:
+        """Месячная история портфеля с постоянными весами в формате generate_historical_data"""
+        daily = self.returns(list(portfolio_dict), start, end) @ pd.Series(portfolio_dict)
+        monthly = (1.0 + daily).resample(FREQUENCIES['monthly'][0]).prod() - 1.0
+        growth = (1.0 + monthly).cumprod()
+        return pd.DataFrame({
+            'Date': monthly.index,
+            'Portfolio_Value': initial_investment * growth.to_numpy(),
+            'Monthly_Return': monthly.to_numpy(),
+            'Cumulative_Return': (growth.to_numpy() - 1.0) * 100
+        })
+
+# Открытые хранилища процесса: каталог -> (отметка manifest.json, хранилище)
+_STORES: Dict[str, Tuple[Tuple[int, int, int], PriceStore]] = {}
+_STORES_LOCK = threading.Lock()
+
+def get_price_store(root: PathLike = DEFAULT_STORE_DIR) -> Optional[PriceStore]:
+    """
+    Общий на процесс экземпляр хранилища или None, если хранилище еще не
+    построено или не открывается.
+
+    При каждом обращении проверяется manifest.json (inode, размер, mtime):
+    после публикации нового поколения в любом процессе хранилище
+    открывается заново. None не кэшируется - хранилище, построенное после
+    запуска процесса, подхватывается без перезапуска.
+    """
+    key = str(root)
+    try:
+        stat = (Path(root) / MANIFEST_FILE).stat()
+    except OSError:
+        with _STORES_LOCK:
+            _STORES.pop(key, None)
+        return None
+    stamp = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    with _STORES_LOCK:
+        cached = _STORES.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        try:
+            store = PriceStore(root)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Ошибка открытия хранилища цен {root}: {e}")
+            _STORES.pop(key, None)
+            return None
+        _STORES[key] = (stamp, store)
+        return store
+
+if __name__ == "__main__":
+    # python price_store.py <файлы или каталоги с CSV/Parquet> [каталог хранилища]
+    if len(sys.argv) < 2:
+        print("Использование: python price_store.py <источник> [каталог хранилища]")
+        sys.exit(1)
+    build_price_store(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else DEFAULT_STORE_DIR)
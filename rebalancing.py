@@ -0,0 +1,128 @@
+# rebalancing.py - сравнение политик ребалансировки на истории доходностей
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from risk_engine import TRADING_DAYS
+
+# Политики: (название, период календарной ребалансировки в торговых днях, порог отклонения веса)
+# Период None - без календаря, порог None - без порога; заданы оба - ребалансировка
+# по календарю, но только если отклонение превышает порог
+DEFAULT_POLICIES: List[Tuple[str, Optional[int], Optional[float]]] = [
+    ('Без ребалансировки', None, None),
+    ('Ежемесячно', 21, None),
+    ('Ежеквартально', 63, None),
+    ('Раз в полгода', 126, None),
+    ('Ежегодно', 252, None),
+    ('Порог 2%', None, 0.02),
+    ('Порог 5%', None, 0.05),
+    ('Порог 10%', None, 0.10),
+    ('Ежеквартально при отклонении 5%', 63, 0.05)
+]
+
+# Стоимость сделок по умолчанию: доля от оборота (10 б.п.)
+DEFAULT_COST_RATE = 0.001
+
+class RebalancingSimulator:
+    """
+    Прогон портфеля с целевыми весами по истории доходностей при многих
+    политиках ребалансировки сразу.
+
+    Состояние всех политик - матрица весов (политики x активы); один проход по
+    времени обновляет ее целиком, а решения о ребалансировке принимаются
+    векторно: календарные - по маске периодов, пороговые - по максимальному
+    отклонению веса от целевого. Стоимость сделок списывается пропорционально
+    обороту (сумме модулей изменений весов).
+    """
+
+    def __init__(self, asset_returns: np.ndarray, target_weights: np.ndarray,
+                 periods_per_year: int = TRADING_DAYS, risk_free_rate: float = 0.0):
+        self.asset_returns = np.asarray(asset_returns, dtype=float)
+        target_weights = np.asarray(target_weights, dtype=float)
+        if target_weights.shape != (self.asset_returns.shape[1],):
+            raise ValueError(f"Ожидается {self.asset_returns.shape[1]} весов, получено {target_weights.shape}")
+        self.target_weights = target_weights / target_weights.sum()
+        self.periods_per_year = periods_per_year
+        self.risk_free_rate = risk_free_rate
+
+    @classmethod
+    def from_engine(cls, engine, portfolio_dict: Dict[str, float]) -> 'RebalancingSimulator':
+        """Доходности активов и частота - из риск-движка (RiskEngine)"""
+        return cls(engine.asset_returns, engine.weights_vector(portfolio_dict),
+                   engine.periods_per_year, engine.risk_free_rate)
+
+    def simulate(self, policies: Sequence[Tuple[str, Optional[int], Optional[float]]] = DEFAULT_POLICIES,
+                 cost_rate: float = DEFAULT_COST_RATE) -> Dict[str, np.ndarray]:
+        """
+        Доходности до и после издержек (периоды x политики), оборот и число
+        ребалансировок по каждой политике.
+        """
+        n_periods = len(self.asset_returns)
+        n_policies = len(policies)
+        target = self.target_weights
+        periods = np.array([period or 0 for _, period, _ in policies])
+        bands = np.array([np.inf if band is None else band for _, _, band in policies])
+        has_band = np.isfinite(bands)
+        calendar_only = (periods > 0) & ~has_band
+        band_only = (periods == 0) & has_band
+
+        weights = np.tile(target, (n_policies, 1))
+        gross_returns = np.empty((n_periods, n_policies))
+        net_returns = np.empty((n_periods, n_policies))
+        turnover = np.zeros(n_policies)
+        rebalances = np.zeros(n_policies, dtype=int)
+
+        for t, period_returns in enumerate(self.asset_returns):
+            grown = weights * (1.0 + period_returns)
+            value = grown.sum(axis=1)
+            gross_returns[t] = value - 1.0
+            weights = grown / value[:, None]
+
+            # Решение о ребалансировке в конце периода для всех политик сразу
+            on_calendar = (periods > 0) & ((t + 1) % np.maximum(periods, 1) == 0)
+            drifted = np.abs(weights - target).max(axis=1) > bands
+            rebalance = (calendar_only & on_calendar) | (band_only & drifted) | (on_calendar & drifted)
+
+            traded = np.where(rebalance, np.abs(target - weights).sum(axis=1), 0.0)
+            net_returns[t] = value * (1.0 - cost_rate * traded) - 1.0
+            turnover += traded
+            rebalances += rebalance
+            weights[rebalance] = target
+
+        return {
+            'names': [name for name, _, _ in policies],
+            'gross_returns': gross_returns,
+            'net_returns': net_returns,
+            'turnover': turnover,
+            'rebalances': rebalances
+        }
+
+    def compare(self, policies: Sequence[Tuple[str, Optional[int], Optional[float]]] = DEFAULT_POLICIES,
+                cost_rate: float = DEFAULT_COST_RATE) -> pd.DataFrame:
+        """Сводная таблица по политикам: доходность, риск, Шарп, оборот и потери на издержках"""
+        result = self.simulate(policies, cost_rate)
+        gross, net = result['gross_returns'], result['net_returns']
+        years = len(net) / self.periods_per_year
+
+        gross_growth = np.prod(1.0 + gross, axis=0)
+        growth = np.cumprod(1.0 + net, axis=0)
+        annual_return = growth[-1] ** (1.0 / years) - 1.0
+        gross_annual_return = gross_growth ** (1.0 / years) - 1.0
+        annual_volatility = net.std(axis=0, ddof=1) * np.sqrt(self.periods_per_year)
+        mean_return = net.mean(axis=0) * self.periods_per_year
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sharpe = np.where(annual_volatility > 0, (mean_return - self.risk_free_rate) / annual_volatility, 0.0)
+        max_drawdown = (growth / np.maximum.accumulate(growth, axis=0) - 1.0).min(axis=0)
+
+        return pd.DataFrame({
+            'annual_return': annual_return,
+            'annual_volatility': annual_volatility,
+            'sharpe_ratio': sharpe,
+            'max_drawdown': max_drawdown,
+            # Оборот в годовом выражении (односторонний: половина суммы модулей изменений)
+            'annual_turnover': result['turnover'] / 2 / years,
+            'cost_drag': gross_annual_return - annual_return,
+            'rebalances_per_year': result['rebalances'] / years
+        }, index=pd.Index(result['names'], name='policy'))
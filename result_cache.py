@@ -0,0 +1,190 @@
+# result_cache.py - кэш результатов расчетов, адресуемый по содержимому
+
+import hashlib
+import json
+import logging
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+def content_key(*parts: Any) -> str:
+    """
+    Строит ключ кэша как SHA-256 от канонического JSON-представления частей.
+    Словари сериализуются с сортировкой ключей, поэтому порядок активов в
+    портфеле не влияет на ключ.
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def data_fingerprint(*parts: Any) -> str:
+    """
+    SHA-256 от входных данных. Таблицы pandas и массивы NumPy хэшируются по
+    содержимому без перевода в JSON, остальные части - как в content_key.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (pd.DataFrame, pd.Series)):
+            labels = part.columns if isinstance(part, pd.DataFrame) else [part.name]
+            digest.update(json.dumps([str(label) for label in labels], ensure_ascii=False).encode('utf-8'))
+            digest.update(pd.util.hash_pandas_object(part, index=True).to_numpy().tobytes())
+        elif isinstance(part, np.ndarray):
+            digest.update(f"{part.dtype}{part.shape}".encode('utf-8'))
+            digest.update(np.ascontiguousarray(part).tobytes())
+        else:
+            digest.update(content_key(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def portfolio_fingerprint(portfolio_dict: Dict[str, float], precision: int = 10) -> Tuple[Tuple[str, float], ...]:
+    """Каноническое представление весов портфеля для ключей кэша"""
+    return tuple(sorted((ticker, round(float(weight), precision)) for ticker, weight in portfolio_dict.items()))
+
+class ResultCache:
+    """
+    Потокобезопасный LRU-кэш с TTL и ограничением суммарного размера в байтах.
+
+    Размер записи по умолчанию считается как длина pickle-представления значения.
+    При превышении max_bytes или max_entries вытесняются самые давно
+    использованные записи.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: Optional[float] = 3600.0,
+                 max_entries: int = 1024, clock: Callable[[], float] = time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: 'OrderedDict[str, Tuple[Any, int, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        # Блокировки вычисления по ключу: [блокировка, число ожидающих и вычисляющих потоков]
+        self._key_locks: Dict[str, List] = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str, default: Any = None, _count: bool = True) -> Any:
+        """Возвращает значение по ключу или default, если записи нет или она устарела"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if _count:
+                    self.misses += 1
+                return default
+            value, size, expires_at = entry
+            if expires_at is not None and self._clock() >= expires_at:
+                self._remove(key)
+                if _count:
+                    self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            if _count:
+                self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, size: Optional[int] = None) -> bool:
+        """
+        Сохраняет значение. Возвращает False, если запись больше всего кэша
+        и поэтому не сохраняется.
+        """
+        if size is None:
+            size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            logger.warning(f"Запись {key[:12]} ({size} байт) больше лимита кэша и не сохранена")
+            return False
+
+        expires_at = self._clock() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires_at)
+            self.total_bytes += size
+            self._evict()
+        return True
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any], size: Optional[int] = None) -> Any:
+        """
+        Возвращает значение из кэша или вычисляет и сохраняет его.
+        Параллельные запросы одного ключа вычисляют значение один раз.
+        """
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is not sentinel:
+            return value
+
+        with self._lock:
+            key_lock = self._key_locks.get(key)
+            if key_lock is None:
+                key_lock = self._key_locks[key] = [threading.Lock(), 0]
+            key_lock[1] += 1
+        try:
+            with key_lock[0]:
+                value = self.get(key, sentinel, _count=False)
+                if value is sentinel:
+                    value = compute()
+                    self.set(key, value, size)
+        finally:
+            # Блокировка удаляется последним потоком: пока есть ожидающие,
+            # новые запросы ключа получают ту же блокировку
+            with self._lock:
+                key_lock[1] -= 1
+                if key_lock[1] == 0:
+                    del self._key_locks[key]
+        return value
+
+    def invalidate(self, key: str) -> None:
+        """Удаляет запись по ключу"""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self) -> None:
+        """Очищает кэш"""
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Статистика использования кэша"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'total_bytes': self.total_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self.total_bytes -= size
+
+    def _evict(self) -> None:
+        while self._entries and (self.total_bytes > self.max_bytes or len(self._entries) > self.max_entries):
+            key = next(iter(self._entries))
+            self._remove(key)
+
+class PickledResultCache(ResultCache):
+    """
+    Кэш, хранящий значения в виде pickle. Каждый get возвращает независимую
+    копию, поэтому изменение результата одной сессией не затрагивает другие.
+    """
+
+    def get(self, key: str, default: Any = None, _count: bool = True) -> Any:
+        sentinel = object()
+        blob = super().get(key, sentinel, _count)
+        if blob is sentinel:
+            return default
+        return pickle.loads(blob)
+
+    def set(self, key: str, value: Any, size: Optional[int] = None) -> bool:
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        return super().set(key, blob, len(blob))
@@ -0,0 +1,314 @@
+# risk_engine.py - риск-метрики портфеля по матрице доходностей активов
+
+import hashlib
+import zlib
+from functools import cached_property, lru_cache
+from statistics import NormalDist
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from database import asset_risk_weight
+from price_store import BENCHMARK_TICKER, get_price_store
+
+# Торговых дней в году и в месяце
+TRADING_DAYS = 252
+MONTH_DAYS = 21
+
+Weights = Union[Dict[str, float], np.ndarray]
+
+class RiskEngine:
+    """
+    Риск-метрики портфеля по матрице доходностей активов (периоды x активы).
+
+    Средние, ковариация, разложение Холецкого и беты активов к бенчмарку
+    вычисляются один раз на набор активов. Параметрические метрики для новых
+    весов стоят O(n²) (норма L^T w), исторические - одно умножение R @ w.
+    """
+
+    def __init__(self, asset_returns: np.ndarray, tickers: Sequence[str],
+                 benchmark_returns: Optional[np.ndarray] = None,
+                 periods_per_year: int = TRADING_DAYS, risk_free_rate: float = 0.0):
+        asset_returns = np.asarray(asset_returns, dtype=float)
+        if asset_returns.ndim != 2 or asset_returns.shape[1] != len(tickers):
+            raise ValueError(f"Матрица доходностей {asset_returns.shape} не соответствует {len(tickers)} активам")
+        self.asset_returns = asset_returns
+        self.tickers = list(tickers)
+        self._ticker_index = {ticker: i for i, ticker in enumerate(self.tickers)}
+        self.benchmark_returns = None if benchmark_returns is None else np.asarray(benchmark_returns, dtype=float)
+        self.periods_per_year = periods_per_year
+        self.risk_free_rate = risk_free_rate
+
+    # КЭШИРУЕМЫЕ СТАТИСТИКИ АКТИВОВ
+
+    @cached_property
+    def mean_returns(self) -> np.ndarray:
+        return self.asset_returns.mean(axis=0)
+
+    @cached_property
+    def covariance(self) -> np.ndarray:
+        return np.atleast_2d(np.cov(self.asset_returns, rowvar=False))
+
+    @cached_property
+    def cholesky(self) -> np.ndarray:
+        """Нижнетреугольный множитель L: covariance ≈ L @ L.T"""
+        covariance = self.covariance
+        # Небольшая регуляризация для активов с нулевой дисперсией (Cash)
+        jitter = 1e-12 * max(np.trace(covariance) / len(covariance), 1e-12)
+        return np.linalg.cholesky(covariance + jitter * np.eye(len(covariance)))
+
+    @cached_property
+    def version(self) -> str:
+        """Версия статистик активов: меняется вместе со средними и ковариацией (для ключей кэша)"""
+        digest = hashlib.sha256()
+        digest.update('\0'.join(self.tickers).encode('utf-8'))
+        digest.update(np.ascontiguousarray(self.mean_returns).tobytes())
+        digest.update(np.ascontiguousarray(self.covariance).tobytes())
+        return digest.hexdigest()
+
+    @cached_property
+    def correlation(self) -> np.ndarray:
+        std = np.sqrt(np.diag(self.covariance))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            correlation = self.covariance / np.outer(std, std)
+        correlation = np.nan_to_num(correlation)
+        np.fill_diagonal(correlation, 1.0)
+        return correlation
+
+    @cached_property
+    def asset_betas(self) -> np.ndarray:
+        """Беты активов к бенчмарку (без бенчмарка - нули)"""
+        if self.benchmark_returns is None:
+            return np.zeros(len(self.tickers))
+        centered = self.asset_returns - self.mean_returns
+        benchmark_centered = self.benchmark_returns - self.benchmark_returns.mean()
+        benchmark_var = benchmark_centered @ benchmark_centered
+        if benchmark_var == 0:
+            return np.zeros(len(self.tickers))
+        return centered.T @ benchmark_centered / benchmark_var
+
+    def correlation_frame(self) -> pd.DataFrame:
+        """Матрица корреляций активов"""
+        return pd.DataFrame(self.correlation, index=self.tickers, columns=self.tickers)
+
+    # ВЕСА И РЯДЫ ПОРТФЕЛЯ
+
+    def weights_vector(self, weights: Weights) -> np.ndarray:
+        """Вектор весов в порядке self.tickers"""
+        if isinstance(weights, dict):
+            vector = np.zeros(len(self.tickers))
+            for ticker, weight in weights.items():
+                if ticker not in self._ticker_index:
+                    raise KeyError(f"Актив {ticker} отсутствует в матрице доходностей")
+                vector[self._ticker_index[ticker]] = weight
+            return vector
+        vector = np.asarray(weights, dtype=float)
+        if vector.shape != (len(self.tickers),):
+            raise ValueError(f"Ожидается {len(self.tickers)} весов, получено {vector.shape}")
+        return vector
+
+    def portfolio_returns(self, weights: Weights) -> np.ndarray:
+        return self.asset_returns @ self.weights_vector(weights)
+
+    def portfolio_volatility(self, weights: Weights) -> float:
+        """Стандартное отклонение доходности за период через множитель Холецкого"""
+        return float(np.linalg.norm(self.cholesky.T @ self.weights_vector(weights)))
+
+    # ПАРАМЕТРИЧЕСКИЕ И ИСТОРИЧЕСКИЕ МЕРЫ РИСКА
+
+    def parametric_var(self, weights: Weights, confidence: float = 0.95, horizon: int = 1) -> float:
+        """Нормальный VaR за horizon периодов (отрицательная доходность)"""
+        w = self.weights_vector(weights)
+        mean = float(self.mean_returns @ w) * horizon
+        sigma = self.portfolio_volatility(w) * np.sqrt(horizon)
+        return float(mean - NormalDist().inv_cdf(confidence) * sigma)
+
+    def parametric_cvar(self, weights: Weights, confidence: float = 0.95, horizon: int = 1) -> float:
+        """Нормальный CVaR (средняя доходность в хвосте за пределом VaR)"""
+        w = self.weights_vector(weights)
+        mean = float(self.mean_returns @ w) * horizon
+        sigma = self.portfolio_volatility(w) * np.sqrt(horizon)
+        z = NormalDist().inv_cdf(confidence)
+        return float(mean - sigma * NormalDist().pdf(z) / (1 - confidence))
+
+    @staticmethod
+    def _aggregate(returns: np.ndarray, horizon: int) -> np.ndarray:
+        """Сложные доходности по непересекающимся окнам длины horizon"""
+        if horizon <= 1:
+            return returns
+        n_windows = len(returns) // horizon
+        blocks = returns[:n_windows * horizon].reshape(n_windows, horizon)
+        return np.prod(1.0 + blocks, axis=1) - 1.0
+
+    def historical_var(self, weights: Weights, confidence: float = 0.95, horizon: int = 1) -> float:
+        returns = self._aggregate(self.portfolio_returns(weights), horizon)
+        return float(np.quantile(returns, 1 - confidence))
+
+    def historical_cvar(self, weights: Weights, confidence: float = 0.95, horizon: int = 1) -> float:
+        returns = self._aggregate(self.portfolio_returns(weights), horizon)
+        threshold = np.quantile(returns, 1 - confidence)
+        return float(returns[returns <= threshold].mean())
+
+    def downside_deviation(self, weights: Weights) -> float:
+        """Годовое нисходящее отклонение относительно безрисковой ставки"""
+        returns = self.portfolio_returns(weights)
+        shortfall = np.minimum(returns - self.risk_free_rate / self.periods_per_year, 0.0)
+        return float(np.sqrt(np.mean(shortfall ** 2) * self.periods_per_year))
+
+    # СВОДНЫЕ МЕТРИКИ
+
+    def _annualized_return(self, returns: np.ndarray) -> float:
+        """Среднегодовая (арифметическая) доходность, как принято для коэффициентов Шарпа и Трейнора"""
+        return float(returns.mean() * self.periods_per_year)
+
+    @staticmethod
+    def _max_drawdown(returns: np.ndarray) -> float:
+        growth = np.cumprod(1.0 + returns)
+        return float((growth / np.maximum.accumulate(growth) - 1.0).min())
+
+    def risk_metrics(self, weights: Weights, portfolio_value: float = 0.0,
+                     horizon: int = MONTH_DAYS) -> Dict[str, float]:
+        """Меры риска в формате calculate_advanced_risk_metrics (VaR и CVaR - на горизонте horizon)"""
+        w = self.weights_vector(weights)
+        returns = self.asset_returns @ w
+        cvar_95 = self.historical_cvar(w, 0.95, horizon)
+        var_95 = self.parametric_var(w, 0.95, horizon)
+        return {
+            'parametric_var_95': var_95,
+            'parametric_var_99': self.parametric_var(w, 0.99, horizon),
+            'historical_var_95': self.historical_var(w, 0.95, horizon),
+            'cvar_95': cvar_95,
+            'cvar_99': self.historical_cvar(w, 0.99, horizon),
+            'downside_deviation': self.downside_deviation(w),
+            'worst_day': float(returns.min()),
+            'worst_month': float(self._aggregate(returns, horizon).min()),
+            'value_at_risk_1m': var_95 * portfolio_value,
+            'expected_shortfall': cvar_95 * portfolio_value
+        }
+
+    def efficiency_metrics(self, weights: Weights) -> Dict[str, float]:
+        """Показатели эффективности в формате calculate_efficiency_metrics (годовые)"""
+        w = self.weights_vector(weights)
+        returns = self.asset_returns @ w
+        rf = self.risk_free_rate
+        sqrt_year = float(np.sqrt(self.periods_per_year))
+
+        annual_return = self._annualized_return(returns)
+        annual_volatility = self.portfolio_volatility(w) * sqrt_year
+        downside = self.downside_deviation(w)
+        beta = float(self.asset_betas @ w)
+        max_drawdown = self._max_drawdown(returns)
+
+        sharpe = (annual_return - rf) / annual_volatility if annual_volatility > 0 else 0.0
+        metrics = {
+            'annual_return': annual_return,
+            'annual_volatility': annual_volatility,
+            'sharpe_ratio': sharpe,
+            'sortino_ratio': (annual_return - rf) / downside if downside > 0 else 0.0,
+            'beta': beta,
+            'treynor_ratio': (annual_return - rf) / beta if beta else 0.0,
+            'downside_deviation': downside,
+            'max_drawdown': max_drawdown,
+            'calmar_ratio': annual_return / abs(max_drawdown) if max_drawdown < 0 else 0.0,
+            'm_squared': 0.0, 'jensen_alpha': 0.0, 'modigliani_ratio': 0.0,
+            'information_ratio': 0.0, 'tracking_error': 0.0
+        }
+
+        if self.benchmark_returns is not None:
+            benchmark_return = self._annualized_return(self.benchmark_returns)
+            benchmark_volatility = float(self.benchmark_returns.std(ddof=1) * sqrt_year)
+            active = returns - self.benchmark_returns
+            tracking_error = float(active.std(ddof=1) * sqrt_year)
+            modigliani = rf + sharpe * benchmark_volatility
+            metrics.update({
+                'jensen_alpha': annual_return - (rf + beta * (benchmark_return - rf)),
+                'modigliani_ratio': modigliani,
+                'm_squared': modigliani - benchmark_return,
+                'tracking_error': tracking_error,
+                'information_ratio': (annual_return - benchmark_return) / tracking_error if tracking_error > 0 else 0.0
+            })
+        return metrics
+
+# СИНТЕТИЧЕСКИЕ ДОХОДНОСТИ АКТИВОВ
+# Если в хранилище цен нет истории тикеров, доходности строятся однофакторной моделью:
+# r = rf + бета * (рыночная премия) + специфический шум. Ряд каждого тикера
+# детерминирован и не зависит от состава портфеля.
+
+SYNTHETIC_HISTORY_DAYS = 10 * TRADING_DAYS
+MARKET_ANNUAL_RETURN = 0.08
+MARKET_ANNUAL_VOLATILITY = 0.16
+MARKET_SEED = 42
+
+# Вес риска актива (asset_risk_weight) -> (бета, годовая специфическая волатильность)
+FACTOR_PARAMS_BY_RISK = {
+    0.8: (1.5, 0.40),
+    0.5: (1.0, 0.15),
+    0.2: (0.3, 0.06)
+}
+
+@lru_cache(maxsize=4)
+def synthetic_market_returns(n_periods: int = SYNTHETIC_HISTORY_DAYS) -> np.ndarray:
+    """Дневные доходности рыночного фактора (служит и бенчмарком)"""
+    noise = np.random.default_rng(MARKET_SEED).standard_normal(n_periods)
+    # Выборочное среднее шума убирается, чтобы средняя доходность ряда была ровно заданной
+    noise -= noise.mean()
+    return MARKET_ANNUAL_RETURN / TRADING_DAYS + noise * MARKET_ANNUAL_VOLATILITY / np.sqrt(TRADING_DAYS)
+
+def synthetic_asset_returns(tickers: Sequence[str], market_returns: np.ndarray,
+                            risk_free_rate: float = 0.0) -> np.ndarray:
+    """Дневные доходности активов по однофакторной модели (периоды x активы)"""
+    n_periods = len(market_returns)
+    daily_rf = risk_free_rate / TRADING_DAYS
+    market_excess = market_returns - daily_rf
+    returns = np.empty((n_periods, len(tickers)))
+    for column, ticker in enumerate(tickers):
+        if ticker == 'Cash':
+            returns[:, column] = daily_rf
+            continue
+        beta, idio_volatility = FACTOR_PARAMS_BY_RISK[asset_risk_weight(ticker)]
+        rng = np.random.default_rng(zlib.crc32(ticker.encode('utf-8')))
+        noise = rng.standard_normal(n_periods)
+        noise = (noise - noise.mean()) * idio_volatility / np.sqrt(TRADING_DAYS)
+        returns[:, column] = daily_rf + beta * market_excess + noise
+    return returns
+
+# ДОХОДНОСТИ ИЗ ХРАНИЛИЩА ЦЕН
+
+def stored_asset_returns(tickers: Sequence[str]) -> Optional[Tuple[np.ndarray, Optional[np.ndarray]]]:
+    """
+    Дневные доходности активов и бенчмарка из хранилища цен.
+    Возвращает None, если хранилища нет или в нем нет истории хотя бы одного тикера.
+    """
+    store = get_price_store()
+    if store is None or not store.covers(tickers):
+        return None
+    columns = list(tickers)
+    has_benchmark = BENCHMARK_TICKER in store.tickers
+    if has_benchmark and BENCHMARK_TICKER not in columns:
+        columns.append(BENCHMARK_TICKER)
+    returns = store.returns(columns)
+    if len(returns) < 2:
+        return None
+    benchmark = returns[BENCHMARK_TICKER].to_numpy() if has_benchmark else None
+    return returns[list(tickers)].to_numpy(), benchmark
+
+def get_risk_engine(tickers: Tuple[str, ...]) -> RiskEngine:
+    """
+    Общий риск-движок для набора активов: ковариация и Холецкий считаются один раз.
+    Используется история из хранилища цен, без нее - синтетические доходности.
+    Ключ кэша включает поколение хранилища: после публикации новых цен (или
+    появления хранилища) движок строится заново.
+    """
+    store = get_price_store()
+    return _build_risk_engine(tuple(tickers), store.generation if store is not None else None)
+
+@lru_cache(maxsize=256)
+def _build_risk_engine(tickers: Tuple[str, ...], generation: Optional[str]) -> RiskEngine:
+    """Риск-движок для набора активов и поколения хранилища цен (None - хранилища нет)"""
+    stored = stored_asset_returns(tickers) if generation is not None else None
+    if stored is not None:
+        asset_returns, benchmark = stored
+        return RiskEngine(asset_returns, tickers, benchmark_returns=benchmark)
+    market = synthetic_market_returns()
+    return RiskEngine(synthetic_asset_returns(tickers, market), tickers, benchmark_returns=market)
@@ -0,0 +1,229 @@
+# rolling_stats.py - инкрементальные скользящие статистики и просадки портфелей
+
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+# Окна скользящих средних стоимости и окно волатильности доходности (в периодах)
+MA_WINDOWS = (6, 12)
+VOLATILITY_WINDOW = 12
+
+# Раз в столько обновлений суммы окон пересчитываются по буферам заново,
+# чтобы ошибка округления скользящих сумм не накапливалась
+RESYNC_EVERY = 1024
+
+class RollingStatsPipeline:
+    """
+    Скользящие средние, скользящая волатильность, пик и просадка для многих
+    портфелей с состоянием между обновлениями.
+
+    Состояние - кольцевые буферы последних стоимостей и доходностей, суммы
+    окон для средних, среднее и M2 доходностей в окне (формула Уэлфорда для
+    скользящего окна), текущий пик и максимальная просадка. Добавление одного
+    периода для всех портфелей - O(1) на портфель независимо от длины истории.
+    Все портфели продвигаются вместе: update получает по значению на портфель.
+
+    Семантика совпадает с pandas: rolling(window, min_periods=1).mean(),
+    rolling(window, min_periods=1).std() (ddof=1, NaN при одном наблюдении)
+    и expanding().max().
+    """
+
+    def __init__(self, n_portfolios: int, ma_windows: Sequence[int] = MA_WINDOWS,
+                 volatility_window: int = VOLATILITY_WINDOW, periods_per_year: int = 12,
+                 names: Optional[Sequence[str]] = None):
+        if names is not None and len(names) != n_portfolios:
+            raise ValueError(f"Ожидается {n_portfolios} имен портфелей, получено {len(names)}")
+        self.n_portfolios = n_portfolios
+        self.ma_windows = tuple(int(w) for w in ma_windows)
+        self.volatility_window = int(volatility_window)
+        self.periods_per_year = periods_per_year
+        self.names = list(names) if names is not None else None
+
+        self.count = 0
+        self._values = np.zeros((max(self.ma_windows), n_portfolios))
+        self._returns = np.zeros((self.volatility_window, n_portfolios))
+        self._ma_sums = np.zeros((len(self.ma_windows), n_portfolios))
+        self._return_mean = np.zeros(n_portfolios)
+        self._return_m2 = np.zeros(n_portfolios)
+        self.peak = np.full(n_portfolios, -np.inf)
+        self.max_drawdown = np.zeros(n_portfolios)
+        self.last_value = np.full(n_portfolios, np.nan)
+
+    # ОБНОВЛЕНИЕ
+
+    def update(self, values: np.ndarray, returns: np.ndarray) -> Dict[str, np.ndarray]:
+        """Добавляет один период (стоимость и доходность каждого портфеля) и возвращает текущие статистики"""
+        values = np.broadcast_to(np.asarray(values, dtype=float), (self.n_portfolios,))
+        returns = np.broadcast_to(np.asarray(returns, dtype=float), (self.n_portfolios,))
+        t = self.count
+
+        # Скользящие средние: сумма окна плюс новое значение минус выпавшее
+        value_slot = t % len(self._values)
+        for i, window in enumerate(self.ma_windows):
+            if t >= window:
+                self._ma_sums[i] -= self._values[(t - window) % len(self._values)]
+            self._ma_sums[i] += values
+        self._values[value_slot] = values
+
+        # Дисперсия доходностей в окне: Уэлфорд с добавлением и удалением наблюдения
+        window = self.volatility_window
+        return_slot = t % window
+        if t < window:
+            n = t + 1
+            delta = returns - self._return_mean
+            self._return_mean += delta / n
+            self._return_m2 += delta * (returns - self._return_mean)
+        else:
+            old = self._returns[return_slot]
+            old_mean = self._return_mean.copy()
+            self._return_mean += (returns - old) / window
+            self._return_m2 += (returns - old) * (returns - self._return_mean + old - old_mean)
+        self._returns[return_slot] = returns
+
+        np.maximum(self.peak, values, out=self.peak)
+        self.last_value = values.copy()
+        self.count += 1
+        np.minimum(self.max_drawdown, self.drawdown, out=self.max_drawdown)
+
+        if self.count % RESYNC_EVERY == 0:
+            self._resync()
+        return self.snapshot()
+
+    def _resync(self) -> None:
+        """Точный пересчет сумм окон и M2 по буферам (O(окно), раз в RESYNC_EVERY обновлений)"""
+        for i, window in enumerate(self.ma_windows):
+            self._ma_sums[i] = self._window(self._values, window).sum(axis=0)
+        recent = self._window(self._returns, self.volatility_window)
+        self._return_mean = recent.mean(axis=0)
+        self._return_m2 = ((recent - self._return_mean) ** 2).sum(axis=0)
+
+    def _window(self, buffer: np.ndarray, window: int) -> np.ndarray:
+        """Последние min(window, count) строк кольцевого буфера"""
+        n = min(window, self.count)
+        rows = (self.count - 1 - np.arange(n)) % len(buffer)
+        return buffer[rows]
+
+    # ТЕКУЩИЕ СТАТИСТИКИ
+
+    def moving_average(self, window: int) -> np.ndarray:
+        i = self.ma_windows.index(window)
+        return self._ma_sums[i] / max(min(window, self.count), 1)
+
+    @property
+    def drawdown(self) -> np.ndarray:
+        """Текущая просадка от пика (доля, <= 0)"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.peak > 0, self.last_value / self.peak - 1.0, 0.0)
+
+    @property
+    def volatility(self) -> np.ndarray:
+        """Годовая волатильность доходности в окне (NaN, пока в окне меньше двух периодов)"""
+        n = min(self.volatility_window, self.count)
+        if n < 2:
+            return np.full(self.n_portfolios, np.nan)
+        variance = np.maximum(self._return_m2, 0.0) / (n - 1)
+        return np.sqrt(variance * self.periods_per_year)
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        """Статистики после последнего периода, по значению на портфель"""
+        stats = {f'MA_{window}': self.moving_average(window) for window in self.ma_windows}
+        stats.update({
+            'Peak': self.peak.copy(),
+            'Drawdown': self.drawdown * 100,
+            'Max_Drawdown': self.max_drawdown * 100,
+            'Rolling_Volatility': self.volatility * 100
+        })
+        return stats
+
+    # ИСТОРИЯ
+
+    def extend(self, values: np.ndarray, returns: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Прогоняет историю (периоды x портфели) через update и возвращает ряды
+        статистик той же формы. Цикл по периодам на Python: для рядов по всей
+        истории быстрее pandas rolling, для состояния - from_history.
+        """
+        values = np.asarray(values, dtype=float).reshape(len(values), -1)
+        returns = np.asarray(returns, dtype=float).reshape(len(returns), -1)
+        series: Dict[str, List[np.ndarray]] = {}
+        for period_values, period_returns in zip(values, returns):
+            for name, value in self.update(period_values, period_returns).items():
+                series.setdefault(name, []).append(value)
+        return {name: np.vstack(rows) for name, rows in series.items()}
+
+    def seed_history(self, values: np.ndarray, returns: np.ndarray, portfolios: slice = slice(None)) -> None:
+        """
+        Заполняет состояние портфелей portfolios по их истории (периоды x
+        портфели) без цикла по периодам: буферы и суммы окон берутся из
+        последних строк, пик и максимальная просадка - накопленным максимумом.
+        Результат тот же, что после extend. Историю можно передавать блоками
+        портфелей, но одной длины для всех блоков.
+        """
+        values = np.asarray(values, dtype=float)
+        returns = np.asarray(returns, dtype=float)
+        if values.ndim == 1:
+            values, returns = values[:, None], returns[:, None]
+        count = len(values)
+        if self.count not in (0, count):
+            raise ValueError(f"История из {count} периодов, в состоянии уже {self.count}")
+        if count == 0:
+            return
+
+        self.count = count
+        for buffer, series in ((self._values, values), (self._returns, returns)):
+            periods = np.arange(max(count - len(buffer), 0), count)
+            buffer[periods % len(buffer), portfolios] = series[periods]
+        for i, window in enumerate(self.ma_windows):
+            self._ma_sums[i, portfolios] = values[-window:].sum(axis=0)
+        recent = returns[-self.volatility_window:]
+        recent_mean = recent.mean(axis=0)
+        self._return_mean[portfolios] = recent_mean
+        self._return_m2[portfolios] = ((recent - recent_mean) ** 2).sum(axis=0)
+
+        running_peak = np.maximum.accumulate(values, axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            drawdowns = np.where(running_peak > 0, values / running_peak - 1.0, 0.0)
+        self.peak[portfolios] = running_peak[-1]
+        self.max_drawdown[portfolios] = np.minimum(drawdowns.min(axis=0), 0.0)
+        self.last_value[portfolios] = values[-1]
+
+    @classmethod
+    def from_history(cls, values: np.ndarray, returns: np.ndarray, ma_windows: Sequence[int] = MA_WINDOWS,
+                     volatility_window: int = VOLATILITY_WINDOW, periods_per_year: int = 12,
+                     names: Optional[Sequence[str]] = None) -> 'RollingStatsPipeline':
+        """Состояние после истории (периоды x портфели), дальше история продолжается через update"""
+        values = np.asarray(values, dtype=float)
+        pipeline = cls(values.shape[1] if values.ndim > 1 else 1, ma_windows, volatility_window,
+                       periods_per_year, names)
+        pipeline.seed_history(values, returns)
+        return pipeline
+
+    # СОХРАНЕНИЕ СОСТОЯНИЯ МЕЖДУ ЗАПУСКАМИ
+
+    def save(self, path: Union[str, Path]) -> None:
+        np.savez(
+            path,
+            count=self.count, ma_windows=self.ma_windows, volatility_window=self.volatility_window,
+            periods_per_year=self.periods_per_year, values=self._values, returns=self._returns,
+            ma_sums=self._ma_sums, return_mean=self._return_mean, return_m2=self._return_m2,
+            peak=self.peak, max_drawdown=self.max_drawdown, last_value=self.last_value,
+            names=np.array(self.names if self.names is not None else [], dtype=str)
+        )
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> 'RollingStatsPipeline':
+        with np.load(path) as data:
+            names = list(data['names']) or None
+            pipeline = cls(data['peak'].size, tuple(data['ma_windows']), int(data['volatility_window']),
+                           int(data['periods_per_year']), names)
+            pipeline.count = int(data['count'])
+            pipeline._values = data['values'].copy()
+            pipeline._returns = data['returns'].copy()
+            pipeline._ma_sums = data['ma_sums'].copy()
+            pipeline._return_mean = data['return_mean'].copy()
+            pipeline._return_m2 = data['return_m2'].copy()
+            pipeline.peak = data['peak'].copy()
+            pipeline.max_drawdown = data['max_drawdown'].copy()
+            pipeline.last_value = data['last_value'].copy()
+        return pipeline
@@ -0,0 +1,167 @@
+# rule_engine.py - декларативные правила, вычисляемые по матрице признаков сразу для всех клиентов
+
+import re
+from string import Formatter
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+def _isin(column: pd.Series, values: Any) -> np.ndarray:
+    return column.isin(values).to_numpy()
+
+def _contains(column: pd.Series, values: Any) -> np.ndarray:
+    pattern = '|'.join(re.escape(value) for value in values)
+    return column.astype(str).str.contains(pattern, regex=True).to_numpy()
+
+def _between(column: pd.Series, bounds: Tuple[float, float]) -> np.ndarray:
+    low, high = bounds
+    values = column.to_numpy()
+    return (values >= low) & (values <= high)
+
+# Операторы условий: колонка признака и значение -> булев вектор по клиентам
+OPERATORS: Dict[str, Callable[[pd.Series, Any], np.ndarray]] = {
+    '<': lambda column, value: column.to_numpy() < value,
+    '<=': lambda column, value: column.to_numpy() <= value,
+    '>': lambda column, value: column.to_numpy() > value,
+    '>=': lambda column, value: column.to_numpy() >= value,
+    '==': lambda column, value: column.to_numpy() == value,
+    '!=': lambda column, value: column.to_numpy() != value,
+    'in': _isin,
+    'not in': lambda column, values: ~_isin(column, values),
+    # Строковый признак содержит хотя бы одну из подстрок
+    'contains': _contains,
+    # Значение в отрезке [low, high]
+    'between': _between,
+    'not between': lambda column, bounds: ~_between(column, bounds)
+}
+
+class Condition(NamedTuple):
+    """Условие правила: признак, оператор из OPERATORS и значение"""
+    feature: str
+    op: str
+    value: Any
+
+def _hashable(value: Any) -> Any:
+    return tuple(value) if isinstance(value, (list, set, frozenset)) else value
+
+class Rule:
+    """
+    Правило рекомендации: условия (объединяются через И), шаблон сообщения,
+    приоритет и группа.
+
+    Шаблон форматируется признаками клиента (str.format), например
+    "Актив {top_asset} составляет {max_weight:.1%}". Правило без условий
+    срабатывает для всех клиентов.
+    """
+
+    def __init__(self, name: str, conditions: Sequence[Tuple[str, str, Any]], message: str,
+                 priority: int = 0, group: str = 'analysis'):
+        self.name = name
+        self.conditions = tuple(Condition(feature, op, _hashable(value)) for feature, op, value in conditions)
+        for condition in self.conditions:
+            if condition.op not in OPERATORS:
+                raise ValueError(f"Правило {name}: неизвестный оператор {condition.op!r}")
+        self.message = message
+        self.priority = priority
+        self.group = group
+        self.fields = list(dict.fromkeys(field for _, field, _, _ in Formatter().parse(message) if field))
+
+    def __repr__(self) -> str:
+        return f"Rule({self.name!r}, group={self.group!r}, priority={self.priority})"
+
+class RuleSet:
+    """
+    Набор правил, скомпилированный в векторные предикаты.
+
+    Каждое уникальное условие вычисляется один раз по колонке таблицы
+    признаков (клиенты x признаки), правило - логическое И своих условий,
+    поэтому стоимость на клиента не растет с числом правил, использующих
+    одни и те же условия. Сработавшие правила упорядочиваются по группам
+    (в порядке group_order), внутри группы - по убыванию приоритета, затем
+    по порядку объявления; group_limits и limit отсекают хвост матрично.
+    """
+
+    def __init__(self, rules: Sequence[Rule], group_order: Optional[Sequence[str]] = None,
+                 group_limits: Optional[Dict[str, int]] = None, limit: Optional[int] = None):
+        names = [rule.name for rule in rules]
+        duplicates = {name for name in names if names.count(name) > 1}
+        if duplicates:
+            raise ValueError(f"Повторяющиеся имена правил: {sorted(duplicates)}")
+
+        group_order = list(group_order or [])
+        for rule in rules:
+            if rule.group not in group_order:
+                group_order.append(rule.group)
+        self.group_order = group_order
+        self.group_limits = dict(group_limits or {})
+        self.limit = limit
+
+        # Порядок вывода: группа, затем приоритет по убыванию (сортировка устойчива)
+        self.rules: List[Rule] = sorted(rules, key=lambda rule: (group_order.index(rule.group), -rule.priority))
+        self.conditions: List[Condition] = list(dict.fromkeys(
+            condition for rule in self.rules for condition in rule.conditions
+        ))
+        condition_ids = {condition: i for i, condition in enumerate(self.conditions)}
+        self._rule_conditions = [[condition_ids[c] for c in rule.conditions] for rule in self.rules]
+        groups = np.array([rule.group for rule in self.rules], dtype=object)
+        self._group_columns = {group: np.flatnonzero(groups == group) for group in self.group_order}
+
+    @property
+    def names(self) -> List[str]:
+        return [rule.name for rule in self.rules]
+
+    def evaluate(self, features: pd.DataFrame) -> pd.DataFrame:
+        """Матрица срабатываний (клиенты x правила в порядке вывода)"""
+        n_clients = len(features)
+        missing = {c.feature for c in self.conditions} - set(features.columns)
+        if missing:
+            raise KeyError(f"В таблице признаков нет колонок: {sorted(missing)}")
+
+        predicates = np.empty((len(self.conditions), n_clients), dtype=bool)
+        for i, (feature, op, value) in enumerate(self.conditions):
+            predicates[i] = OPERATORS[op](features[feature], value)
+
+        fired = np.ones((n_clients, len(self.rules)), dtype=bool)
+        for j, condition_ids in enumerate(self._rule_conditions):
+            if condition_ids:
+                fired[:, j] = predicates[condition_ids].all(axis=0)
+        return pd.DataFrame(fired, index=features.index, columns=self.names)
+
+    def select(self, fired: pd.DataFrame) -> np.ndarray:
+        """Оставляет сработавшие правила в пределах лимитов групп и общего лимита"""
+        selected = fired.to_numpy().copy()
+        for group, limit in self.group_limits.items():
+            columns = self._group_columns.get(group)
+            if columns is None or not len(columns):
+                continue
+            block = selected[:, columns]
+            selected[:, columns] = block & (np.cumsum(block, axis=1) <= limit)
+        if self.limit is not None:
+            selected &= np.cumsum(selected, axis=1) <= self.limit
+        return selected
+
+    def recommend(self, features: pd.DataFrame) -> Dict[Any, List[str]]:
+        """Ранжированные сообщения для каждого клиента (индекс таблицы признаков)"""
+        selected = self.select(self.evaluate(features))
+        recommendations: Dict[Any, List[str]] = {client: [] for client in features.index}
+        rows, columns = np.nonzero(selected)
+        if not len(rows):
+            return recommendations
+
+        # Шаблоны форматируются только для сработавших пар (клиент, правило)
+        # и только теми признаками, которые в них упоминаются
+        messages = np.empty(len(rows), dtype=object)
+        for column in np.unique(columns):
+            rule = self.rules[column]
+            positions = np.flatnonzero(columns == column)
+            if not rule.fields:
+                messages[positions] = rule.message
+                continue
+            values = [features[field].to_numpy()[rows[positions]] for field in rule.fields]
+            messages[positions] = [rule.message.format(**dict(zip(rule.fields, row))) for row in zip(*values)]
+
+        clients = features.index.tolist()
+        for row, message in zip(rows.tolist(), messages):
+            recommendations[clients[row]].append(message)
+        return recommendations
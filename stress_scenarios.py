@@ -0,0 +1,327 @@
+# stress_scenarios.py - библиотека стресс-сценариев и их применение к портфелям
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from database import asset_risk_weight
+
+logger = logging.getLogger(__name__)
+
+# Рыночные факторы, через которые задаются шоки сценариев
+FACTORS = ('equity', 'growth', 'real_estate', 'rates', 'gold', 'crypto')
+
+FACTOR_LABELS = {
+    'equity': 'Акции',
+    'growth': 'Акции роста',
+    'real_estate': 'Недвижимость',
+    'rates': 'Облигации',
+    'gold': 'Золото',
+    'crypto': 'Криптовалюты'
+}
+
+# Чувствительность известных тикеров к факторам (шок актива = сумма чувствительность * шок фактора)
+TICKER_EXPOSURES = {
+    'SPY': {'equity': 1.0}, 'VTI': {'equity': 1.0}, 'VXUS': {'equity': 1.0},
+    'VYM': {'equity': 0.85}, 'SCHD': {'equity': 0.85},
+    'AAPL': {'equity': 1.0, 'growth': 0.5}, 'MSFT': {'equity': 1.0, 'growth': 0.5},
+    'TSLA': {'equity': 1.0, 'growth': 1.0}, 'NVDA': {'equity': 1.0, 'growth': 1.0},
+    'AMD': {'equity': 1.0, 'growth': 1.0}, 'SQ': {'equity': 1.0, 'growth': 1.0},
+    'ARKK': {'equity': 1.0, 'growth': 1.0},
+    'JNJ': {'equity': 0.6}, 'PG': {'equity': 0.6}, 'T': {'equity': 0.6}, 'VZ': {'equity': 0.6},
+    'XOM': {'equity': 0.9},
+    'VNQ': {'equity': 0.6, 'real_estate': 1.0},
+    'BND': {'rates': 1.0}, 'GOVT': {'rates': 1.0}, 'SHY': {'rates': 0.3},
+    'GLD': {'gold': 1.0},
+    'BTC-USD': {'crypto': 1.0}, 'ETH-USD': {'crypto': 1.0},
+    'Cash': {}
+}
+
+# Чувствительность неизвестных тикеров по весу риска актива (asset_risk_weight)
+EXPOSURES_BY_RISK = {
+    0.8: {'equity': 1.0, 'growth': 1.0},
+    0.5: {'equity': 1.0},
+    0.2: {'equity': 0.5}
+}
+
+# Допустимый разрыв между границами окна и первой/последней датой в хранилище цен
+REPLAY_TOLERANCE_DAYS = 7
+
+# Доходность актива в сценарии не может быть ниже -100%
+MIN_SHOCK = -1.0
+
+ScenarioSpec = Dict[str, object]
+
+class StressScenario:
+    """
+    Один стресс-сценарий: накопленная доходность каждого актива за сценарий.
+
+    Шок задается через факторы (factor_shocks) и/или напрямую по тикерам
+    (asset_shocks, имеют приоритет). Исторический сценарий дополнительно
+    содержит окно [start, end]: если в хранилище цен есть история тикера за
+    это окно, используется фактическая доходность (replay), иначе - факторная
+    оценка. monthly_shock - дополнительная месячная доходность, с которой окно
+    попадает в синтетическую историю (simulation.CRISIS_PERIODS).
+    """
+
+    KINDS = ('historical', 'factor', 'asset', 'custom')
+
+    def __init__(self, name: str, kind: str = 'custom', factor_shocks: Optional[Dict[str, float]] = None,
+                 asset_shocks: Optional[Dict[str, float]] = None, start: Optional[str] = None,
+                 end: Optional[str] = None, monthly_shock: Optional[float] = None, description: str = ''):
+        if kind not in self.KINDS:
+            raise ValueError(f"Неизвестный тип сценария: {kind}")
+        unknown = set(factor_shocks or {}) - set(FACTORS)
+        if unknown:
+            raise ValueError(f"Неизвестные факторы в сценарии {name}: {', '.join(sorted(unknown))}")
+        if kind == 'historical' and (start is None or end is None):
+            raise ValueError(f"Для исторического сценария {name} нужно окно дат")
+        self.name = name
+        self.kind = kind
+        self.factor_shocks = dict(factor_shocks or {})
+        self.asset_shocks = dict(asset_shocks or {})
+        self.start = start
+        self.end = end
+        self.monthly_shock = monthly_shock
+        self.description = description
+
+    @property
+    def factor_vector(self) -> np.ndarray:
+        return np.array([self.factor_shocks.get(factor, 0.0) for factor in FACTORS])
+
+    def to_dict(self) -> ScenarioSpec:
+        spec = {'name': self.name, 'kind': self.kind, 'factor_shocks': self.factor_shocks,
+                'asset_shocks': self.asset_shocks, 'description': self.description}
+        if self.kind == 'historical':
+            spec.update({'start': self.start, 'end': self.end, 'monthly_shock': self.monthly_shock})
+        return spec
+
+    @classmethod
+    def from_dict(cls, spec: ScenarioSpec) -> 'StressScenario':
+        return cls(**spec)
+
+    def __repr__(self) -> str:
+        return f"StressScenario({self.name!r}, kind={self.kind!r})"
+
+# Исторические окна. Факторные шоки - приблизительные доходности от пика до дна;
+# для криптовалют до 2014 года - экспертная оценка (истории нет)
+HISTORICAL_SCENARIOS = [
+    StressScenario('Дотком 2000-2002', 'historical',
+                   {'equity': -0.45, 'growth': -0.35, 'real_estate': 0.30, 'rates': 0.20, 'gold': 0.12,
+                    'crypto': -0.80},
+                   start='2000-03-24', end='2002-10-09'),
+    StressScenario('Кризис 2008', 'historical',
+                   {'equity': -0.55, 'growth': -0.10, 'real_estate': -0.35, 'rates': 0.06, 'gold': 0.05,
+                    'crypto': -0.75},
+                   start='2007-10-09', end='2009-03-09'),
+    StressScenario('Китай и нефть 2015-2016', 'historical',
+                   {'equity': -0.14, 'growth': -0.10, 'real_estate': 0.0, 'rates': 0.02, 'gold': 0.05,
+                    'crypto': 0.10},
+                   start='2015-07-01', end='2016-02-01', monthly_shock=-0.18),
+    StressScenario('Распродажа 2018', 'historical',
+                   {'equity': -0.19, 'growth': -0.12, 'real_estate': 0.05, 'rates': 0.02, 'gold': 0.05,
+                    'crypto': -0.55},
+                   start='2018-09-01', end='2018-12-01', monthly_shock=-0.12),
+    StressScenario('COVID-19 2020', 'historical',
+                   {'equity': -0.34, 'growth': 0.0, 'real_estate': -0.20, 'rates': -0.01, 'gold': -0.03,
+                    'crypto': -0.50},
+                   start='2020-02-01', end='2020-04-01', monthly_shock=-0.25),
+    StressScenario('Рост ставок 2022', 'historical',
+                   {'equity': -0.25, 'growth': -0.20, 'real_estate': -0.10, 'rates': -0.17, 'gold': -0.05,
+                    'crypto': -0.65},
+                   start='2022-01-01', end='2022-10-01', monthly_shock=-0.20)
+]
+
+# Гипотетические шоки факторов и отдельных активов
+HYPOTHETICAL_SCENARIOS = [
+    StressScenario('Коррекция акций -20%', 'factor', {'equity': -0.20, 'growth': -0.10}),
+    StressScenario('Ставки +200 б.п.', 'factor', {'rates': -0.08, 'real_estate': -0.15, 'growth': -0.10}),
+    StressScenario('Обвал криптовалют -60%', 'factor', {'crypto': -0.60, 'growth': -0.05}),
+    StressScenario('Бегство в качество', 'factor', {'equity': -0.15, 'rates': 0.05, 'gold': 0.10}),
+    StressScenario('Обвал мегакапов', 'asset', {'equity': -0.05},
+                   asset_shocks={'AAPL': -0.30, 'MSFT': -0.30, 'NVDA': -0.40})
+]
+
+def ticker_exposures(ticker: str) -> Dict[str, float]:
+    """Чувствительность тикера к факторам"""
+    if ticker in TICKER_EXPOSURES:
+        return TICKER_EXPOSURES[ticker]
+    return EXPOSURES_BY_RISK[asset_risk_weight(ticker)]
+
+def exposure_matrix(tickers: Sequence[str]) -> np.ndarray:
+    """Матрица чувствительностей (тикеры x факторы)"""
+    exposures = np.zeros((len(tickers), len(FACTORS)))
+    for row, ticker in enumerate(tickers):
+        for factor, loading in ticker_exposures(ticker).items():
+            exposures[row, FACTORS.index(factor)] = loading
+    return exposures
+
+def _replay_returns(store, tickers: Sequence[str], start: str, end: str) -> np.ndarray:
+    """Фактическая доходность тикеров за окно по хранилищу цен (NaN, если истории нет)"""
+    returns = np.full(len(tickers), np.nan)
+    if store is None:
+        return returns
+    available = [t for t in tickers if t in store.tickers]
+    if not available:
+        return returns
+    dates, columns = store.window(available, start, end)
+    # Окно должно быть покрыто историей целиком, частичный replay занизил бы шок
+    tolerance = np.timedelta64(REPLAY_TOLERANCE_DAYS, 'D')
+    if (len(dates) < 2 or dates[0] - np.datetime64(start, 'D') > tolerance
+            or np.datetime64(end, 'D') - dates[-1] > tolerance):
+        return returns
+    for ticker in available:
+        prices = columns[ticker]
+        prices = prices[np.isfinite(prices)]
+        if len(prices) >= 2 and prices[0] > 0:
+            returns[tickers.index(ticker)] = prices[-1] / prices[0] - 1.0
+    return returns
+
+class ScenarioLibrary:
+    """
+    Набор сценариев, скомпилированный в матрицу шоков (сценарии x тикеры).
+
+    Матрица строится один раз на набор тикеров (и поколение хранилища цен) и
+    кэшируется; применение ко всем портфелям - одно умножение матрицы весов
+    (портфели x тикеры) на транспонированную матрицу шоков. Доходности по
+    активам для одного портфеля - поэлементное произведение шоков на веса.
+    """
+
+    def __init__(self, scenarios: Iterable[StressScenario] = ()):
+        self._scenarios: Dict[str, StressScenario] = {}
+        self._matrices: Dict[Tuple, np.ndarray] = {}
+        self._lock = threading.Lock()
+        for scenario in scenarios:
+            self.add(scenario)
+
+    def __len__(self) -> int:
+        return len(self._scenarios)
+
+    def __iter__(self):
+        return iter(self._scenarios.values())
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._scenarios
+
+    def __getitem__(self, name: str) -> StressScenario:
+        return self._scenarios[name]
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._scenarios)
+
+    @property
+    def version(self) -> str:
+        """Версия набора сценариев (для ключей кэша результатов)"""
+        specs = json.dumps([s.to_dict() for s in self._scenarios.values()], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(specs.encode('utf-8')).hexdigest()
+
+    def add(self, scenario: StressScenario) -> None:
+        """Добавляет сценарий (сценарий с тем же названием заменяется)"""
+        with self._lock:
+            self._scenarios[scenario.name] = scenario
+            self._matrices.clear()
+
+    def remove(self, name: str) -> None:
+        with self._lock:
+            self._scenarios.pop(name, None)
+            self._matrices.clear()
+
+    def historical(self) -> List[StressScenario]:
+        return [s for s in self._scenarios.values() if s.kind == 'historical']
+
+    def crisis_periods(self) -> List[Tuple[str, str, float]]:
+        """Окна исторических сценариев для синтетической истории: (начало, конец, месячный шок)"""
+        return [(s.start, s.end, s.monthly_shock) for s in self.historical() if s.monthly_shock is not None]
+
+    # ЗАГРУЗКА ПОЛЬЗОВАТЕЛЬСКИХ СЦЕНАРИЕВ
+
+    @classmethod
+    def from_records(cls, records: Iterable[ScenarioSpec]) -> 'ScenarioLibrary':
+        return cls(StressScenario.from_dict(record) for record in records)
+
+    def load(self, path: Union[str, os.PathLike]) -> int:
+        """Добавляет сценарии из JSON-файла (список описаний сценариев), возвращает их число"""
+        with open(path, encoding='utf-8') as f:
+            records = json.load(f)
+        for record in records:
+            self.add(StressScenario.from_dict(record))
+        return len(records)
+
+    def save(self, path: Union[str, os.PathLike], kinds: Sequence[str] = ('custom',)) -> None:
+        """Сохраняет сценарии выбранных типов в JSON"""
+        records = [s.to_dict() for s in self._scenarios.values() if s.kind in kinds]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, ensure_ascii=False, indent=2)
+
+    # МАТРИЦА ШОКОВ И ПРИМЕНЕНИЕ
+
+    def shock_matrix(self, tickers: Sequence[str], store=None) -> np.ndarray:
+        """Доходности тикеров во всех сценариях (сценарии x тикеры)"""
+        tickers = list(tickers)
+        key = (tuple(tickers), getattr(store, 'generation', None))
+        matrix = self._matrices.get(key)
+        if matrix is not None:
+            return matrix
+
+        scenarios = list(self._scenarios.values())
+        factor_shocks = np.array([s.factor_vector for s in scenarios]).reshape(len(scenarios), len(FACTORS))
+        matrix = factor_shocks @ exposure_matrix(tickers).T
+        ticker_index = {ticker: i for i, ticker in enumerate(tickers)}
+        for row, scenario in enumerate(scenarios):
+            if scenario.kind == 'historical' and store is not None:
+                replay = _replay_returns(store, tickers, scenario.start, scenario.end)
+                matrix[row] = np.where(np.isnan(replay), matrix[row], replay)
+            for ticker, shock in scenario.asset_shocks.items():
+                if ticker in ticker_index:
+                    matrix[row, ticker_index[ticker]] = shock
+        np.maximum(matrix, MIN_SHOCK, out=matrix)
+        matrix.setflags(write=False)
+
+        with self._lock:
+            self._matrices[key] = matrix
+        return matrix
+
+    def portfolio_returns(self, weights: np.ndarray, tickers: Sequence[str], store=None) -> np.ndarray:
+        """Доходности портфелей в сценариях: (портфели x сценарии) для матрицы весов или вектор для одного портфеля"""
+        return np.asarray(weights, dtype=float) @ self.shock_matrix(tickers, store).T
+
+    def run(self, portfolio_dict: Dict[str, float], portfolio_value: float = 1.0, store=None) -> Dict:
+        """
+        Стресс-тест одного портфеля: доходность и P&L по сценариям, доходность
+        и P&L каждого актива в каждом сценарии.
+        """
+        tickers = sorted(portfolio_dict)
+        weights = np.array([portfolio_dict[ticker] for ticker in tickers], dtype=float)
+        shocks = self.shock_matrix(tickers, store)
+        asset_pnl = shocks * weights * portfolio_value
+        returns = shocks @ weights
+        return {
+            'scenarios': pd.DataFrame({
+                'kind': [self._scenarios[name].kind for name in self.names],
+                'return': returns,
+                'pnl': returns * portfolio_value
+            }, index=pd.Index(self.names, name='scenario')),
+            'asset_returns': pd.DataFrame(shocks, index=pd.Index(self.names, name='scenario'), columns=tickers),
+            'asset_pnl': pd.DataFrame(asset_pnl, index=pd.Index(self.names, name='scenario'), columns=tickers),
+            'portfolio_value': portfolio_value
+        }
+
+def default_library() -> ScenarioLibrary:
+    """Стандартная библиотека; пользовательские сценарии - из файла UNIWEST_STRESS_SCENARIOS"""
+    library = ScenarioLibrary(HISTORICAL_SCENARIOS + HYPOTHETICAL_SCENARIOS)
+    path = os.environ.get('UNIWEST_STRESS_SCENARIOS')
+    if path and os.path.exists(path):
+        try:
+            library.load(path)
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"Ошибка загрузки сценариев из {path}: {e}")
+    return library
+
+SCENARIO_LIBRARY = default_library()
@@ -0,0 +1,116 @@
+# styles.py - стили приложения: минификация, отпечаток и раздача статическим файлом
+
+import hashlib
+import logging
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import NamedTuple, Sequence
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+# Исходные таблицы стилей в порядке подключения
+STYLE_SOURCES = ('design.css', 'adaptive.css')
+SOURCE_DIR = Path(__file__).parent / 'styles'
+
+# Каталог статики Streamlit (server.enableStaticServing) и его URL относительно страницы
+STATIC_DIR = Path(__file__).parent / 'static'
+STATIC_URL = 'app/static'
+BUNDLE_PREFIX = 'uniwest'
+
+_COMMENTS = re.compile(r'/\*.*?\*/', re.S)
+_WHITESPACE = re.compile(r'\s+')
+_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+_COLON = re.compile(r':\s+')
+
+def minify_css(css: str) -> str:
+    """Удаляет комментарии, лишние пробелы и последнюю точку с запятой в блоках"""
+    css = _COMMENTS.sub('', css)
+    css = _WHITESPACE.sub(' ', css)
+    css = _PUNCTUATION.sub(r'\1', css)
+    css = _COLON.sub(':', css)
+    return css.replace(';}', '}').strip()
+
+class StyleBundle(NamedTuple):
+    """Минифицированные стили, их отпечаток и размер прежней встраиваемой версии"""
+    css: str
+    fingerprint: str
+    inline_bytes: int
+
+    @property
+    def filename(self) -> str:
+        return f"{BUNDLE_PREFIX}.{self.fingerprint}.min.css"
+
+    @property
+    def href(self) -> str:
+        return f"{STATIC_URL}/{self.filename}"
+
+def build_style_bundle(sources: Sequence[str] = STYLE_SOURCES, source_dir: Path = SOURCE_DIR) -> StyleBundle:
+    """Склеивает и минифицирует исходные таблицы стилей"""
+    source = '\n'.join((Path(source_dir) / name).read_text(encoding='utf-8') for name in sources)
+    css = minify_css(source)
+    inline_bytes = len(f"<style>{source}</style>".encode('utf-8'))
+    return StyleBundle(css, hashlib.sha256(css.encode('utf-8')).hexdigest()[:12], inline_bytes)
+
+def publish_style_bundle(bundle: StyleBundle, static_dir: Path = STATIC_DIR) -> bool:
+    """
+    Записывает стили в каталог статики под именем с отпечатком и удаляет
+    прежние версии. Имя меняется вместе с содержимым, поэтому браузер может
+    кэшировать файл без проверки актуальности.
+    """
+    static_dir = Path(static_dir)
+    target = static_dir / bundle.filename
+    try:
+        static_dir.mkdir(parents=True, exist_ok=True)
+        if not target.exists():
+            tmp_path = static_dir / f"{bundle.filename}.{os.getpid()}.tmp"
+            tmp_path.write_text(bundle.css, encoding='utf-8')
+            os.replace(tmp_path, target)
+        for stale in static_dir.glob(f"{BUNDLE_PREFIX}.*.min.css"):
+            if stale != target:
+                stale.unlink(missing_ok=True)
+    except OSError as e:
+        logger.warning(f"Не удалось записать стили в {static_dir}: {e}")
+        return False
+    return True
+
+@lru_cache(maxsize=1)
+def get_style_bundle() -> StyleBundle:
+    """Стили, собранные один раз на процесс"""
+    return build_style_bundle()
+
+@lru_cache(maxsize=1)
+def style_tag() -> str:
+    """
+    Тег подключения стилей: ссылка на файл в статике, если она раздается
+    (server.enableStaticServing), иначе минифицированные стили целиком.
+    """
+    bundle = get_style_bundle()
+    if st.get_option('server.enableStaticServing') and publish_style_bundle(bundle):
+        return f'<style>@import url("{bundle.href}");</style>'
+    logger.info("Раздача статики выключена, стили встраиваются в страницу")
+    return f"<style>{bundle.css}</style>"
+
+def inject_styles() -> int:
+    """
+    Подключает стили приложения и возвращает, сколько байт за прогон
+    сэкономлено по сравнению со встраиванием исходного CSS.
+
+    Streamlit удаляет со страницы элементы, не выведенные при очередном
+    прогоне, поэтому тег выводится каждый раз, но это короткая ссылка на
+    файл из кэша браузера. Тег определяется при первом прогоне сессии и
+    хранится в session_state.
+    """
+    if 'style_tag' not in st.session_state:
+        tag = style_tag()
+        tag_bytes = len(tag.encode('utf-8'))
+        inline_bytes = get_style_bundle().inline_bytes
+        st.session_state.style_tag = tag
+        st.session_state.style_bytes_saved = inline_bytes - tag_bytes
+        logger.info(f"Стили: {tag_bytes} байт за прогон вместо {inline_bytes} "
+                    f"(экономия {inline_bytes - tag_bytes})")
+    st.markdown(st.session_state.style_tag, unsafe_allow_html=True)
+    return st.session_state.style_bytes_saved
@@ -0,0 +1,125 @@
+# test_api.py - HTTP API через интерфейс ASGI: статусы, HEAD, ETag и сжатие
+
+import asyncio
+import gzip
+import json
+
+import pytest
+
+from api import AnalyticsAPI
+from database import CLIENTS, ENTITLEMENTS, get_database
+
+PREMIUM_CLIENT = 'Иван Петров'
+BASIC_CLIENT = 'Алексей Козлов'
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """Приложение над новой базой с демо-данными во временном каталоге"""
+    monkeypatch.chdir(tmp_path)
+    CLIENTS.invalidate()
+    ENTITLEMENTS.invalidate()
+    app = AnalyticsAPI(workers=2)
+    yield app
+    get_database().close()
+    CLIENTS.invalidate()
+    ENTITLEMENTS.invalidate()
+
+def request(app: AnalyticsAPI, path: str, query: str = '', method: str = 'GET', headers=None):
+    """Один запрос через ASGI: (статус, заголовки, тело)"""
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'query_string': query.encode('latin-1'),
+        'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in (headers or {}).items()]
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    start, body = messages
+    response_headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in start['headers']}
+    return start['status'], response_headers, body['body']
+
+def test_unknown_client_and_route(api):
+    assert request(api, '/clients/Нет Такого')[0] == 404
+    assert request(api, '/unknown')[0] == 404
+    assert request(api, f'/clients/{PREMIUM_CLIENT}/analysis/no_such_section')[0] == 404
+
+def test_tier_locked_section(api):
+    status, _, body = request(api, f'/clients/{BASIC_CLIENT}/analysis/risk_metrics')
+    assert status == 403
+    assert 'error' in json.loads(body)
+
+    status, _, body = request(api, f'/clients/{BASIC_CLIENT}/analysis')
+    assert status == 200
+    assert 'risk_metrics' in json.loads(body)['locked']
+
+def test_bad_monthly_contribution(api):
+    path = f'/clients/{PREMIUM_CLIENT}/analysis/goal_planning'
+    assert request(api, path, 'monthly_contribution=abc')[0] == 400
+    assert request(api, path, 'monthly_contribution=-5')[0] == 400
+
+def test_other_methods_not_allowed(api):
+    status, headers, _ = request(api, '/health', method='POST')
+    assert status == 405
+    assert headers['allow'] == 'GET, HEAD'
+
+def test_head_has_headers_without_body(api):
+    path = f'/clients/{PREMIUM_CLIENT}/portfolio'
+    get_status, get_headers, get_body = request(api, path)
+    head_status, head_headers, head_body = request(api, path, method='HEAD')
+
+    assert get_status == head_status == 200
+    assert head_body == b''
+    assert head_headers['etag'] == get_headers['etag']
+    assert head_headers['content-length'] == str(len(get_body))
+
+def test_gzip_and_not_modified(api):
+    path = f'/clients/{PREMIUM_CLIENT}/history'
+    status, headers, body = request(api, path, headers={'accept-encoding': 'gzip'})
+    assert status == 200
+    assert headers['content-encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(body))
+
+    status, not_modified_headers, body = request(api, path, headers={'if-none-match': headers['etag']})
+    assert status == 304
+    assert body == b''
+    assert not_modified_headers['etag'] == headers['etag']
+
+def test_small_response_is_not_compressed(api):
+    _, headers, body = request(api, '/health', headers={'accept-encoding': 'gzip'})
+    assert 'content-encoding' not in headers
+    assert json.loads(body) == {'status': 'ok'}
+
+def test_etag_changes_with_portfolio(api):
+    path = f'/clients/{PREMIUM_CLIENT}/portfolio'
+    _, headers, _ = request(api, path)
+    etag = headers['etag']
+
+    with get_database()._get_connection() as conn:
+        conn.execute("""
+            UPDATE portfolios SET last_modified = '2030-01-01 00:00:00'
+            WHERE id = (SELECT portfolio_id FROM clients WHERE name = ?)
+        """, (PREMIUM_CLIENT,))
+        conn.commit()
+
+    status, headers, body = request(api, path, headers={'if-none-match': etag})
+    assert status == 200
+    assert headers['etag'] != etag
+    assert json.loads(body)['last_modified'] == '2030-01-01 00:00:00'
+
+def test_etag_changes_with_goal(api):
+    path = f'/clients/{PREMIUM_CLIENT}/analysis/goal_planning'
+    _, headers, _ = request(api, path)
+    etag = headers['etag']
+
+    with get_database()._get_connection() as conn:
+        conn.execute("UPDATE clients SET target_amount = target_amount * 2 WHERE name = ?", (PREMIUM_CLIENT,))
+        conn.commit()
+
+    status, headers, _ = request(api, path, headers={'if-none-match': etag})
+    assert status == 200
+    assert headers['etag'] != etag
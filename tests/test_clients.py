@@ -0,0 +1,28 @@
+# test_clients.py - кэш профилей клиентов и сброс во время загрузки
+
+from clients import ClientRepository
+
+def test_invalidate_during_load_is_not_overwritten():
+    """Профиль, загруженный до invalidate, не должен вернуться в кэш после сброса"""
+    versions = iter(['старый', 'новый'])
+    repository = None
+
+    def loader(client_name):
+        profile = next(versions)
+        if profile == 'старый':
+            repository.invalidate(client_name)
+        return profile
+
+    repository = ClientRepository(loader, lambda: [])
+    assert repository.get('клиент') == 'старый'
+    assert repository.get('клиент') == 'новый'
+    assert repository.get('клиент') == 'новый'
+
+def test_names_reloaded_after_invalidate():
+    loads = []
+    repository = ClientRepository(lambda name: None, lambda: loads.append(1) or ['a', 'b'])
+    assert repository.names() == ['a', 'b']
+    assert repository.names() == ['a', 'b']
+    repository.invalidate()
+    assert repository.names() == ['a', 'b']
+    assert len(loads) == 2
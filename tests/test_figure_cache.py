@@ -0,0 +1,36 @@
+# test_figure_cache.py - кэш сериализованных графиков: попадание без построения и кодирования
+
+import plotly.graph_objects as go
+import plotly.io as pio
+
+import figure_cache
+from figure_cache import DEFAULT_FIGURE_HEIGHT, FigureCache
+
+def test_hit_skips_build_and_serialization(monkeypatch):
+    cache = FigureCache()
+    builds = []
+    encodes = []
+    to_html = pio.to_html
+
+    def build():
+        builds.append(1)
+        return go.Figure(go.Scatter(x=[1, 2, 3], y=[3, 1, 2]))
+
+    def counting_to_html(*args, **kwargs):
+        encodes.append(1)
+        return to_html(*args, **kwargs)
+
+    monkeypatch.setattr(figure_cache.pio, 'to_html', counting_to_html)
+    key = cache.key('line', 'desktop', 'data')
+    first = cache.get_or_build(key, build)
+    second = cache.get_or_build(key, build)
+
+    assert second is first
+    assert len(builds) == 1
+    assert len(encodes) == 1
+    assert 'Plotly.newPlot' in first.html
+    assert first.height == DEFAULT_FIGURE_HEIGHT
+
+def test_explicit_height_is_kept():
+    figure = go.Figure(layout={'height': 320})
+    assert FigureCache.serialize(figure).height == 320
@@ -0,0 +1,62 @@
+# test_goal_planning.py - Монте-Карло прогноз цели: остановка по точности, воспроизводимость, срок
+
+import math
+
+import numpy as np
+import pytest
+
+from goal_planning import MonteCarloGoalEngine, wilson_interval
+
+def test_wilson_interval_bounds():
+    assert wilson_interval(0, 0) == (0.0, 1.0)
+    low, high = wilson_interval(0, 100)
+    assert low == 0.0 and 0.0 < high < 0.05
+    low, high = wilson_interval(50, 100)
+    assert low < 0.5 < high
+    assert 0.5 - low == pytest.approx(high - 0.5)
+
+def test_stops_when_interval_is_narrow_enough():
+    engine = MonteCarloGoalEngine(n_paths=200000, batch_size=1000, tolerance=0.02)
+    result = engine.project(1000, 1500, 5, 0.08, 0.2, seed=1)
+
+    low, high = result['probability_interval']
+    assert (high - low) / 2 <= 0.02
+    assert result['n_paths'] < 200000
+    assert result['n_paths'] % 1000 == 0
+    assert low <= result['probability'] <= high
+
+def test_runs_all_paths_without_tolerance():
+    engine = MonteCarloGoalEngine(n_paths=5000, batch_size=1000, tolerance=0.0)
+    assert engine.project(1000, 1500, 5, 0.08, 0.2, seed=1)['n_paths'] == 5000
+
+def test_same_seed_same_result():
+    engine = MonteCarloGoalEngine(n_paths=20000, batch_size=5000, tolerance=0.0, fan_paths=5000)
+    first = engine.project(1000, 1500, 5, 0.08, 0.2, monthly_contribution=10, seed=42)
+    second = engine.project(1000, 1500, 5, 0.08, 0.2, monthly_contribution=10, seed=42)
+    other = engine.project(1000, 1500, 5, 0.08, 0.2, monthly_contribution=10, seed=43)
+
+    assert first['probability'] == second['probability']
+    assert first['median_time_to_goal_months'] == second['median_time_to_goal_months']
+    for p, band in first['percentiles'].items():
+        np.testing.assert_array_equal(band, second['percentiles'][p])
+    assert other['probability'] != first['probability']
+
+def test_zero_volatility_is_deterministic():
+    """Без волатильности стоимость 1000 * 1.12^(t/12) достигает 2000 в известный месяц"""
+    engine = MonteCarloGoalEngine(n_paths=2000, batch_size=1000)
+    result = engine.project(1000, 2000, 10, 0.12, 0.0, seed=3)
+
+    assert result['probability'] == 1.0
+    assert result['median_time_to_goal_months'] == math.ceil(12 * math.log(2) / math.log1p(0.12))
+    np.testing.assert_allclose(result['percentiles'][5], result['percentiles'][95])
+
+def test_median_time_is_none_when_most_paths_miss():
+    engine = MonteCarloGoalEngine(n_paths=20000, batch_size=5000, tolerance=0.0)
+    result = engine.project(1000, 3000, 5, 0.05, 0.25, seed=5)
+
+    assert 0.0 < result['reached_ever_probability'] < 0.5
+    assert result['median_time_to_goal_months'] is None
+
+    reachable = engine.project(1000, 1100, 5, 0.05, 0.25, seed=5)
+    assert reachable['reached_ever_probability'] > 0.5
+    assert reachable['median_time_to_goal_months'] is not None
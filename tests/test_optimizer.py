@@ -0,0 +1,97 @@
+# test_optimizer.py - эффективная граница: точные решения и допустимость весов
+
+import numpy as np
+import pytest
+
+from optimizer import (EfficientFrontierOptimizer, PortfolioConstraints, get_efficient_frontier,
+                       project_to_bounds)
+from risk_engine import RiskEngine
+
+TICKERS = ['A', 'B', 'C', 'D', 'E']
+ASSET_CLASSES = {'A': 'equity', 'B': 'equity', 'C': 'equity', 'D': 'bonds', 'E': 'bonds'}
+
+def random_problem(seed: int, n_assets: int = 5):
+    rng = np.random.default_rng(seed)
+    factors = rng.normal(size=(n_assets, n_assets))
+    covariance = factors @ factors.T / n_assets * 0.04 + np.diag(rng.uniform(0.01, 0.05, n_assets))
+    mean_returns = rng.uniform(0.02, 0.15, n_assets)
+    return mean_returns, covariance
+
+def test_min_variance_matches_closed_form():
+    """Без неравенств минимальная дисперсия - Σ⁻¹1 / 1'Σ⁻¹1"""
+    mean_returns, covariance = random_problem(0)
+    constraints = PortfolioConstraints(long_only=False, max_weight=10.0, asset_classes={})
+    optimizer = EfficientFrontierOptimizer(mean_returns, covariance, TICKERS, constraints)
+
+    inverse_ones = np.linalg.solve(covariance, np.ones(len(TICKERS)))
+    expected = inverse_ones / inverse_ones.sum()
+    weights = np.array(list(optimizer.frontier(n_points=10)['min_variance']['weights'].values()))
+
+    np.testing.assert_allclose(weights, expected, atol=1e-7)
+
+def test_frontier_with_target_return_matches_closed_form():
+    """Точка границы, где границы весов не активны, - решение системы ККТ с двумя равенствами"""
+    mean_returns, covariance = random_problem(1)
+    constraints = PortfolioConstraints(long_only=False, max_weight=10.0, asset_classes={})
+    frontier = EfficientFrontierOptimizer(mean_returns, covariance, TICKERS, constraints).frontier(n_points=7)
+
+    n = len(TICKERS)
+    rows = np.vstack([np.ones(n), mean_returns])
+    kkt = np.block([[covariance, rows.T], [rows, np.zeros((2, 2))]])
+    checked = 0
+    for target, weights in zip(frontier['target_returns'], frontier['weights']):
+        expected = np.linalg.solve(kkt, np.concatenate([np.zeros(n), [1.0, target]]))[:n]
+        if np.abs(expected).max() < constraints.max_weight - 1e-3:
+            np.testing.assert_allclose(weights, expected, atol=1e-6)
+            checked += 1
+    assert checked >= 2
+
+@pytest.mark.parametrize('seed', range(5))
+def test_frontier_weights_respect_constraints(seed):
+    mean_returns, covariance = random_problem(seed)
+    class_bounds = {'equity': (0.3, 0.7), 'bonds': (0.3, 0.7)}
+    constraints = PortfolioConstraints(long_only=True, max_weight=0.3, class_bounds=class_bounds,
+                                       asset_classes=ASSET_CLASSES)
+    frontier = EfficientFrontierOptimizer(mean_returns, covariance, TICKERS, constraints).frontier(n_points=15)
+
+    points = [*frontier['weights'],
+              np.array(list(frontier['min_variance']['weights'].values())),
+              np.array(list(frontier['tangency']['weights'].values()))]
+    for weights in points:
+        assert weights.sum() == pytest.approx(1.0, abs=1e-12)
+        assert weights.min() >= 0.0
+        assert weights.max() <= 0.3 + 1e-12
+        for asset_class, (low, high) in class_bounds.items():
+            share = sum(w for t, w in zip(TICKERS, weights) if ASSET_CLASSES[t] == asset_class)
+            assert low - 1e-6 <= share <= high + 1e-6
+
+def test_infeasible_max_weight_is_rejected():
+    mean_returns, covariance = random_problem(2)
+    with pytest.raises(ValueError):
+        EfficientFrontierOptimizer(mean_returns, covariance, TICKERS,
+                                   PortfolioConstraints(max_weight=0.15, asset_classes={}))
+
+def test_projection_keeps_upper_bound():
+    """Обрезка с делением на сумму подняла бы 0.3 до 0.3 / 0.9 > max_weight"""
+    weights = np.array([0.31, 0.3, 0.15, 0.14, 0.0])
+    projected = project_to_bounds(weights, np.zeros(5), np.full(5, 0.3))
+
+    assert projected.sum() == pytest.approx(1.0, abs=1e-12)
+    assert projected.max() <= 0.3 + 1e-12
+    assert projected.min() >= 0.0
+    np.testing.assert_allclose(projected[:2], 0.3)
+
+def test_cached_frontier_cannot_be_mutated():
+    rng = np.random.default_rng(3)
+    engine = RiskEngine(rng.normal(0.001, 0.02, size=(500, 3)), TICKERS[:3], periods_per_year=252)
+    constraints = PortfolioConstraints(max_weight=0.6, asset_classes={})
+
+    first = get_efficient_frontier(engine, constraints=constraints, n_points=5)
+    first['tangency']['weights']['A'] = 1.0
+    first['tickers'].append('X')
+    with pytest.raises(ValueError):
+        first['weights'][0, 0] = 1.0
+
+    second = get_efficient_frontier(engine, constraints=constraints, n_points=5)
+    assert second['tickers'] == TICKERS[:3]
+    assert second['tangency']['weights']['A'] != 1.0
@@ -0,0 +1,40 @@
+# test_result_cache.py - однократное вычисление ключа и блокировки по ключу
+
+import threading
+import time
+
+import pytest
+
+from result_cache import ResultCache
+
+def test_concurrent_requests_compute_once():
+    cache = ResultCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return 42
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('key', compute)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [42] * 8
+    assert len(calls) == 1
+    assert cache._key_locks == {}
+
+def test_failed_compute_releases_key_lock():
+    cache = ResultCache()
+
+    def compute():
+        raise RuntimeError("ошибка расчета")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute('key', compute)
+    assert cache._key_locks == {}
+    assert cache.get_or_compute('key', lambda: 1) == 1
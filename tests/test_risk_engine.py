@@ -0,0 +1,33 @@
+# test_risk_engine.py - кэш риск-движков и поколения хранилища цен
+
+import numpy as np
+import pandas as pd
+
+from price_store import DEFAULT_STORE_DIR, write_price_store
+from risk_engine import get_risk_engine
+
+TICKERS = ('AAA', 'BBB')
+
+def price_frame(seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.0005, 0.01, size=(300, len(TICKERS)))
+    dates = pd.bdate_range('2023-01-02', periods=len(returns))
+    return pd.DataFrame(100 * np.cumprod(1 + returns, axis=0), index=dates, columns=list(TICKERS))
+
+def test_engine_follows_price_store_generation(tmp_path, monkeypatch):
+    # Хранилище по умолчанию задается относительным путем
+    monkeypatch.chdir(tmp_path)
+
+    synthetic = get_risk_engine(TICKERS)
+
+    write_price_store(price_frame(1), DEFAULT_STORE_DIR)
+    first = get_risk_engine(TICKERS)
+    assert first is not synthetic
+    assert get_risk_engine(TICKERS) is first
+
+    write_price_store(price_frame(2), DEFAULT_STORE_DIR)
+    second = get_risk_engine(TICKERS)
+    assert second is not first
+    assert second.version != first.version
+    expected = price_frame(2).pct_change().iloc[1:].to_numpy()
+    np.testing.assert_allclose(second.covariance, np.cov(expected, rowvar=False))
@@ -0,0 +1,54 @@
+# test_rolling_stats.py - инкрементальные статистики против pandas rolling/expanding
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from rolling_stats import RESYNC_EVERY, RollingStatsPipeline
+
+def random_history(seed: int, periods: int, n_portfolios: int = 3):
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.005, 0.04, size=(periods, n_portfolios))
+    values = 1000 * np.cumprod(1 + returns, axis=0)
+    return values, returns
+
+def expected_stats(values: np.ndarray, returns: np.ndarray, ma_windows, volatility_window: int,
+                   periods_per_year: int = 12):
+    """Те же статистики, посчитанные pandas по всей истории"""
+    values, returns = pd.DataFrame(values), pd.DataFrame(returns)
+    peak = values.expanding().max()
+    drawdown = values / peak - 1.0
+    stats = {f'MA_{w}': values.rolling(w, min_periods=1).mean() for w in ma_windows}
+    stats.update({
+        'Peak': peak,
+        'Drawdown': drawdown * 100,
+        'Max_Drawdown': drawdown.expanding().min() * 100,
+        'Rolling_Volatility': returns.rolling(volatility_window, min_periods=1).std()
+                              * np.sqrt(periods_per_year) * 100
+    })
+    return {name: frame.to_numpy() for name, frame in stats.items()}
+
+@pytest.mark.parametrize('ma_windows, volatility_window, periods', [
+    ((6, 12), 12, RESYNC_EVERY + 500),   # проходит через пересинхронизацию сумм окон
+    ((6, 12, 50), 80, 30),               # окна длиннее истории
+])
+def test_update_matches_pandas(ma_windows, volatility_window, periods):
+    values, returns = random_history(periods, periods)
+    pipeline = RollingStatsPipeline(values.shape[1], ma_windows, volatility_window)
+    expected = expected_stats(values, returns, ma_windows, volatility_window)
+
+    for t in range(periods):
+        snapshot = pipeline.update(values[t], returns[t])
+        for name, series in expected.items():
+            np.testing.assert_allclose(snapshot[name], series[t], rtol=1e-9, atol=1e-9,
+                                       err_msg=f'{name}, период {t}')
+
+def test_seed_history_matches_update():
+    values, returns = random_history(7, RESYNC_EVERY + 37)
+    stepped = RollingStatsPipeline(values.shape[1])
+    for t in range(len(values)):
+        stepped.update(values[t], returns[t])
+    seeded = RollingStatsPipeline.from_history(values, returns)
+
+    for name, value in stepped.snapshot().items():
+        np.testing.assert_allclose(seeded.snapshot()[name], value, rtol=1e-9, err_msg=name)
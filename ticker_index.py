@@ -0,0 +1,161 @@
+# ticker_index.py - неизменяемый индекс атрибутов тикеров в памяти
+
+import hashlib
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Mapping, Sequence, Tuple
+
+import numpy as np
+
+# Категориальные атрибуты тикера (столбцы таблицы tickers)
+ATTRIBUTES = ('asset_class', 'sector', 'risk_bucket', 'region', 'currency')
+
+# Признаки классификации - биты поля flags
+FLAGS = {
+    'aggressive': 1 << 0,     # агрессивные активы при определении типа портфеля
+    'conservative': 1 << 1,   # консервативные активы при определении типа портфеля
+    'defensive': 1 << 2,      # защитные активы (все, кроме акций роста и рынка в целом)
+    'protective': 1 << 3,     # защитные активы в оценке профиля риска
+    'tech': 1 << 4            # высококоррелированные технологические акции
+}
+
+# Вес риска по группе риска (упрощенная оценка риска портфеля)
+RISK_BUCKET_WEIGHTS = {'high_risk': 0.8, 'medium_risk': 0.5, 'low_risk': 0.2}
+
+# Названия классов активов для отчетов
+ASSET_CLASS_LABELS = {
+    'equity': 'Акции', 'bond': 'Облигации', 'cash': 'Денежные средства', 'commodity': 'Сырьевые товары',
+    'crypto': 'Криптовалюты', 'real_estate': 'Недвижимость', 'unknown': 'Прочее'
+}
+
+# Атрибуты тикера, которого нет в таблице
+UNKNOWN_TICKER = {
+    'asset_class': 'unknown', 'sector': 'Прочее', 'risk_bucket': 'low_risk',
+    'region': 'unknown', 'currency': 'USD'
+}
+
+TickerRow = Tuple[str, str, str, str, str, str, int]
+
+def tag_flags(tags: Iterable[str]) -> int:
+    """Битовая маска из названий признаков FLAGS"""
+    flags = 0
+    for tag in tags:
+        flags |= FLAGS[tag]
+    return flags
+
+def _frozen(array: np.ndarray) -> np.ndarray:
+    array.setflags(write=False)
+    return array
+
+class TickerIndex:
+    """
+    Атрибуты тикеров в виде массивов NumPy.
+
+    Тикер получает целочисленный id (позиция в таблице), каждый категориальный
+    атрибут хранится как массив кодов и кортеж категорий, признаки - битовые
+    маски. Классификация портфеля из k активов - это выборка k элементов по
+    id без проверок вхождения в списки.
+
+    У всех массивов есть дополнительный последний элемент с атрибутами
+    UNKNOWN_TICKER, поэтому id -1 (тикер не найден) выбирает значения по
+    умолчанию. Индекс не изменяется: после правки таблицы tickers строится
+    новый.
+    """
+
+    def __init__(self, rows: Sequence[TickerRow]):
+        self.tickers: Tuple[str, ...] = tuple(row[0] for row in rows)
+        # Версия содержимого: результаты, посчитанные по индексу, кэшируются с ней
+        self.version = hashlib.sha256(repr([tuple(row) for row in rows]).encode('utf-8')).hexdigest()[:16]
+        self.ids: Mapping[str, int] = MappingProxyType({ticker: i for i, ticker in enumerate(self.tickers)})
+
+        self.categories: Dict[str, Tuple[str, ...]] = {}
+        self.codes: Dict[str, np.ndarray] = {}
+        for position, attribute in enumerate(ATTRIBUTES, start=1):
+            values = [row[position] for row in rows] + [UNKNOWN_TICKER[attribute]]
+            categories, codes = np.unique(np.array(values, dtype=object), return_inverse=True)
+            self.categories[attribute] = tuple(categories)
+            self.codes[attribute] = _frozen(codes.astype(np.int32))
+        self.categories = MappingProxyType(self.categories)
+        self.codes = MappingProxyType(self.codes)
+
+        self.flags = _frozen(np.array([row[6] for row in rows] + [0], dtype=np.uint32))
+        risk_buckets = self.categories['risk_bucket']
+        self.risk_weights = _frozen(np.array(
+            [RISK_BUCKET_WEIGHTS.get(bucket, RISK_BUCKET_WEIGHTS['low_risk']) for bucket in risk_buckets]
+        )[self.codes['risk_bucket']])
+
+    def __len__(self) -> int:
+        return len(self.tickers)
+
+    def __contains__(self, ticker: object) -> bool:
+        return ticker in self.ids
+
+    def lookup(self, tickers: Iterable[str]) -> np.ndarray:
+        """id тикеров (-1 для отсутствующих в таблице)"""
+        ids = self.ids
+        return np.fromiter((ids.get(ticker, -1) for ticker in tickers), dtype=np.intp)
+
+    def values(self, attribute: str, ids: np.ndarray) -> np.ndarray:
+        """Значения категориального атрибута для массива id"""
+        return np.asarray(self.categories[attribute], dtype=object)[self.codes[attribute][ids]]
+
+    def attribute(self, ticker: str, attribute: str) -> str:
+        return self.categories[attribute][self.codes[attribute][self.ids.get(ticker, -1)]]
+
+    def mask(self, ids: np.ndarray, *tags: str) -> np.ndarray:
+        """Маска id, у которых есть хотя бы один из признаков tags"""
+        return (self.flags[ids] & tag_flags(tags)) != 0
+
+    def category_mask(self, ids: np.ndarray, attribute: str, *values: str) -> np.ndarray:
+        """Маска id, у которых атрибут принимает одно из значений values"""
+        categories = self.categories[attribute]
+        wanted = [categories.index(value) for value in values if value in categories]
+        return np.isin(self.codes[attribute][ids], wanted)
+
+    def has(self, ticker: str, tag: str) -> bool:
+        return bool(self.flags[self.ids.get(ticker, -1)] & FLAGS[tag])
+
+    def risk_weight(self, ticker: str) -> float:
+        return float(self.risk_weights[self.ids.get(ticker, -1)])
+
+    def tagged_weight(self, portfolio_dict: Dict[str, float], *tags: str) -> float:
+        """Суммарный вес активов портфеля с любым из признаков tags (выборка по k активам)"""
+        if not portfolio_dict:
+            return 0.0
+        ids = self.lookup(portfolio_dict)
+        weights = np.fromiter(portfolio_dict.values(), dtype=float, count=len(portfolio_dict))
+        return float(weights @ self.mask(ids, *tags))
+
+    def exposures(self, attribute: str, rows: np.ndarray, ids: np.ndarray, weights: np.ndarray,
+                  n_rows: int) -> np.ndarray:
+        """
+        Доли категорий атрибута (n_rows x категории) по разреженным позициям.
+
+        Позиции заданы тройками (строка, id тикера, вес) - матрица весов в
+        формате COO. Матрица тикеры x категории однозначная (у тикера одна
+        категория), поэтому ее произведение на веса - один bincount по парам
+        (строка, код категории) за O(числа позиций).
+        """
+        n_categories = len(self.categories[attribute])
+        codes = self.codes[attribute][np.asarray(ids, dtype=np.intp)]
+        flat = np.asarray(rows, dtype=np.intp) * n_categories + codes
+        totals = np.bincount(flat, weights=np.asarray(weights, dtype=float), minlength=n_rows * n_categories)
+        return totals.reshape(n_rows, n_categories)
+
+    def portfolio_exposures(self, portfolio_dict: Dict[str, float], attribute: str) -> Dict[str, float]:
+        """Ненулевые доли категорий атрибута в портфеле по убыванию"""
+        if not portfolio_dict:
+            return {}
+        weights = np.fromiter(portfolio_dict.values(), dtype=float, count=len(portfolio_dict))
+        totals = self.exposures(attribute, np.zeros(len(weights), dtype=np.intp),
+                                self.lookup(portfolio_dict), weights, 1)[0]
+        order = np.argsort(-totals, kind='stable')
+        return {self.categories[attribute][i]: float(totals[i]) for i in order if totals[i] > 0}
+
+    def mapping(self, attribute: str) -> Dict[str, str]:
+        """Словарь {тикер: значение атрибута} по всем тикерам таблицы"""
+        values = self.values(attribute, np.arange(len(self.tickers)))
+        return dict(zip(self.tickers, values.tolist()))
+
+    def tickers_with(self, *tags: str) -> List[str]:
+        ids = np.arange(len(self.tickers))
+        return [self.tickers[i] for i in np.flatnonzero(self.mask(ids, *tags))]